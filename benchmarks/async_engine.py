@@ -0,0 +1,65 @@
+"""Compares the thread-based and asyncio block fetching against a local node
+
+python -m benchmarks.async_engine --latency 0.1 --blocks 5000
+"""
+
+import time
+from argparse import ArgumentParser
+
+from web3 import Web3
+
+from eth_tools.async_engine import AsyncEngine
+from eth_tools.block_iterator import BlockIterator
+from eth_tools.commands import create_web3
+from tests.fake_node import FakeNode
+
+
+def fetch_blocks(web3: Web3, blocks_count: int, batch_size: int, **kwargs) -> float:
+    block_iterator = BlockIterator(
+        web3, start_block=0, end_block=blocks_count - 1, batch_size=batch_size, **kwargs
+    )
+    start = time.perf_counter()
+    for _ in block_iterator:
+        pass
+    block_iterator.close()
+    return time.perf_counter() - start
+
+
+def run():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--blocks", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--async-concurrency", type=int, default=256)
+    args = parser.parse_args()
+
+    node = FakeNode(latency=args.latency).start()
+    web3 = create_web3(node.uri, max_concurrent_requests=args.async_concurrency)
+    try:
+        elapsed = fetch_blocks(
+            web3, args.blocks, args.batch_size, concurrency=args.threads
+        )
+        print(f"threads ({args.threads}): {args.blocks / elapsed:.0f} blocks/s")
+
+        node.max_in_flight = 0
+        with AsyncEngine(
+            node.uri, max_concurrent_requests=args.async_concurrency
+        ) as engine:
+            elapsed = fetch_blocks(
+                web3,
+                args.blocks,
+                args.batch_size,
+                concurrency=args.async_concurrency,
+                engine=engine,
+            )
+        print(
+            f"async ({args.async_concurrency}): {args.blocks / elapsed:.0f} blocks/s, "
+            f"{node.max_in_flight} requests in flight"
+        )
+    finally:
+        node.stop()
+
+
+if __name__ == "__main__":
+    run()
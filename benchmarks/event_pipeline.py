@@ -0,0 +1,85 @@
+"""Measures the throughput of decoding, serializing and compressing events
+in the fetching thread and with an increasing number of encoding processes
+
+python -m benchmarks.event_pipeline --events 200000 --processes 2 4 8
+"""
+
+import json
+import multiprocessing
+import tempfile
+import time
+from argparse import ArgumentParser
+from os import path
+from typing import List, Optional
+
+from eth_tools.event_decoder import EventEncoder, LogDecoder
+from eth_tools.event_fetcher import FetchTask, TaskWriter, format_log
+from tests.fake_node import (
+    ERC20_ABI_PATH,
+    TOKEN_ADDRESS,
+    TRANSFER_TOPIC,
+    encode_address,
+    make_log,
+)
+
+BATCH_SIZE = 1_000
+
+
+def make_logs(count: int) -> list:
+    return [
+        format_log(
+            make_log(
+                TOKEN_ADDRESS,
+                i // 10,
+                i % 10,
+                [TRANSFER_TOPIC, encode_address(i % 200), encode_address(i % 150)],
+                "0x" + format(i * 10**18, "064x"),
+            )
+        )
+        for i in range(count)
+    ]
+
+
+def write_events(
+    logs: list, abi: list, output_file: str, encoder: Optional[EventEncoder]
+) -> float:
+    """Writes ``logs`` as the fetchers would and returns the elapsed time"""
+    task = FetchTask(TOKEN_ADDRESS, abi, 0)
+    decoder = LogDecoder(abi)
+    start = time.perf_counter()
+    with TaskWriter(task, output_file, encoder=encoder) as writer:
+        for offset in range(0, len(logs), BATCH_SIZE):
+            batch = logs[offset : offset + BATCH_SIZE]
+            if encoder is None:
+                batch = [decoder.decode(log) for log in batch]
+            writer.write(batch, batch[-1]["blockNumber"])
+        writer.finish(logs[-1]["blockNumber"])
+    return time.perf_counter() - start
+
+
+def run():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[multiprocessing.cpu_count()]
+    )
+    args = parser.parse_args()
+
+    with open(ERC20_ABI_PATH) as f:
+        abi = json.load(f)
+    logs = make_logs(args.events)
+    with tempfile.TemporaryDirectory() as directory:
+        output_file = path.join(directory, "events.jsonl.gz")
+        elapsed = write_events(logs, abi, output_file, None)
+        print(f"fetching thread: {args.events / elapsed:.0f} events/s")
+        processes_counts: List[int] = args.processes
+        for processes in processes_counts:
+            with EventEncoder(processes) as encoder:
+                # starts the worker processes before measuring
+                encoder.submit([]).result()
+                elapsed = write_events(logs, abi, output_file, encoder)
+            print(f"{processes} processes: {args.events / elapsed:.0f} events/s")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,41 @@
+"""Compares the serialization of events using EthJSONEncoder and to_json
+
+python -m benchmarks.json_encoder --events 100000
+"""
+
+import json
+import time
+from argparse import ArgumentParser
+from itertools import cycle, islice
+
+from eth_tools.json_encoder import EthJSONEncoder, to_json
+from tests.json_encoder_test import EVENTS_PATH, to_web3_event
+
+
+def serialize(events: list, dumps) -> float:
+    start = time.perf_counter()
+    for event in events:
+        dumps(event)
+    return time.perf_counter() - start
+
+
+def run():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with open(EVENTS_PATH) as f:
+        events = [to_web3_event(json.loads(line)) for line in f]
+    events = list(islice(cycle(events), args.events))
+    assert all(
+        to_json(event) == json.dumps(event, cls=EthJSONEncoder) for event in events
+    )
+
+    elapsed = serialize(events, lambda event: json.dumps(event, cls=EthJSONEncoder))
+    print(f"EthJSONEncoder: {args.events / elapsed:.0f} events/s")
+    elapsed = serialize(events, to_json)
+    print(f"to_json: {args.events / elapsed:.0f} events/s")
+
+
+if __name__ == "__main__":
+    run()
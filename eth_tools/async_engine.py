@@ -0,0 +1,239 @@
+import asyncio
+import concurrent.futures
+import itertools
+import threading
+from functools import wraps
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    TypeVar,
+)
+
+from eth_tools.logger import logger
+from eth_tools.request_scheduler import (
+    DEFAULT_BACKOFF,
+    DEFAULT_MAX_RETRIES,
+    RETRY_STATUS_CODES,
+    RequestScheduler,
+    compute_retry_delay,
+)
+from eth_tools.rpc_cache import RPCCache
+from eth_tools.rpc_client import RPCCall, build_batch_payload, parse_batch_response
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+DEFAULT_ASYNC_CONCURRENCY = 256
+# interval at which requests waiting for a slot of a shared scheduler poll it
+SLOT_POLL_INTERVAL = 0.005
+
+T = TypeVar("T")
+
+
+def async_retry(tries: int = 3, delay: float = 1, backoff: float = 2):
+    """Same as ``retry.retry`` for coroutine functions"""
+
+    def decorator(f: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @wraps(f)
+        async def wrapper(*args, **kwargs) -> T:
+            remaining_tries, attempt_delay = tries, delay
+            while True:
+                try:
+                    return await f(*args, **kwargs)
+                except Exception as ex:  # pylint: disable=broad-except
+                    remaining_tries -= 1
+                    if remaining_tries <= 0:
+                        raise
+                    logger.warning("%s, retrying in %s seconds...", ex, attempt_delay)
+                    await asyncio.sleep(attempt_delay)
+                    attempt_delay *= backoff
+
+        return wrapper
+
+    return decorator
+
+
+class AsyncRPCClient:
+    """asyncio counterpart of ``RPCClient`` sending requests with aiohttp
+    Requests go through the limits of ``scheduler``, usually the one of the
+    provider, so that synchronous and asynchronous requests share the same
+    ``max_concurrent_requests`` slots, rate limit and 429 pauses.
+    Without a ``scheduler``, one is created from the given limits.
+    Failed requests are retried as done by ``RequestScheduler``.
+    Results are cached in ``rpc_cache`` when given, as done by ``RPCClient``.
+    """
+
+    def __init__(
+        self,
+        endpoint_uri: str,
+        scheduler: Optional[RequestScheduler] = None,
+        max_concurrent_requests: int = DEFAULT_ASYNC_CONCURRENCY,
+        requests_per_second: Optional[float] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        timeout: float = 60,
+        rpc_cache: Optional[RPCCache] = None,
+    ):
+        if aiohttp is None:
+            raise ImportError(
+                "aiohttp is required for the async engine, "
+                "install it with `pip install ethereum-tools[async]`"
+            )
+        if scheduler is None:
+            scheduler = RequestScheduler(
+                max_concurrent_requests=max_concurrent_requests,
+                requests_per_second=requests_per_second,
+                max_retries=max_retries,
+                backoff=backoff,
+            )
+        self.endpoint_uri = endpoint_uri
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.rpc_cache = rpc_cache
+        self._ids = itertools.count()
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def max_concurrent_requests(self) -> int:
+        return self.scheduler.max_concurrent_requests
+
+    def _ensure_session(self) -> "aiohttp.ClientSession":
+        # created lazily so that they are bound to the running event loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrent_requests)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _wait_turn(self, cost: int):
+        pause = self.scheduler.pause_time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        token_bucket = self.scheduler.token_bucket
+        if token_bucket is None:
+            return
+        wait_time = token_bucket.try_acquire(cost)
+        while wait_time > 0:
+            await asyncio.sleep(wait_time)
+            wait_time = token_bucket.try_acquire(cost)
+
+    async def _acquire_slot(self):
+        # slots are shared with threads, which release them outside the loop
+        while not self.scheduler.try_acquire_slot():
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+    async def _post(self, payload: Any, cost: int) -> Any:
+        session = self._ensure_session()
+        attempt = 0
+        while True:
+            await self._wait_turn(cost)
+            status, retry_after = None, None
+            try:
+                async with self._semaphore:  # type: ignore
+                    await self._acquire_slot()
+                    try:
+                        async with session.post(
+                            self.endpoint_uri, json=payload
+                        ) as response:
+                            status = response.status
+                            if status not in RETRY_STATUS_CODES:
+                                response.raise_for_status()
+                                return await response.json(content_type=None)
+                            retry_after = response.headers.get("Retry-After")
+                            error: Exception = aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=status
+                            )
+                    finally:
+                        self.scheduler.release_slot()
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as ex:
+                error = ex
+            if attempt >= self.scheduler.max_retries:
+                raise error
+            delay = compute_retry_delay(self.scheduler.backoff, attempt, retry_after)
+            if status == 429:
+                self.scheduler.pause(delay)
+            logger.warning("request failed (%s), retrying in %.2fs", error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def make_request(self, method: str, params: Any) -> Any:
+        return (await self.make_batch_request([(method, params)]))[0]
+
+    async def make_batch_request(
+        self, calls: List[RPCCall], raise_on_error: bool = True
+    ) -> List[Any]:
+        """Same as ``RPCClient.make_batch_request`` but asynchronous"""
+        if not calls:
+            return []
+        if self.rpc_cache is None:
+            return await self._make_batch_request(calls, raise_on_error)
+        results = self.rpc_cache.get_many(calls)
+        missing_indices = [i for i in range(len(calls)) if i not in results]
+        if missing_indices:
+            missing_calls = [calls[i] for i in missing_indices]
+            missing_results = await self._make_batch_request(
+                missing_calls, raise_on_error
+            )
+            self.rpc_cache.set_many(missing_calls, missing_results)
+            results.update(zip(missing_indices, missing_results))
+        return [results[i] for i in range(len(calls))]
+
+    async def _make_batch_request(
+        self, calls: List[RPCCall], raise_on_error: bool
+    ) -> List[Any]:
+        payload = build_batch_payload(calls, self._ids)
+        raw_responses = await self._post(payload, len(payload))
+        return parse_batch_response(payload, raw_responses, raise_on_error)
+
+
+class AsyncEngine:
+    """Runs an ``AsyncRPCClient`` on an event loop in a background thread
+    This allows synchronous code to use the async core: ``run`` waits for a
+    coroutine and ``submit`` schedules it without waiting.
+    """
+
+    def __init__(self, endpoint_uri: str, **client_kwargs):
+        self.client = AsyncRPCClient(endpoint_uri, **client_kwargs)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def max_concurrent_requests(self) -> int:
+        return self.client.max_concurrent_requests
+
+    def submit(self, coroutine: Awaitable[T]) -> "concurrent.futures.Future[T]":
+        """Schedules ``coroutine`` on the event loop without waiting for it"""
+        return asyncio.run_coroutine_threadsafe(
+            coroutine, self.loop  # type: ignore
+        )
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        return self.submit(coroutine).result()
+
+    def close(self):
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
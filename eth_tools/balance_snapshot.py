@@ -0,0 +1,182 @@
+import csv
+import itertools
+import json
+import os
+import pickle
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from eth_tools.logger import logger
+from eth_tools.parquet_writer import ParquetWriter, holder_balance_columns
+from eth_tools.transfer_event_parser import TRANSFER_ARGS_KEYS
+from eth_tools.utils import smart_open
+
+SNAPSHOT_FORMATS = ["csv", "parquet"]
+SNAPSHOT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet"}
+# mints are sent from and burns sent to the zero address, which is not a holder
+ZERO_ADDRESS = bytes(20)
+
+
+@dataclass
+class BalanceTable:
+    """Balances of all the holders of a token
+    Addresses are stored as 20 bytes and mapped to their position in
+    ``balances``, a list of Python ints which cannot overflow with uint256
+    amounts. ``last_block`` and ``events_count`` record up to which block
+    and line of the events file the balances have been computed.
+    The zero address is not tracked, so that mints and burns only change
+    the balance of the receiver or the sender.
+    """
+
+    indexes: Dict[bytes, int] = field(default_factory=dict)
+    balances: List[int] = field(default_factory=list)
+    last_block: int = -1
+    events_count: int = 0
+
+    def update(self, address: str, change: int):
+        key = bytes.fromhex(address[2:])
+        if key == ZERO_ADDRESS:
+            return
+        index = self.indexes.get(key)
+        if index is None:
+            self.indexes[key] = len(self.balances)
+            self.balances.append(change)
+        else:
+            self.balances[index] += change
+
+    def holders(self) -> Iterator[Tuple[bytes, int]]:
+        """Yields the ``(address, balance)`` of the holders with a non-zero balance"""
+        balances = self.balances
+        for address, index in self.indexes.items():
+            if balances[index]:
+                yield address, balances[index]
+
+    @classmethod
+    def load(cls, filepath: str) -> Optional["BalanceTable"]:
+        try:
+            with open(filepath, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, filepath: str):
+        tmp_filepath = filepath + ".tmp"
+        with open(tmp_filepath, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+
+
+class BalanceSnapshotter:
+    """Replays the 'transfer' events of a token and takes snapshots of the
+    balances of all the holders at the end of the requested blocks.
+    Events must be sorted by block. When a ``checkpoint`` file is given, the
+    balance table is loaded from it and saved back once all the events are
+    replayed, so that later snapshots only replay the events added to the file
+    since the checkpoint.
+    """
+
+    def __init__(self, checkpoint: Optional[str] = None):
+        self.checkpoint = checkpoint
+        self.table = None
+        if checkpoint is not None:
+            self.table = BalanceTable.load(checkpoint)
+            if self.table is not None:
+                logger.info(
+                    "loaded balances of %s holders up to block %s",
+                    len(self.table.balances),
+                    self.table.last_block,
+                )
+        if self.table is None:
+            self.table = BalanceTable()
+        self._keys: Optional[Tuple[str, str, str]] = None
+
+    def _get_keys(self, event: dict) -> Tuple[str, str, str]:
+        if self._keys is None:
+            args = event["args"]
+            keys = []
+            for name, candidates in TRANSFER_ARGS_KEYS.items():
+                key = next(iter(candidates & args.keys()), None)
+                if key is None:
+                    raise ValueError(f"no {name} argument found in {event}")
+                keys.append(key)
+            self._keys = tuple(keys)  # type: ignore
+        return self._keys  # type: ignore
+
+    def replay(
+        self, events: Iterable[dict], snapshot_blocks: Iterable[int]
+    ) -> Iterator[Tuple[int, Iterator[Tuple[bytes, int]]]]:
+        """Applies ``events`` to the balance table and yields, for each of the
+        ``snapshot_blocks``, the block and the balances of all the holders
+        at the end of this block. Snapshots must be consumed before the
+        next one is yielded.
+        When resuming from a checkpoint, ``events`` must start after the
+        ``table.events_count`` events already applied.
+        """
+        table = self.table
+        blocks = sorted(set(snapshot_blocks))
+        if blocks and blocks[0] <= table.last_block:
+            raise ValueError(
+                f"cannot take a snapshot at block {blocks[0]}: "
+                f"balances are already computed up to block {table.last_block}"
+            )
+        pending_blocks = iter(blocks)
+        next_block = next(pending_blocks, None)
+        for event in events:
+            block = event["blockNumber"]
+            while next_block is not None and block > next_block:
+                yield next_block, table.holders()
+                next_block = next(pending_blocks, None)
+            if block < table.last_block:
+                raise ValueError(f"events are not sorted by block at block {block}")
+            if event["event"] == "Transfer":
+                key_from, key_to, key_amount = self._get_keys(event)
+                args = event["args"]
+                table.update(args[key_from], -args[key_amount])
+                table.update(args[key_to], args[key_amount])
+            table.last_block = block
+            table.events_count += 1
+        while next_block is not None:
+            yield next_block, table.holders()
+            next_block = next(pending_blocks, None)
+        if self.checkpoint is not None:
+            table.save(self.checkpoint)
+
+
+def write_snapshot(
+    holders: Iterable[Tuple[bytes, int]], filepath: str, output_format: str = "csv"
+):
+    """Writes the ``(address, balance)`` of all the holders in CSV or Parquet"""
+    if output_format == "parquet":
+        with ParquetWriter(filepath, holder_balance_columns()) as writer:
+            for address, balance in holders:
+                writer.write({"address": address, "balance": balance})
+        return
+    with smart_open(filepath, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["address", "balance"])
+        writer.writerows(
+            ("0x" + address.hex(), balance) for address, balance in holders
+        )
+
+
+def take_snapshots(
+    lines: Iterable[str],
+    snapshot_blocks: Iterable[int],
+    output_prefix: str,
+    output_format: str = "csv",
+    checkpoint: Optional[str] = None,
+) -> List[str]:
+    """Writes the snapshot of each block to ``<output_prefix><block>.<ext>``
+    using the JSON ``lines`` of an events file and returns the written files
+    """
+    snapshotter = BalanceSnapshotter(checkpoint)
+    # events applied before the checkpoint are skipped without being parsed
+    lines = itertools.islice(lines, snapshotter.table.events_count, None)
+    events = (json.loads(line) for line in lines)
+    filepaths = []
+    for block, holders in snapshotter.replay(events, snapshot_blocks):
+        filepath = f"{output_prefix}{block}{SNAPSHOT_EXTENSIONS[output_format]}"
+        write_snapshot(holders, filepath, output_format)
+        logger.info("wrote snapshot of block %s to %s", block, filepath)
+        filepaths.append(filepath)
+    return filepaths
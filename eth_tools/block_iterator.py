@@ -1,8 +1,42 @@
-from typing import Collection, Iterable, List
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Collection, Deque, Iterator, List, Optional, Sequence
+
 from web3 import Web3
+from web3.exceptions import BlockNotFound
 from web3.types import BlockData
 
+from eth_tools.async_engine import AsyncEngine
 from eth_tools.logger import logger
+from eth_tools.rpc_client import RPCCall, RPCClient
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+
+# fields returned as hex-encoded quantities by ``eth_getBlockByNumber``
+BLOCK_QUANTITY_FIELDS = {
+    "baseFeePerGas",
+    "difficulty",
+    "gasLimit",
+    "gasUsed",
+    "number",
+    "size",
+    "timestamp",
+    "totalDifficulty",
+}
+
+
+def format_block(raw_block: dict) -> dict:
+    """Converts a raw ``eth_getBlockByNumber`` result to match the values
+    returned by ``web3.eth.getBlock``
+    """
+    block = dict(raw_block)
+    for field in BLOCK_QUANTITY_FIELDS & block.keys():
+        if block[field] is not None:
+            block[field] = int(block[field], 16)
+    if block.get("miner"):
+        block["miner"] = Web3.toChecksumAddress(block["miner"])
+    return block
 
 
 class Block:
@@ -31,6 +65,12 @@ class BlockIterator:
     """Iterator over Ethereum blocks
     It will lazily fetch each block from ``start_block`` to ``end_block`` inclusive
     using the provided ``web3`` instance.
+    When ``batch_size`` is greater than 1, blocks are fetched using JSON-RPC batch
+    requests of ``batch_size`` blocks. Up to ``concurrency`` requests are sent
+    in parallel, and at most ``2 * concurrency`` batches are fetched ahead of the
+    block being currently consumed. Blocks are always returned in order.
+    If an ``engine`` is given, batches are sent by its event loop, the threads
+    only waiting for their responses.
     """
 
     def __init__(
@@ -40,22 +80,32 @@ class BlockIterator:
         end_block: int = None,
         blocks: Collection[int] = None,
         log_interval: int = None,
+        batch_size: int = 1,
+        concurrency: int = 1,
+        engine: Optional[AsyncEngine] = None,
     ):
         self.web3 = web3
+        self.engine = engine
+        self._blocks: Sequence[int]
         if blocks is not None:
             assert (
                 start_block is None and end_block is None
             ), "blocks is not compatible with start and end block"
-            self._blocks = blocks
+            self._blocks = list(blocks)
         else:
             if start_block is None:
                 start_block = 0
             if end_block is None:
                 end_block = self.web3.eth.blockNumber
             self._blocks = range(start_block, end_block + 1)
+        self.start_block = start_block
+        self.end_block = end_block
 
         self.blocks_count = len(self._blocks)
-        self._blocks_iter = iter(self._blocks)
+        self.batch_size = max(batch_size, 1)
+        self.concurrency = max(concurrency, 1)
+        self._rpc_client: Optional[RPCClient] = None
+        self._iterator = self._iterate()
 
         self.log_interval = log_interval
         self._processed_count = 0
@@ -71,10 +121,72 @@ class BlockIterator:
     def processed_count(self):
         return self._processed_count
 
+    @property
+    def current_block(self) -> Optional[int]:
+        """Number of the next block to be returned, ``None`` when exhausted"""
+        if self._processed_count >= self.blocks_count:
+            return None
+        return self._blocks[self._processed_count]
+
     def __next__(self) -> Block:
-        block_number = next(self._blocks_iter)
+        block = next(self._iterator)
         self._processed_count += 1
         if self.log_interval and self.processed_count % self.log_interval == 0:
             logger.info("%s/%s", self.processed_count, self.blocks_count)
-        block = self.web3.eth.getBlock(block_number)
-        return Block(block)
+        return block
+
+    def close(self):
+        """Stops fetching blocks ahead and releases the worker threads"""
+        self._iterator.close()
+
+    def _fetch_batch(self, block_numbers: Sequence[int]) -> List[Block]:
+        if self.batch_size == 1 and self.engine is None:
+            return [Block(self.web3.eth.getBlock(n)) for n in block_numbers]
+        calls = self._make_calls(block_numbers)
+        if self.engine is not None:
+            raw_blocks = self.engine.run(self.engine.client.make_batch_request(calls))
+        else:
+            if self._rpc_client is None:
+                self._rpc_client = RPCClient(self.web3)
+            raw_blocks = self._rpc_client.make_batch_request(calls)
+        return self._make_blocks(block_numbers, raw_blocks)
+
+    @staticmethod
+    def _make_calls(block_numbers: Sequence[int]) -> List[RPCCall]:
+        return [("eth_getBlockByNumber", [hex(n), False]) for n in block_numbers]
+
+    @staticmethod
+    def _make_blocks(
+        block_numbers: Sequence[int], raw_blocks: List[dict]
+    ) -> List[Block]:
+        blocks = []
+        for block_number, raw_block in zip(block_numbers, raw_blocks):
+            if raw_block is None:
+                raise BlockNotFound(f"Block with id: {block_number} not found.")
+            blocks.append(Block(format_block(raw_block)))
+        return blocks
+
+    def _iterate(self) -> Iterator[Block]:
+        batches = (
+            self._blocks[i : i + self.batch_size]
+            for i in range(0, self.blocks_count, self.batch_size)
+        )
+        if self.concurrency == 1:
+            for batch in batches:
+                yield from self._fetch_batch(batch)
+            return
+
+        max_pending = 2 * self.concurrency
+        pending: Deque[Future] = deque()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            for batch in batches:
+                pending.append(executor.submit(self._fetch_batch, batch))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
@@ -2,11 +2,244 @@ import pickle
 import os
 from os import path
 import hashlib
+import sqlite3
+import threading
 import time
 import functools
-
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
 
 CACHE_PATH = path.join(os.environ["HOME"], ".cache", "eth-tools")
+CACHE_FILENAME = "cache.sqlite3"
+
+DEFAULT_MAX_CACHE_SIZE = 1 << 30
+DEFAULT_MAX_MEMORY_ENTRIES = 1_024
+
+# minimum time between two updates of the access time of an entry
+ACCESS_TIME_RESOLUTION = 60
+# number of writes between two evictions of expired entries
+SWEEP_INTERVAL = 100
+# number of least recently used entries read at a time when evicting
+EVICTION_BATCH_SIZE = 1_000
+
+
+class CacheStore:
+    """Cache stored in a single SQLite database, shared between threads
+    and processes. Entries expire after their ``ttl`` and, when the total size
+    of the values exceeds ``max_size`` bytes, the least recently used entries
+    are evicted. Expired entries are swept in bulk every ``SWEEP_INTERVAL``
+    writes rather than on every lookup.
+    The total size of the values is maintained by triggers in the ``meta``
+    table, so that writes only look for entries to evict when it is exceeded.
+    """
+
+    def __init__(self, filepath: str, max_size: int = DEFAULT_MAX_CACHE_SIZE):
+        self.filepath = filepath
+        self.max_size = max_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_count = 0
+        os.makedirs(path.dirname(filepath) or ".", 0o755, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed_at "
+                "ON entries (accessed_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO meta SELECT 'total_size', "
+                "COALESCE(SUM(size), 0) FROM entries"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+                "BEGIN UPDATE meta SET value = value + new.size "
+                "WHERE name = 'total_size'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+                "BEGIN UPDATE meta SET value = value - old.size "
+                "WHERE name = 'total_size'; END"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads or forked processes
+        pid, conn = getattr(self._local, "conn", (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.filepath, timeout=60)
+            # entries replaced by INSERT OR REPLACE fire the delete trigger
+            conn.execute("PRAGMA recursive_triggers = ON")
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def get(self, key: str) -> Tuple[Any, bool]:
+        """Returns two values, the second indicates if the value was cached
+        or not. If the second value is true, the first value is the
+        actual cached value
+        """
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        value, expires_at, accessed_at = row
+        if expires_at is not None and expires_at <= now:
+            return None, False
+        if now - accessed_at >= ACCESS_TIME_RESOLUTION:
+            with conn:
+                conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+        return pickle.loads(value), True
+
+    def set(self, key: str, value: Any, ttl: float = -1):
+        """Stores ``value`` for ``ttl`` seconds, or forever if ``ttl`` is negative"""
+        now = time.time()
+        data = pickle.dumps(value)
+        expires_at = now + ttl if ttl >= 0 else None
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), expires_at, now),
+            )
+        with self._lock:
+            self._writes_count += 1
+            should_sweep = self._writes_count % SWEEP_INTERVAL == 0
+        if should_sweep:
+            self.sweep()
+        elif self.total_size() > self.max_size:
+            self._evict()
+
+    def total_size(self) -> int:
+        """Returns the total size of the stored values"""
+        conn = self._connection()
+        (total_size,) = conn.execute(
+            "SELECT value FROM meta WHERE name = 'total_size'"
+        ).fetchone()
+        return total_size
+
+    def sweep(self):
+        """Deletes expired entries then, if the cache is too large,
+        the least recently used ones
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        self._evict()
+
+    def _evict(self):
+        """Deletes the least recently used entries until the total size
+        of the cache is at most ``max_size``
+        """
+        conn = self._connection()
+        excess = self.total_size() - self.max_size
+        while excess > 0:
+            rows = conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at, key LIMIT ?",
+                (EVICTION_BATCH_SIZE,),
+            ).fetchall()
+            if not rows:
+                return
+            keys = []
+            for key, size in rows:
+                keys.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            with conn:
+                conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+            excess = self.total_size() - self.max_size
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM entries")
+
+
+_stores: Dict[str, CacheStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(directory: str = CACHE_PATH) -> CacheStore:
+    """Returns the cache store of ``directory``, shared by all decorated functions"""
+    with _stores_lock:
+        if directory not in _stores:
+            _stores[directory] = CacheStore(path.join(directory, CACHE_FILENAME))
+        return _stores[directory]
+
+
+class MemoryCache:
+    """In-memory LRU cache holding at most ``max_entries`` entries"""
+
+    def __init__(self, ttl: float, max_entries: int = DEFAULT_MAX_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[Any, bool]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            inserted_at, value = entry
+            if 0 <= self.ttl <= time.time() - inserted_at:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return value, True
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SingleFlight:
+    """Runs a single computation per key at a time, concurrent callers
+    with the same key wait for the result of the computation in flight
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+
+    def run(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._in_flight[key] = future
+        if not is_owner:
+            return future.result()
+
+        try:
+            result = compute()
+            future.set_result(result)
+            return result
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
 
 
 def cache(
@@ -16,19 +249,23 @@ def cache(
     directory: str = CACHE_PATH,
     exclude: dict = None,
     should_cache=None,
+    max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+    store: Optional[CacheStore] = None,
 ):
     """Decorator using on-disk caching. If the function call takes more than
     ``min_memory_time`` and less than ``min_disk_time``, the result will be
     cached in memory. If the call takes more than ``min_disk_time``, the result
-    will be cached inside ``directory`` as a pickle file.
+    will be cached in the ``CacheStore`` of ``directory``, unless a ``store``
+    is given.
     Regardless of the storage, cached results are used only for ``ttl`` seconds.
     If ``ttl`` is set to a negative value, the cache will never be expired.
+    The memory cache keeps the ``max_memory_entries`` most recently used results
+    and the disk cache is bounded by the maximum size of its store.
     The function result is cached based on its name and the arguments it has
     been passed. This means that if the function is not passed the exact
     same arguments, the result will not be re-used.
+    Concurrent calls with the same arguments run the function only once.
     """
-    os.makedirs(CACHE_PATH, 0o755, exist_ok=True)
-
     if exclude is None:
         exclude = {}
 
@@ -47,49 +284,23 @@ def cache(
         md5sum.update(to_hash)
         return md5sum.hexdigest()
 
-    def should_use_file_cache(filepath):
-        """Returns ``True`` if the file cache should be used"""
-        try:
-            stats = os.stat(filepath)
-            if 0 <= ttl <= int(time.time() - stats.st_mtime):
-                os.unlink(filepath)
-                return False
-            return True
-        except FileNotFoundError:
-            return False
-
     def decorator(fn):
-        memory_cache = {}
-
-        def get_from_memory_cache(key):
-            """Returns two values, the second indicates if the value was cached
-            or not. If the second value is true, the first value is the
-            actual cached value
-            """
-            entry = memory_cache.get(key)
-            if not entry:
-                return None, False
-            inserted_at, value = entry
-            if 0 <= ttl <= time.time() - inserted_at:
-                del memory_cache[key]
-                return None, False
-            return value, True
-
-        def decorated(*args, **kwargs):
-            # compute unique key depending on function name and arguments
-            key = compute_key(fn.__name__, args, kwargs)
+        memory_cache = MemoryCache(ttl, max_memory_entries)
+        single_flight = SingleFlight()
 
+        def get_from_cache(key):
             # return from memory if possible
-            value, cached = get_from_memory_cache(key)
+            value, cached = memory_cache.get(key)
             if value is not None and cached:
-                return value
-
+                return value, True
             # return from disk if possible
-            filename = "{0}.pkl".format(key)
-            filepath = path.join(directory, filename)
-            if should_use_file_cache(filepath):
-                with open(filepath, "rb") as f:
-                    return pickle.load(f)
+            return (store or get_store(directory)).get(key)
+
+        def compute(key, args, kwargs):
+            # the result may have been cached by another caller since the lookup
+            value, cached = get_from_cache(key)
+            if cached:
+                return value
 
             # not cached, run the computation
             start = time.time()
@@ -103,14 +314,22 @@ def cache(
             # short enough not to fallback to disk storage or disk storage is not enabled
             # add to memory cache
             if min_memory_time <= ellapsed < min_disk_time:
-                memory_cache[key] = (time.time(), result)
+                memory_cache.set(key, result)
 
             # if ellapsed time is long, use disk storage instead of memory
             elif ellapsed >= min_disk_time:
-                with open(filepath, "wb") as f:
-                    pickle.dump(result, f)
+                (store or get_store(directory)).set(key, result, ttl)
             return result
 
+        def decorated(*args, **kwargs):
+            # compute unique key depending on function name and arguments
+            key = compute_key(fn.__name__, args, kwargs)
+            value, cached = get_from_cache(key)
+            if cached:
+                return value
+            # concurrent calls with the same key wait for a single computation
+            return single_flight.run(key, lambda: compute(key, args, kwargs))
+
         return functools.update_wrapper(decorated, fn)
 
     return decorator
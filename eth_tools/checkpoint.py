@@ -0,0 +1,138 @@
+import gzip
+import json
+import os
+from dataclasses import asdict, dataclass
+from os import path
+from typing import IO, Optional
+from urllib.parse import urlparse
+
+from eth_tools.logger import logger
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+@dataclass
+class Checkpoint:
+    """State of an output file of which all the events up to ``last_block``
+    are fully written in the first ``offset`` bytes
+    """
+
+    address: str
+    start_block: int
+    last_block: int
+    offset: int
+
+    @classmethod
+    def load(cls, filepath: str) -> Optional["Checkpoint"]:
+        try:
+            with open(filepath) as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, filepath: str):
+        tmp_filepath = filepath + ".tmp"
+        with open(tmp_filepath, "w") as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp_filepath, filepath)
+
+
+class CheckpointedWriter:
+    """Writes lines to a local file and records in a ``.checkpoint`` sidecar
+    file the last block of which all the events have been written.
+    If ``filepath`` ends with ``.gz``, each checkpoint closes a gzip member,
+    so the file is always a valid multi-member gzip file up to the checkpoint.
+    When ``resume`` is true, the file is truncated to the last checkpoint
+    and new lines are appended after it. A checkpoint whose file was deleted
+    or is shorter than the checkpoint is ignored and the file is written from
+    the start. Otherwise, the checkpoint of a previous run is deleted.
+    """
+
+    def __init__(self, filepath: str, address: str, start_block: int, resume=False):
+        self.filepath = filepath
+        self.checkpoint_path = filepath + CHECKPOINT_SUFFIX
+        self.compress = filepath.endswith(".gz")
+        self.checkpoint = Checkpoint.load(self.checkpoint_path) if resume else None
+        if self.checkpoint and not path.exists(filepath):
+            logger.warning(
+                "ignoring %s: %s does not exist", self.checkpoint_path, filepath
+            )
+            self.checkpoint = None
+        if self.checkpoint and self.checkpoint.offset > path.getsize(filepath):
+            logger.warning(
+                "ignoring %s: %s is shorter than its checkpoint",
+                self.checkpoint_path,
+                filepath,
+            )
+            self.checkpoint = None
+        if self.checkpoint and (
+            self.checkpoint.address.lower() != address.lower()
+            or self.checkpoint.start_block != start_block
+        ):
+            raise ValueError(
+                f"checkpoint {self.checkpoint_path} does not match "
+                f"{address} from block {start_block}"
+            )
+        if self.checkpoint:
+            self._file = open(filepath, "r+b")  # pylint: disable=consider-using-with
+            self._file.truncate(self.checkpoint.offset)
+            self._file.seek(self.checkpoint.offset)
+        else:
+            self.checkpoint = Checkpoint(address, start_block, start_block - 1, 0)
+            # the checkpoint of a previous run does not apply to the new file
+            if path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            self._file = open(filepath, "wb")  # pylint: disable=consider-using-with
+        self._member: Optional[IO[bytes]] = None
+
+    @staticmethod
+    def supports(filepath: str) -> bool:
+        """Checkpoints are only supported for local, uncompressed or gzip files"""
+        if urlparse(filepath).scheme not in ("", "file"):
+            return False
+        return path.splitext(filepath)[1] in (".gz", ".jsonl", ".json", ".txt")
+
+    @property
+    def last_block(self) -> int:
+        return self.checkpoint.last_block
+
+    def write(self, line: str):
+        data = (line + "\n").encode()
+        if not self.compress:
+            self._file.write(data)
+            return
+        if self._member is None:
+            self._member = gzip.GzipFile(fileobj=self._file, mode="wb")
+        self._member.write(data)
+
+    def write_encoded(self, data: bytes):
+        """Writes lines already encoded, and compressed as complete gzip
+        members if the file is compressed
+        """
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+        self._file.write(data)
+
+    def commit(self, last_block: int):
+        """Marks all the events up to ``last_block`` as written"""
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.checkpoint.last_block = last_block
+        self.checkpoint.offset = self._file.tell()
+        self.checkpoint.save(self.checkpoint_path)
+
+    def close(self):
+        """Closes the file, data written after the last commit is not checkpointed"""
+        if self._member is not None:
+            self._member.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
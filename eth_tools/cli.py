@@ -3,7 +3,30 @@ from argparse import ArgumentParser
 
 from eth_tools import commands
 from eth_tools import constants
-from eth_tools.contract_caller import DEFAULT_BLOCK_INTERVAL
+from eth_tools.balance_snapshot import SNAPSHOT_FORMATS
+from eth_tools.block_iterator import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY
+from eth_tools.contract_caller import DEFAULT_BLOCK_INTERVAL, DEFAULT_CALLS_PER_REQUEST
+from eth_tools.event_decoder import DEFAULT_DECODE_CHUNK_SIZE, DEFAULT_DECODE_PROCESSES
+from eth_tools.event_fetcher import (
+    DEFAULT_BULK_WORKERS,
+    DEFAULT_CONFIRMATIONS,
+    DEFAULT_GROUP_SIZE,
+    DEFAULT_LOGS_BATCH_SIZE,
+    DEFAULT_LOGS_CONCURRENCY,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_UNIT_BLOCKS,
+    OUTPUT_FORMATS,
+)
+from eth_tools.request_scheduler import DEFAULT_MAX_CONCURRENT_REQUESTS
+from eth_tools.rpc_cache import DEFAULT_FINALITY_DEPTH
+from eth_tools.sharding import DEFAULT_SHARD_BLOCKS, Shard
+from eth_tools.transaction_details_fetcher import (
+    DEFAULT_MIN_BLOCK_TRANSACTIONS,
+    DEFAULT_TRACES_CONCURRENCY,
+    DEFAULT_TRANSACTIONS_BATCH_SIZE,
+    DEFAULT_TRANSACTIONS_CONCURRENCY,
+)
+from eth_tools.transfer_event_parser import BALANCES_FORMATS
 
 
 def environ_or_required(key):
@@ -17,6 +40,85 @@ def add_web3_uri(subparser):
     subparser.add_argument(
         "--web3-uri", help="URI of Web3", **environ_or_required("WEB3_PROVIDER_URI")
     )
+    subparser.add_argument(
+        "--max-concurrent-requests",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENT_REQUESTS,
+        help="maximum number of HTTP requests in flight to the Web3 provider",
+    )
+    subparser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="maximum number of JSON-RPC calls per second to the Web3 provider",
+    )
+    subparser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        default=False,
+        help="send requests using the asyncio engine (requires aiohttp)",
+    )
+    subparser.add_argument(
+        "--cache-rpc",
+        action="store_true",
+        default=False,
+        help="cache on disk the results of calls to finalized blocks",
+    )
+    subparser.add_argument(
+        "--finality-depth",
+        type=int,
+        default=DEFAULT_FINALITY_DEPTH,
+        help="number of blocks behind the head after which blocks are final",
+    )
+
+
+def add_logs_fetching_options(subparser):
+    subparser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_LOGS_BATCH_SIZE,
+        help="number of block ranges to request per JSON-RPC batch request",
+    )
+    subparser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="resume from the checkpoint of a previous run, appending to the output",
+    )
+    subparser.add_argument(
+        "--raw",
+        action="store_true",
+        default=False,
+        help="store the logs without decoding them, see decode-events",
+    )
+    subparser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="number of processes decoding, serializing and compressing jsonl "
+        "outputs, 0 to do it in the fetching threads",
+    )
+    subparser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="jsonl",
+        help="format of the output, parquet requires pyarrow, "
+        "store writes to an indexed event store, see query-events",
+    )
+
+
+def add_sharding_options(subparser):
+    subparser.add_argument(
+        "--shard",
+        type=Shard.parse,
+        help="i/N, only fetch the slices of shard i out of N (0 <= i < N)",
+    )
+    subparser.add_argument(
+        "--shard-blocks",
+        type=int,
+        default=DEFAULT_SHARD_BLOCKS,
+        help="number of blocks of the slices distributed to shards and workers",
+    )
 
 
 def add_etherscan_api_key(subparser):
@@ -60,9 +162,28 @@ fetch_blocks_group_range.add_argument(
 fetch_block_timestamps_parser.add_argument(
     "-o", "--output", required=True, help="output file"
 )
+fetch_block_timestamps_parser.add_argument(
+    "--format",
+    choices=["csv", "parquet"],
+    default="csv",
+    help="format of the output, parquet requires pyarrow",
+)
 fetch_block_timestamps_parser.add_argument(
     "--log-interval", type=int, default=1_000, help="interval at which to log"
 )
+fetch_block_timestamps_parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_BATCH_SIZE,
+    help="number of blocks to fetch per JSON-RPC batch request",
+)
+fetch_block_timestamps_parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help="number of batch requests to run in parallel",
+)
+add_sharding_options(fetch_block_timestamps_parser)
 
 fetch_address_transactions_parser = subparsers.add_parser(
     "fetch-address-transactions",
@@ -107,6 +228,43 @@ fetch_transactions_parser.add_argument(
 fetch_transactions_parser.add_argument(
     "-o", "--output", required=True, help="output file"
 )
+fetch_transactions_parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_TRANSACTIONS_BATCH_SIZE,
+    help="number of transactions to fetch per JSON-RPC batch request",
+)
+fetch_transactions_parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=DEFAULT_TRANSACTIONS_CONCURRENCY,
+    help="number of batch requests to run in parallel",
+)
+fetch_transactions_parser.add_argument(
+    "--traces-concurrency",
+    type=int,
+    default=DEFAULT_TRACES_CONCURRENCY,
+    help="number of transactions to trace in parallel",
+)
+fetch_transactions_parser.add_argument(
+    "--min-block-transactions",
+    type=int,
+    default=DEFAULT_MIN_BLOCK_TRANSACTIONS,
+    help="fetch receipts and traces for the whole block when at least this many "
+    "transactions, and half of the block, are requested (0 to disable)",
+)
+fetch_transactions_parser.add_argument(
+    "--unordered",
+    action="store_true",
+    default=False,
+    help="write transactions as soon as they are fetched rather than in input order",
+)
+fetch_transactions_parser.add_argument(
+    "--resume",
+    action="store_true",
+    default=False,
+    help="append to the output, skipping transactions already in it",
+)
 
 call_contract_parser = subparsers.add_parser(
     "call-contract", help="call contract regularly between blocks"
@@ -124,11 +282,37 @@ call_contract_parser.add_argument(
     help="interval between calls",
 )
 call_contract_parser.add_argument(
-    "-f", "--func", required=True, help="function to call"
+    "-f",
+    "--func",
+    help="function to call, required unless all the sets of --args-sets or "
+    "--args-file name their function",
 )
-call_contract_parser.add_argument(
+call_contract_args_group = call_contract_parser.add_mutually_exclusive_group()
+call_contract_args_group.add_argument(
     "--args", nargs="*", help="arguments to pass to the function"
 )
+call_contract_args_group.add_argument(
+    "--args-sets",
+    nargs="+",
+    help="sets of comma-separated arguments, the function is called with each set "
+    "using Multicall; a set written as func(arg1,arg2) calls func instead",
+)
+call_contract_args_group.add_argument(
+    "--args-file",
+    help="file containing a set of comma-separated arguments, or a call "
+    "func(arg1,arg2), per line, made using Multicall",
+)
+call_contract_parser.add_argument(
+    "--calls-per-request",
+    type=int,
+    default=DEFAULT_CALLS_PER_REQUEST,
+    help="maximum number of calls aggregated in a single Multicall",
+)
+call_contract_parser.add_argument(
+    "--multicall-address",
+    default=constants.MULTICALL_ADDRESS,
+    help="address of the Multicall3 contract",
+)
 call_contract_parser.add_argument("-o", "--output", help="output file")
 
 
@@ -154,6 +338,34 @@ fetch_events_parser.add_argument(
     required=True,
     help="Output jsonl file to store the results (.gz recommended)",
 )
+fetch_events_parser.add_argument(
+    "--events", nargs="+", help="Names of the events to fetch (default: all events)"
+)
+fetch_events_parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=DEFAULT_LOGS_CONCURRENCY,
+    help="number of requests to run in parallel",
+)
+fetch_events_parser.add_argument(
+    "--follow",
+    action="store_true",
+    default=False,
+    help="keep fetching the events of new blocks once they are confirmed",
+)
+fetch_events_parser.add_argument(
+    "--confirmations",
+    type=int,
+    default=DEFAULT_CONFIRMATIONS,
+    help="number of blocks after which a block is confirmed when following",
+)
+fetch_events_parser.add_argument(
+    "--poll-interval",
+    type=float,
+    default=DEFAULT_POLL_INTERVAL,
+    help="interval in seconds at which to poll new blocks when following",
+)
+add_logs_fetching_options(fetch_events_parser)
 
 bulk_fetch_events_parser = subparsers.add_parser(
     "bulk-fetch-events", help="Fetches the events from the given contracts"
@@ -169,6 +381,99 @@ bulk_fetch_events_parser.add_argument(
     required=True,
     help="Output directory to store the results",
 )
+bulk_fetch_events_parser.add_argument(
+    "--workers",
+    type=int,
+    default=DEFAULT_BULK_WORKERS,
+    help="number of requests to run in parallel across all the contracts",
+)
+bulk_fetch_events_parser.add_argument(
+    "--unit-blocks",
+    type=int,
+    default=DEFAULT_UNIT_BLOCKS,
+    help="number of blocks of the work units shared between the workers",
+)
+bulk_fetch_events_parser.add_argument(
+    "--group-size",
+    type=int,
+    default=DEFAULT_GROUP_SIZE,
+    help="maximum number of contracts whose logs are fetched with the same requests",
+)
+bulk_fetch_events_parser.add_argument(
+    "--manifest",
+    help="SQLite file from which workers claim the slices to fetch",
+)
+bulk_fetch_events_parser.add_argument(
+    "--local-workers",
+    type=int,
+    default=1,
+    help="number of worker processes to start with --manifest",
+)
+add_sharding_options(bulk_fetch_events_parser)
+add_logs_fetching_options(bulk_fetch_events_parser)
+
+merge_parser = subparsers.add_parser(
+    "merge", help="Merges the slice files written by shards or workers"
+)
+merge_parser.add_argument(
+    "inputs", nargs="+", help="Directories containing the slice files"
+)
+merge_parser.add_argument(
+    "-o", "--output", required=True, help="Output directory of the merged files"
+)
+
+query_events_parser = subparsers.add_parser(
+    "query-events", help="Queries the events of an event store"
+)
+query_events_parser.add_argument("store", help="event store file")
+query_events_parser.add_argument(
+    "--addresses", nargs="+", help="addresses of the contracts (default: all)"
+)
+query_events_parser.add_argument(
+    "--events",
+    nargs="+",
+    help="names of the events or first topics of raw logs (default: all)",
+)
+query_events_parser.add_argument(
+    "-s", "--start-block", type=int, help="first block of the events"
+)
+query_events_parser.add_argument(
+    "-e", "--end-block", type=int, help="last block of the events"
+)
+query_events_parser.add_argument(
+    "-o", "--output", help="output jsonl file (default: stdout)"
+)
+
+import_events_parser = subparsers.add_parser(
+    "import-events", help="Imports jsonl files of events into an event store"
+)
+import_events_parser.add_argument("store", help="event store file")
+import_events_parser.add_argument(
+    "inputs", nargs="+", help="jsonl files written by fetch-events"
+)
+
+decode_events_parser = subparsers.add_parser(
+    "decode-events", help="Decodes the logs fetched using --raw"
+)
+decode_events_parser.add_argument("input", help="jsonl file containing the raw logs")
+decode_events_parser.add_argument(
+    "--abi", required=True, help="Path to the contract ABI"
+)
+decode_events_parser.add_argument(
+    "-o", "--output", required=True, help="Output jsonl file of the decoded events"
+)
+decode_events_parser.add_argument(
+    "--processes",
+    type=int,
+    default=DEFAULT_DECODE_PROCESSES,
+    help="number of processes decoding the logs",
+)
+decode_events_parser.add_argument(
+    "--chunk-size",
+    type=int,
+    default=DEFAULT_DECODE_CHUNK_SIZE,
+    help="number of logs decoded at a time by each process",
+)
 
 get_balances_event_parser = subparsers.add_parser(
     "get-balances",
@@ -201,7 +506,50 @@ get_balances_event_parser.add_argument(
 get_balances_event_parser.add_argument(
     "--log-interval", type=int, default=1_000, help="interval at which to log"
 )
+get_balances_event_parser.add_argument(
+    "--changes-only",
+    action="store_true",
+    default=False,
+    help="only write the blocks at which balances change instead of every interval",
+)
+get_balances_event_parser.add_argument(
+    "--format",
+    choices=BALANCES_FORMATS,
+    default="jsonl",
+    help="format of the output, parquet requires pyarrow",
+)
 
+snapshot_balances_parser = subparsers.add_parser(
+    "snapshot-balances",
+    help="replays 'transfer' events to compute the balances of all holders",
+)
+snapshot_balances_parser.add_argument(
+    "-t", "--token", required=True, help="token symbol (used for output file name)"
+)
+snapshot_balances_parser.add_argument(
+    "-d", "--events", required=True, help="file containing the events sorted by block"
+)
+snapshot_balances_parser.add_argument(
+    "-b",
+    "--blocks",
+    type=int,
+    nargs="+",
+    required=True,
+    help="blocks at the end of which to take a snapshot",
+)
+snapshot_balances_parser.add_argument(
+    "-o", "--output", required=True, help="output file path"
+)
+snapshot_balances_parser.add_argument(
+    "--checkpoint",
+    help="file from which to load balances and to which to save them after the replay",
+)
+snapshot_balances_parser.add_argument(
+    "--format",
+    choices=SNAPSHOT_FORMATS,
+    default="csv",
+    help="format of the output, parquet requires pyarrow",
+)
 
 fetch_abis_parser = subparsers.add_parser(
     "fetch-abis",
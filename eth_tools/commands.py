@@ -1,21 +1,43 @@
 import csv
 import json
+import multiprocessing
+import re
 import sys
 from contextlib import contextmanager
 from functools import wraps
 from os import path
-from typing import IO, Iterator
+from typing import IO, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
 
 from eth_typing import Address
 from web3 import Web3
 from web3.providers.auto import load_provider_from_uri
 
-from eth_tools import abi_fetcher, constants
+from eth_tools import (
+    abi_fetcher,
+    balance_snapshot,
+    constants,
+    event_decoder,
+    sharding,
+)
+from eth_tools.async_engine import AsyncEngine
 from eth_tools.block_iterator import BlockIterator
 from eth_tools.contract_caller import ContractCaller
 from eth_tools.event_fetcher import EventFetcher, FetchTask
-from eth_tools.json_encoder import EthJSONEncoder
+from eth_tools.event_store import EventStore
+from eth_tools.json_encoder import to_json
 from eth_tools.logger import logger
+from eth_tools.parquet_writer import ParquetWriter, block_columns
+from eth_tools.request_scheduler import (
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    RequestScheduler,
+    ScheduledHTTPProvider,
+)
+from eth_tools.rpc_cache import DEFAULT_FINALITY_DEPTH, RPCCache
+from eth_tools.transaction_details_fetcher import (
+    TransactionDetailsFetcher,
+    load_fetched_hashes,
+)
 from eth_tools.transaction_fetcher import TransactionsFetcher
 from eth_tools.transaction_tracer import TransactionTracer
 from eth_tools.transfer_event_parser import TransferEventParser
@@ -25,7 +47,13 @@ from eth_tools.utils import smart_open
 def uses_web3(f):
     @wraps(f)
     def wrapper(args):
-        web3 = create_web3(args["web3_uri"])
+        web3 = create_web3(
+            args["web3_uri"],
+            max_concurrent_requests=args["max_concurrent_requests"],
+            requests_per_second=args["rate_limit"],
+            cache_rpc=args["cache_rpc"],
+            finality_depth=args["finality_depth"],
+        )
         return f(args, web3)
 
     return wrapper
@@ -40,32 +68,120 @@ def uses_etherscan(f):
     return wrapper
 
 
-def create_web3(uri: str):
-    provider = load_provider_from_uri(uri, {"timeout": 60})
+def create_web3(
+    uri: str,
+    max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+    requests_per_second: float = None,
+    cache_rpc: bool = False,
+    finality_depth: int = DEFAULT_FINALITY_DEPTH,
+):
+    """Creates a web3 instance for ``uri``
+    HTTP providers send all their requests, including JSON-RPC batch requests,
+    through a single ``RequestScheduler`` enforcing the given limits and, if
+    ``cache_rpc`` is true, cache the results of calls at least ``finality_depth``
+    blocks behind the head of the chain
+    """
+    if urlparse(uri).scheme in ("http", "https"):
+        scheduler = RequestScheduler(
+            max_concurrent_requests=max_concurrent_requests,
+            requests_per_second=requests_per_second,
+        )
+        provider = ScheduledHTTPProvider(uri, {"timeout": 60}, scheduler=scheduler)
+        if cache_rpc:
+            provider.rpc_cache = RPCCache.create(
+                provider.make_uncached_request, finality_depth=finality_depth
+            )
+    else:
+        if cache_rpc:
+            logger.warning("RPC caching is only supported for HTTP providers")
+        provider = load_provider_from_uri(uri, {"timeout": 60})
     return Web3(provider=provider)
 
 
+@contextmanager
+def create_engine(args: dict, web3: Web3) -> Iterator[Optional[AsyncEngine]]:
+    """Creates an async engine sharing the provider limits and cache
+    if ``--async`` is given
+    """
+    if not args["use_async"]:
+        yield None
+        return
+    with AsyncEngine(
+        args["web3_uri"],
+        scheduler=getattr(web3.provider, "scheduler", None),
+        max_concurrent_requests=args["max_concurrent_requests"],
+        requests_per_second=args["rate_limit"],
+        rpc_cache=getattr(web3.provider, "rpc_cache", None),
+    ) as engine:
+        yield engine
+
+
+@contextmanager
+def create_encoder(args: dict) -> Iterator[Optional[event_decoder.EventEncoder]]:
+    """Creates a pool of processes encoding the events if ``--processes``
+    is positive, events are encoded by the fetching threads otherwise
+    """
+    if args["processes"] <= 0:
+        yield None
+        return
+    with event_decoder.EventEncoder(args["processes"]) as encoder:
+        yield encoder
+
+
+def write_blocks(
+    block_iterator: BlockIterator, fields: List[str], output: str, output_format: str
+):
+    rows = (
+        {field: getattr(block, field) for field in fields} for block in block_iterator
+    )
+    if output_format == "parquet":
+        with ParquetWriter(output, block_columns(fields)) as writer:
+            for row in rows:
+                writer.write(row)
+        return
+    with smart_open(output, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
 @uses_web3
 def fetch_blocks(args: dict, web3: Web3):
-    """Fetches blocks and stores them in the file given in arguments"""
+    """Fetches blocks and stores them in the file given in arguments
+    With ``--shard``, only the slices of the shard are fetched, each to its own file
+    """
     blocks = None
     if args["blocks"]:
         with open(args["blocks"]) as f:
             blocks = list(map(int, f))
-    block_iterator = BlockIterator(
-        web3,
-        start_block=args["start_block"],
-        end_block=args["end_block"],
-        blocks=blocks,
-        log_interval=args["log_interval"],
-    )
+    block_ranges = [(args["start_block"], args["end_block"])]
+    if args["shard"]:
+        if blocks is not None or args["end_block"] is None:
+            raise ValueError("--shard requires a start and an end block")
+        block_ranges = args["shard"].slices(
+            args["start_block"], args["end_block"], args["shard_blocks"]
+        )
     fields = args["fields"]
-    with smart_open(args["output"], "w") as f:
-        writer = csv.DictWriter(f, fieldnames=fields)
-        writer.writeheader()
-        for block in block_iterator:
-            row = {field: getattr(block, field) for field in fields}
-            writer.writerow(row)
+    with create_engine(args, web3) as engine:
+        for start_block, end_block in block_ranges:
+            block_iterator = BlockIterator(
+                web3,
+                start_block=start_block,
+                end_block=end_block,
+                blocks=blocks,
+                log_interval=args["log_interval"],
+                batch_size=args["batch_size"],
+                concurrency=args["concurrency"],
+                engine=engine,
+            )
+            output = args["output"]
+            if not args["shard"]:
+                write_blocks(block_iterator, fields, output, args["format"])
+                continue
+            output = sharding.slice_filepath(output, start_block, end_block)
+            sharding.mark_incomplete(output)
+            write_blocks(block_iterator, fields, output, args["format"])
+            sharding.mark_complete(output)
 
 
 def get_balances(args: dict):
@@ -77,14 +193,32 @@ def get_balances(args: dict):
     start = args.get("start_block")
     end = args.get("end_block")
     event_parser = TransferEventParser(addresses, start=start, end=end)
-    with open(args["events"]) as f:
-        events = [json.loads(e) for e in f]
-    event_parser.execute_events(events)
+    with smart_open(args["events"]) as f:
+        event_parser.execute_events(json.loads(e) for e in f)
     event_parser.write_balances(
-        args["token"], interval=args["log_interval"], filepath=args["output"]
+        args["token"],
+        interval=args["log_interval"],
+        filepath=args["output"],
+        changes_only=args["changes_only"],
+        output_format=args["format"],
     )
 
 
+def snapshot_balances(args: dict):
+    """Replays 'transfer' events of an ERC20 contract to write the balances
+    of all the holders at the given blocks
+    """
+    output_prefix = args["output"] + args["token"].lower() + "-snapshot:"
+    with smart_open(args["events"]) as f:
+        balance_snapshot.take_snapshots(
+            f,
+            args["blocks"],
+            output_prefix,
+            output_format=args["format"],
+            checkpoint=args["checkpoint"],
+        )
+
+
 @uses_etherscan
 def fetch_address_transactions(args: dict, etherscan_key: str):
     fetcher = TransactionsFetcher(etherscan_api_key=etherscan_key)
@@ -110,26 +244,54 @@ def fetch_transactions(args: dict, web3: Web3):
             for tx in csv.DictReader(fin):
                 tx_hashes.append(tx["hash"])
 
-    tx_tracer = TransactionTracer(web3)
-    done = set()
-    with smart_open(args["output"], "w") as fout:
-        for i, tx_hash in enumerate(tx_hashes):
-            if i % 10 == 0:
-                logger.info("progress: %s/%s", i, len(tx_hashes))
-            if tx_hash in done:
-                continue
-            try:
-                tx = dict(web3.eth.getTransaction(tx_hash))
-                if args["include_receipt"]:
-                    tx["receipt"] = web3.eth.getTransactionReceipt(tx_hash)
-                if args["include_traces"]:
-                    tx["traces"] = tx_tracer.trace_transaction(tx_hash)
-                json.dump(tx, fout, cls=EthJSONEncoder)
-                print(file=fout)
-                done.add(tx_hash)
-            except Exception as ex:  # pylint: disable=broad-except
-                logger.warning("failed to trace %s: %s", tx_hash, ex)
-                continue
+    mode = "w"
+    if args["resume"]:
+        fetched_hashes = load_fetched_hashes(args["output"])
+        tx_hashes = [tx_hash for tx_hash in tx_hashes if tx_hash not in fetched_hashes]
+        logger.info("resuming, %s transactions already fetched", len(fetched_hashes))
+        mode = "a"
+
+    with create_engine(args, web3) as engine, smart_open(args["output"], mode) as fout:
+        fetcher = TransactionDetailsFetcher(
+            web3,
+            include_receipt=args["include_receipt"],
+            include_traces=args["include_traces"],
+            batch_size=args["batch_size"],
+            concurrency=args["concurrency"],
+            traces_concurrency=args["traces_concurrency"],
+            ordered=not args["unordered"],
+            tracer=TransactionTracer(web3, engine=engine),
+            min_block_transactions=args["min_block_transactions"],
+        )
+        for tx in fetcher.fetch_transactions(tx_hashes):
+            print(to_json(tx), file=fout)
+
+
+def parse_args_set(raw_args: str) -> List[str]:
+    return [arg.strip() for arg in raw_args.split(",") if arg.strip()]
+
+
+def parse_call(raw_call: str, default_func: Optional[str]) -> Tuple[str, List[str]]:
+    """Parses ``func(arg1,arg2)``, or ``arg1,arg2`` to call ``default_func``"""
+    match = re.fullmatch(r"\s*(\w+)\((.*)\)\s*", raw_call)
+    if match:
+        return match[1], parse_args_set(match[2])
+    if default_func is None:
+        raise ValueError(f"no function given to call with {raw_call.strip()}")
+    return default_func, parse_args_set(raw_call)
+
+
+def load_calls(args: dict) -> Optional[List[Tuple[str, List[str]]]]:
+    """Returns the ``(func_name, args)`` calls to make using Multicall,
+    or ``None`` if a single function is called with a single set of arguments
+    """
+    raw_calls: List[str] = args["args_sets"] or []
+    if args["args_file"]:
+        with smart_open(args["args_file"]) as f:
+            raw_calls = [line for line in f if line.strip()]
+    if not raw_calls:
+        return None
+    return [parse_call(raw_call, args["func"]) for raw_call in raw_calls]
 
 
 @uses_web3
@@ -141,27 +303,93 @@ def call_contract(args: dict, web3: Web3):
         abi = abi_fetcher.fetch_abi(args["address"])
     address: Address = web3.toChecksumAddress(args["address"])
     contract = web3.eth.contract(abi=abi, address=address)
-    contract_caller = ContractCaller(contract)
-    with smart_open_with_stdout(args["output"], "w") as fout:
-        # print(args["args"])
-        results = contract_caller.collect_results(
-            args["func"],
-            start_block=args["start"],
-            end_block=args["end"],
-            block_interval=args["interval"],
-            contract_args=args["args"],
+    calls = load_calls(args)
+    if calls is None and not args["func"]:
+        raise ValueError("--func is required without --args-sets or --args-file")
+    with create_engine(args, web3) as engine, smart_open_with_stdout(
+        args["output"], "w"
+    ) as fout:
+        contract_caller = ContractCaller(
+            contract, engine=engine, multicall_address=args["multicall_address"]
         )
-        for block, result in results:
-            line = {"block": block, "result": result}
-            json.dump(line, fout, cls=EthJSONEncoder)
-            print(file=fout)
+        if calls is None:
+            results = contract_caller.collect_results(
+                args["func"],
+                start_block=args["start"],
+                end_block=args["end"],
+                block_interval=args["interval"],
+                contract_args=args["args"],
+            )
+            lines = ({"block": block, "result": result} for block, result in results)
+        else:
+            multicall_results = contract_caller.collect_multicall_results(
+                calls,
+                start_block=args["start"],
+                end_block=args["end"],
+                block_interval=args["interval"],
+                calls_per_request=args["calls_per_request"],
+            )
+            lines = (
+                {"block": block, "func": func, "args": call_args, "result": result}
+                for block, func, call_args, result in multicall_results
+            )
+        for line in lines:
+            print(to_json(line), file=fout)
 
 
 @uses_web3
 def fetch_events(args: dict, web3: Web3):
-    fetcher = EventFetcher(web3)
     task = FetchTask.from_dict(args)
-    fetcher.fetch_and_persist_events(task, args["output"])
+    with create_engine(args, web3) as engine, create_encoder(args) as encoder:
+        fetcher = EventFetcher(
+            web3,
+            batch_size=args["batch_size"],
+            concurrency=args["concurrency"],
+            engine=engine,
+            raw=args["raw"],
+            confirmations=args["confirmations"],
+            poll_interval=args["poll_interval"],
+            encoder=encoder,
+        )
+        if args["follow"] and args["format"] != "jsonl":
+            raise ValueError("only jsonl outputs are supported with --follow")
+        if args["follow"]:
+            fetcher.follow_and_persist_events(
+                task, args["output"], resume=args["resume"]
+            )
+            return
+        fetcher.fetch_and_persist_events(
+            task, args["output"], resume=args["resume"], output_format=args["format"]
+        )
+
+
+def decode_events(args: dict):
+    with open(args["abi"]) as f:
+        abi = json.load(f)
+    event_decoder.decode_events(
+        args["input"],
+        args["output"],
+        abi,
+        processes=args["processes"],
+        chunk_size=args["chunk_size"],
+    )
+
+
+def query_events(args: dict):
+    with EventStore(args["store"]) as store, smart_open_with_stdout(
+        args["output"], "w"
+    ) as f:
+        lines = store.query_lines(
+            args["addresses"], args["events"], args["start_block"], args["end_block"]
+        )
+        for line in lines:
+            f.write(line + "\n")
+
+
+def import_events(args: dict):
+    with EventStore(args["store"]) as store:
+        for filepath in args["inputs"]:
+            store.import_file(filepath)
 
 
 @uses_etherscan
@@ -175,14 +403,81 @@ def fetch_abis(args: dict, etherscan_key: str):
             json.dump(abi, f, indent=4)
 
 
-
-@uses_web3
-def bulk_fetch_events(args: dict, web3: Web3):
-    fetcher = EventFetcher(web3)
+def load_fetch_tasks(args: dict) -> List[FetchTask]:
     with smart_open(args["config"]) as f:
         raw_tasks = json.load(f)
-    tasks = [FetchTask.from_dict(raw_task, args["abis"]) for raw_task in raw_tasks]
-    fetcher.fetch_all_events(tasks, args["output"])
+    return [FetchTask.from_dict(raw_task, args["abis"]) for raw_task in raw_tasks]
+
+
+@uses_web3
+def run_bulk_fetch_events(args: dict, web3: Web3):
+    tasks = load_fetch_tasks(args)
+    with create_engine(args, web3) as engine, create_encoder(args) as encoder:
+        fetcher = EventFetcher(
+            web3,
+            batch_size=args["batch_size"],
+            engine=engine,
+            raw=args["raw"],
+            workers=args["workers"],
+            unit_blocks=args["unit_blocks"],
+            group_size=args["group_size"],
+            encoder=encoder,
+        )
+        if args["manifest"]:
+            with sharding.Manifest(args["manifest"]) as manifest:
+                manifest.add_tasks(tasks, args["shard_blocks"])
+                sharding.run_manifest_worker(
+                    fetcher,
+                    manifest,
+                    tasks,
+                    args["output"],
+                    resume=args["resume"],
+                    output_format=args["format"],
+                )
+            return
+        if args["shard"]:
+            tasks = sharding.shard_tasks(tasks, args["shard"], args["shard_blocks"])
+            sharding.fetch_slices(
+                fetcher,
+                tasks,
+                args["output"],
+                resume=args["resume"],
+                output_format=args["format"],
+            )
+            return
+        fetcher.fetch_all_events(
+            tasks, args["output"], resume=args["resume"], output_format=args["format"]
+        )
+
+
+def bulk_fetch_events(args: dict):
+    """Fetches the events of the contracts of the config
+    With ``--manifest``, slices are claimed from a manifest shared with other
+    workers, ``--local-workers`` of which are started by this command
+    """
+    if not args["manifest"] or args["local_workers"] <= 1:
+        run_bulk_fetch_events(args)
+        return
+    # slices are added once, before the workers start claiming them
+    with sharding.Manifest(args["manifest"]) as manifest:
+        manifest.add_tasks(load_fetch_tasks(args), args["shard_blocks"])
+    processes = [
+        multiprocessing.Process(target=run_bulk_fetch_events, args=(args,))
+        for _ in range(args["local_workers"])
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    with sharding.Manifest(args["manifest"]) as manifest:
+        counts = manifest.counts()
+    logger.info("fetched slices: %s", counts)
+    if counts.get("failed") or counts.get("pending") or counts.get("running"):
+        raise ValueError(f"some slices were not fetched: {counts}")
+
+
+def merge(args: dict):
+    sharding.merge_slices(args["inputs"], args["output"])
 
 
 @contextmanager
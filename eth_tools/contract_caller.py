@@ -1,13 +1,20 @@
 from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
+from typing import Any, List, Optional, Sequence, Tuple
 
+from eth_utils import to_bytes
 from web3 import Web3
-from web3.contract import Contract
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.contract import Contract, ContractFunction
 from retry import retry
 
+from eth_tools.async_engine import AsyncEngine
+from eth_tools.constants import MULTICALL_ABI, MULTICALL_ADDRESS
 from eth_tools.logger import logger
 
 DEFAULT_BLOCK_INTERVAL = 1_000
+DEFAULT_CALLS_PER_REQUEST = 500
 
 
 ARG_TYPES = {
@@ -16,9 +23,43 @@ ARG_TYPES = {
 }
 
 
+def decode_function_output(function: ContractFunction, return_data: bytes) -> Any:
+    """Decodes the data returned by ``function`` the same way web3 does"""
+    output_types = get_abi_output_types(function.abi)
+    output_data = function.web3.codec.decode_abi(output_types, return_data)
+    normalized_data = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, output_data)
+    if len(normalized_data) == 1:
+        return normalized_data[0]
+    return normalized_data
+
+
 class ContractCaller:
-    def __init__(self, contract: Contract):
+    """Calls a contract function at regularly spaced blocks
+    If an ``engine`` is given, calls are sent by its event loop, with up to
+    ``engine.max_concurrent_requests`` calls in flight.
+    ``collect_multicall_results`` calls several functions, or a function with
+    several sets of arguments, through the Multicall contract at
+    ``multicall_address``.
+    """
+
+    def __init__(
+        self,
+        contract: Contract,
+        engine: Optional[AsyncEngine] = None,
+        multicall_address: str = MULTICALL_ADDRESS,
+    ):
         self.contract = contract
+        self.engine = engine
+        self.multicall = contract.web3.eth.contract(
+            address=Web3.toChecksumAddress(multicall_address), abi=MULTICALL_ABI
+        )
+
+    def _get_blocks(self, start_block, end_block, block_interval) -> range:
+        if end_block is None:
+            end_block = self.contract.web3.eth.blockNumber
+        if start_block is None:
+            start_block = end_block
+        return range(start_block, end_block + 1, block_interval)
 
     def collect_results(
         self,
@@ -28,14 +69,10 @@ class ContractCaller:
         block_interval=DEFAULT_BLOCK_INTERVAL,
         contract_args=None,
     ):
-        max_workers = multiprocessing.cpu_count() * 5
-        if end_block is None:
-            end_block = self.contract.web3.eth.blockNumber
-        if start_block is None:
-            start_block = end_block
         if contract_args is None:
             contract_args = []
         contract_args = [self.transform_arg(arg) for arg in contract_args]
+        blocks = self._get_blocks(start_block, end_block, block_interval)
 
         def run_task(block):
             try:
@@ -43,25 +80,181 @@ class ContractCaller:
             except Exception as ex:  # pylint: disable=broad-except
                 logger.error("failed to fetch block %s: %s", block, ex)
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            blocks = range(start_block, end_block + 1, block_interval)
-            total_count = len(blocks)
-            results = executor.map(run_task, blocks)
-            for i, (block, result) in enumerate(zip(blocks, results)):
-                if i % 10 == 0 and total_count > 10:
-                    logger.info(
-                        "progress: %s/%s (%.2f%%)",
-                        i,
-                        total_count,
-                        i / total_count * 100,
-                    )
+        results = self._run_tasks(blocks, run_task)
+        for block, result in results:
+            if result is not None:
+                yield (block, result)
+
+    def collect_multicall_results(
+        self,
+        calls: List[Tuple[str, list]],
+        start_block,
+        end_block=None,
+        block_interval=DEFAULT_BLOCK_INTERVAL,
+        calls_per_request=DEFAULT_CALLS_PER_REQUEST,
+    ):
+        """Same as ``collect_results`` but makes each of the ``calls``, given as
+        ``(func_name, args)`` pairs, aggregating up to ``calls_per_request``
+        calls of a block in a single ``eth_call``.
+        Yields ``(block, func_name, args, result)`` tuples, without the failed
+        calls. At blocks before the deployment of the Multicall contract, found
+        from its code, each call is sent alone instead.
+        """
+        calls = [
+            (func_name, [self.transform_arg(arg) for arg in contract_args])
+            for func_name, contract_args in calls
+        ]
+        calls_chunks = [
+            calls[i : i + calls_per_request]
+            for i in range(0, len(calls), calls_per_request)
+        ]
+        blocks = self._get_blocks(start_block, end_block, block_interval)
+        multicall_block = self._find_multicall_block(blocks)
+        # Multicall cannot be used before its deployment, each call is sent alone
+        tasks = [
+            (block, chunk)
+            for block in blocks
+            for chunk in (
+                calls_chunks if block >= multicall_block else [[c] for c in calls]
+            )
+        ]
+
+        def run_task(task):
+            block, chunk = task
+            try:
+                if block < multicall_block:
+                    func_name, contract_args = chunk[0]
+                    return [self.call_func(func_name, block, contract_args)]
+                return self.call_multicall(block, chunk)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.error("failed to fetch block %s: %s", block, ex)
+
+        for (block, chunk), results in self._run_tasks(tasks, run_task):
+            if results is None:
+                continue
+            for (func_name, contract_args), result in zip(chunk, results):
                 if result is not None:
-                    yield (block, result)
+                    yield (block, func_name, contract_args, result)
+
+    def _find_multicall_block(self, blocks: range) -> float:
+        """Returns the first of ``blocks`` at which the Multicall contract
+        is deployed, or infinity if it is not deployed at the last block
+        """
+        web3 = self.contract.web3
+
+        def is_deployed(index: int) -> bool:
+            code = web3.eth.getCode(
+                self.multicall.address, block_identifier=blocks[index]
+            )
+            return len(code) > 0
+
+        if not blocks:
+            return 0
+        if not is_deployed(len(blocks) - 1):
+            logger.warning("no Multicall contract at %s", self.multicall.address)
+            return float("inf")
+        low, high = 0, len(blocks) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if is_deployed(middle):
+                high = middle
+            else:
+                low = middle + 1
+        if low > 0:
+            logger.info("Multicall is not deployed before block %s", blocks[low])
+        return blocks[low]
+
+    def _run_tasks(self, tasks: Sequence, run_task):
+        """Runs ``run_task`` on all the ``tasks`` in parallel and yields
+        ``(task, result)`` tuples in order
+        """
+        if self.engine is not None:
+            max_workers = self.engine.max_concurrent_requests
+        else:
+            max_workers = multiprocessing.cpu_count() * 5
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(run_task, tasks)
+            yield from self._log_progress(tasks, results)
+
+    def _log_progress(self, tasks, results):
+        total_count = len(tasks)
+        for i, (task, result) in enumerate(zip(tasks, results)):
+            if i % 10 == 0 and total_count > 10:
+                logger.info(
+                    "progress: %s/%s (%.2f%%)",
+                    i,
+                    total_count,
+                    i / total_count * 100,
+                )
+            yield (task, result)
 
     @retry(delay=1, backoff=2, tries=3, logger=logger)
     def call_func(self, func_name, block, contract_args):
-        func = getattr(self.contract.functions, func_name)
-        return func(*contract_args).call(block_identifier=block)
+        function = getattr(self.contract.functions, func_name)(*contract_args)
+        return self._call(function, block)
+
+    def _call(self, function: ContractFunction, block: int) -> Any:
+        """Calls ``function`` at ``block``, through the event loop of the engine
+        when one is given
+        """
+        if self.engine is not None:
+            return self.engine.run(self._call_async(function, block))
+        return function.call(block_identifier=block)
+
+    async def _call_async(self, function: ContractFunction, block: int) -> Any:
+        assert self.engine is not None
+        call = {
+            "to": function.address,
+            "data": function._encode_transaction_data(),  # pylint: disable=protected-access
+        }
+        return_data = await self.engine.client.make_request(
+            "eth_call", [call, hex(block)]
+        )
+        return decode_function_output(function, to_bytes(hexstr=return_data))
+
+    def _make_multicall(
+        self, calls: List[Tuple[str, list]]
+    ) -> Tuple[List[ContractFunction], ContractFunction]:
+        functions = [
+            getattr(self.contract.functions, func_name)(*contract_args)
+            for func_name, contract_args in calls
+        ]
+        encoded_calls = [
+            (
+                self.contract.address,
+                function._encode_transaction_data(),  # pylint: disable=protected-access
+            )
+            for function in functions
+        ]
+        return functions, self.multicall.functions.tryAggregate(False, encoded_calls)
+
+    @staticmethod
+    def _decode_multicall_results(
+        functions: List[ContractFunction], results: List[Tuple[bool, bytes]]
+    ) -> List[Any]:
+        """Decodes the result of each call with the output types of its
+        function, or returns ``None`` if it failed
+        """
+        decoded_results = []
+        for function, (success, return_data) in zip(functions, results):
+            decoded_result = None
+            if success:
+                try:
+                    decoded_result = decode_function_output(function, return_data)
+                except Exception as ex:  # pylint: disable=broad-except
+                    logger.debug("failed to decode %s: %s", function.args, ex)
+            decoded_results.append(decoded_result)
+        return decoded_results
+
+    @retry(delay=1, backoff=2, tries=3, logger=logger)
+    def call_multicall(self, block, calls):
+        """Makes all the ``(func_name, args)`` ``calls`` at ``block``
+        in a single ``eth_call`` and returns the result of each call,
+        or ``None`` for calls which failed
+        """
+        functions, multicall = self._make_multicall(calls)
+        results = self._call(multicall, block)
+        return self._decode_multicall_results(functions, results)
 
     def transform_arg(self, raw_arg: str):
         if not isinstance(raw_arg, str):
@@ -0,0 +1,154 @@
+import gzip
+import itertools
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from web3 import Web3
+from web3.types import HexBytes, LogReceipt
+
+from eth_tools.event_fetcher import get_events_by_topic
+from eth_tools.json_encoder import to_json
+from eth_tools.logger import logger
+from eth_tools.utils import smart_open
+
+DEFAULT_DECODE_PROCESSES = multiprocessing.cpu_count()
+DEFAULT_DECODE_CHUNK_SIZE = 10_000
+# gzip members written by the encoding processes, a lower level than the
+# default of 9 is much faster for a slightly larger output
+ENCODER_COMPRESS_LEVEL = 6
+
+
+class LogDecoder:
+    """Decodes raw logs, e.g. fetched with ``--raw``, using the events of ``abi``
+    The event decoding a log is looked up by the first topic of the log.
+    Logs of unknown or anonymous events are returned unchanged.
+    """
+
+    def __init__(self, abi: list):
+        contract = Web3().eth.contract(abi=abi)
+        self.events_by_topic = get_events_by_topic(contract)
+
+    def decode(self, log: dict) -> LogReceipt:
+        topics = log.get("topics")
+        if not topics:
+            return log  # type: ignore
+        event = self.events_by_topic.get(HexBytes(topics[0]).hex())
+        if event is None:
+            return log  # type: ignore
+        log = dict(log, topics=[HexBytes(topic) for topic in topics])
+        return event.processLog(log)
+
+
+# decoder of the worker process, created once per process
+_decoder: Optional[LogDecoder] = None
+
+
+def _init_worker(abi: list):
+    global _decoder  # pylint: disable=global-statement
+    _decoder = LogDecoder(abi)
+
+
+def _decode_lines(lines: List[str]) -> List[str]:
+    assert _decoder is not None
+    return [to_json(_decoder.decode(json.loads(line))) for line in lines]
+
+
+def decode_events(
+    input_file: str,
+    output_file: str,
+    abi: list,
+    processes: int = DEFAULT_DECODE_PROCESSES,
+    chunk_size: int = DEFAULT_DECODE_CHUNK_SIZE,
+):
+    """Decodes the raw logs of ``input_file`` and writes them, in the same order,
+    to ``output_file``. Chunks of ``chunk_size`` lines are decoded by ``processes``
+    worker processes, with at most ``2 * processes`` chunks in flight.
+    """
+    with smart_open(input_file) as fin, smart_open(output_file, "w") as fout:
+        lines = (line for line in fin if line.strip())
+        chunks = iter(lambda: list(itertools.islice(lines, chunk_size)), [])
+        if processes <= 1:
+            _init_worker(abi)
+            for chunk in chunks:
+                fout.writelines(line + "\n" for line in _decode_lines(chunk))
+            return
+
+        decoded_count = 0
+        with ProcessPoolExecutor(
+            processes, initializer=_init_worker, initargs=(abi,)
+        ) as executor:
+            pending: Deque[Future] = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_decode_lines, chunk))
+                if len(pending) < 2 * processes:
+                    continue
+                decoded_lines = pending.popleft().result()
+                fout.writelines(line + "\n" for line in decoded_lines)
+                decoded_count += len(decoded_lines)
+                logger.info("decoded %s events", decoded_count)
+            while pending:
+                decoded_lines = pending.popleft().result()
+                fout.writelines(line + "\n" for line in decoded_lines)
+
+
+# decoders of the encoding processes, by JSON-encoded ABI
+_decoders: Dict[str, LogDecoder] = {}
+
+
+def _encode_logs(logs: List[dict], abi_json: Optional[str], compress: bool) -> bytes:
+    if abi_json is not None:
+        decoder = _decoders.get(abi_json)
+        if decoder is None:
+            decoder = _decoders[abi_json] = LogDecoder(json.loads(abi_json))
+        logs = [decoder.decode(log) for log in logs]
+    data = "".join(to_json(log) + "\n" for log in logs).encode()
+    if compress:
+        return gzip.compress(data, compresslevel=ENCODER_COMPRESS_LEVEL)
+    return data
+
+
+class EventEncoder:
+    """Decodes, serializes and optionally compresses chunks of raw logs in
+    ``processes`` worker processes, so that fetching threads are not limited
+    to the single core running the interpreter lock.
+    Compressed chunks are complete gzip members, which can be concatenated
+    to form a valid multi-member gzip file.
+    """
+
+    def __init__(self, processes: int = DEFAULT_DECODE_PROCESSES):
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # JSON-encoded ABIs by id, keeping a reference to the ABI so that its id
+        # cannot be reused by another object
+        self._abi_json: Dict[int, Tuple[list, str]] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.processes)
+        return self._executor
+
+    def submit(
+        self, logs: List[dict], abi: Optional[list] = None, compress: bool = False
+    ) -> "Future[bytes]":
+        """Encodes ``logs`` as JSON lines, decoding them first if ``abi`` is given"""
+        abi_json = None
+        if abi is not None:
+            if id(abi) not in self._abi_json:
+                self._abi_json[id(abi)] = (abi, json.dumps(abi))
+            abi_json = self._abi_json[id(abi)][1]
+        return self.executor.submit(_encode_logs, logs, abi_json, compress)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
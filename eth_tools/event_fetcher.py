@@ -1,20 +1,86 @@
 from argparse import RawTextHelpFormatter
 import json
 import math
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from os import path
-from typing import Iterable, Iterator, List, Optional
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from eth_typing import Address
 from web3 import Web3
-from web3.contract import Contract
-from web3.types import FilterParams, LogReceipt
+from web3.contract import Contract, ContractEvent
+from web3.datastructures import AttributeDict
+from web3.types import FilterParams, HexBytes, LogReceipt
 
-from eth_tools.json_encoder import EthJSONEncoder
+from eth_tools.async_engine import AsyncEngine
+from eth_tools.checkpoint import CheckpointedWriter
+from eth_tools.event_store import EVENT_STORE_FILENAME, EventStore, EventStoreWriter
+from eth_tools.json_encoder import to_json
 from eth_tools.logger import logger
+from eth_tools.parquet_writer import ParquetWriter, event_columns, event_to_row
+from eth_tools.rpc_client import RPCCall, RPCClient
 from eth_tools.utils import smart_open
 
+if TYPE_CHECKING:
+    from eth_tools.event_decoder import EventEncoder
+
+DEFAULT_LOGS_BATCH_SIZE = 10
+DEFAULT_LOGS_CONCURRENCY = 4
+DEFAULT_CHECKPOINT_INTERVAL = 60
+DEFAULT_CONFIRMATIONS = 12
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_BULK_WORKERS = 16
+DEFAULT_UNIT_BLOCKS = 100_000
+DEFAULT_GROUP_SIZE = 1
+
+OUTPUT_FORMATS = ["jsonl", "parquet", "store"]
+OUTPUT_EXTENSIONS = {"jsonl": ".jsonl.gz", "parquet": ".parquet", "store": ".sqlite3"}
+
+# fields returned as hex-encoded quantities by ``eth_getLogs``
+LOG_QUANTITY_FIELDS = {"blockNumber", "logIndex", "transactionIndex"}
+LOG_HASH_FIELDS = {"blockHash", "transactionHash"}
+
+
+def format_log(raw_log: dict) -> LogReceipt:
+    """Converts a raw ``eth_getLogs`` result to match the values
+    returned by ``web3.eth.getLogs``
+    """
+    log = dict(raw_log)
+    for key in LOG_QUANTITY_FIELDS & log.keys():
+        if log[key] is not None:
+            log[key] = int(log[key], 16)
+    for key in LOG_HASH_FIELDS & log.keys():
+        if log[key] is not None:
+            log[key] = HexBytes(log[key])
+    log["topics"] = [HexBytes(topic) for topic in log["topics"]]
+    log["address"] = Web3.toChecksumAddress(log["address"])
+    return AttributeDict(log)  # type: ignore
+
+
+def get_events_by_topic(contract: Contract) -> Dict[str, ContractEvent]:
+    """Returns the non-anonymous events of ``contract`` indexed by their topic"""
+    contract_events = [event() for event in contract.events]  # type: ignore
+    return {
+        event.build_filter().topics[0]: event
+        for event in contract_events
+        if not event.abi["anonymous"]
+    }
+
 
 @dataclass(repr=False)
 class FetchTask:
@@ -23,6 +89,7 @@ class FetchTask:
     start_block: int
     end_block: Optional[int] = None
     name: Optional[str] = None
+    events: Optional[List[str]] = None
 
     @property
     def checksum_address(self) -> Address:
@@ -49,21 +116,57 @@ class FetchTask:
             abi_path = path.join(abi_paths, abi_path)
         with smart_open(abi_path) as f:
             raw_task["abi"] = json.load(f)
-        keys = ["address", "abi", "start_block", "end_block", "name"]
+        keys = ["address", "abi", "start_block", "end_block", "name", "events"]
         return cls(**{k: raw_task.get(k) for k in keys})
 
 
 class ContractFetcher:
-    BLOCK_GRANULARITIES = [10_000, 1_000, 100, 10, 1]
+    """Fetches the events of a contract using adaptive block ranges
+    Logs are requested with ``eth_getLogs``, ``block_range`` blocks at a time,
+    and only logs of ``event_names`` are requested when given.
+    When ``batch_size`` is greater than 1, several consecutive block ranges are
+    requested in a single JSON-RPC batch request. When a request fails,
+    e.g. because the node limits the number of logs per response, only the failing
+    range is split in two and the block range is reduced accordingly.
+    After ``GROWTH_STREAK`` consecutive responses with less than
+    ``SMALL_RESPONSE_SIZE`` events, the block range is doubled again, up to
+    ``MAX_BLOCK_RANGE``.
+    When ``concurrency`` is greater than 1, up to ``concurrency`` requests are
+    run in parallel by an executor living as long as the fetcher, and at most
+    ``2 * concurrency`` requests are fetched ahead of the events being consumed.
+    If an ``engine`` is given, requests are sent by its event loop instead,
+    the worker threads waiting for their responses.
+    Events are always returned in order.
+    When ``raw`` is true, logs are returned without being decoded, so that
+    they can be decoded later, e.g. with ``eth_tools.event_decoder``.
+    """
 
-    def __init__(self, contract: Contract):
+    MAX_BLOCK_RANGE = 10_000
+    SMALL_RESPONSE_SIZE = 1_000
+    GROWTH_STREAK = 5
+
+    def __init__(
+        self,
+        contract: Contract,
+        event_names: Optional[List[str]] = None,
+        batch_size: int = 1,
+        concurrency: int = 1,
+        engine: Optional[AsyncEngine] = None,
+        raw: bool = False,
+    ):
         self.contract = contract
-        contract_events = [event() for event in self.contract.events]  # type: ignore
-        self.events_by_topic = {
-            event.build_filter().topics[0]: event
-            for event in contract_events
-            if not event.abi["anonymous"]
-        }
+        self.engine = engine
+        self.raw = raw
+        self.events_by_topic = get_events_by_topic(contract)
+        self.topics = self._get_topics(event_names)
+        self.batch_size = max(batch_size, 1)
+        self.concurrency = max(concurrency, 1)
+        self._rpc_client: Optional[RPCClient] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.block_range = self.MAX_BLOCK_RANGE
+        self.requests_count = 0
+        self._small_responses_streak = 0
 
     def process_log(self, event: LogReceipt) -> LogReceipt:
         topics = event.get("topics")
@@ -72,94 +175,975 @@ class ContractFetcher:
         return event
 
     def process_logs(self, events: List[LogReceipt]) -> List[LogReceipt]:
+        if self.raw:
+            return events
         return [self.process_log(event) for event in events]
 
-    def _fetch_events(self, start_block: int, end_block: int) -> Iterable[LogReceipt]:
-        event_filter = self.contract.web3.eth.filter(
-            FilterParams(
-                address=self.contract.address, fromBlock=start_block, toBlock=end_block
+    def _get_topics(self, event_names: Optional[List[str]]) -> Optional[list]:
+        if not event_names:
+            return None
+        topics_by_name = {
+            event.event_name: topic for topic, event in self.events_by_topic.items()
+        }
+        unknown_names = set(event_names) - topics_by_name.keys()
+        if unknown_names:
+            raise ValueError(
+                f"unknown events for {self.contract.address}: "
+                + ", ".join(sorted(unknown_names))
             )
+        return [[topics_by_name[name] for name in event_names]]
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        return self._executor
+
+    def close(self):
+        """Shuts down the worker threads of the fetcher"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def rpc_client(self) -> RPCClient:
+        if self._rpc_client is None:
+            self._rpc_client = RPCClient(self.contract.web3)
+        return self._rpc_client
+
+    def _filter_params(self, start_block: int, end_block: int) -> FilterParams:
+        filter_params = FilterParams(
+            address=self.contract.address, fromBlock=start_block, toBlock=end_block
+        )
+        if self.topics:
+            filter_params["topics"] = self.topics
+        return filter_params
+
+    def _fetch_events(self, start_block: int, end_block: int) -> List[LogReceipt]:
+        events = self.contract.web3.eth.getLogs(
+            self._filter_params(start_block, end_block)
         )
-        events = event_filter.get_all_entries()
         return self.process_logs(events)
 
-    def _fetch_batch_parallel(
-        self, start_blocks: List[int], end_blocks: List[int]
-    ) -> Iterable[LogReceipt]:
-        if len(start_blocks) == 1:
-            return self._fetch_events(start_blocks[0], end_blocks[0])
-        result = []
-        with ThreadPoolExecutor(max_workers=20) as executor:
-            for events in executor.map(self._fetch_events, start_blocks, end_blocks):
-                result.extend(events)
-        return result
-
-    def _fetch_batch(self, start_block: int, end_block: int) -> Iterable[LogReceipt]:
-        for granularity in self.BLOCK_GRANULARITIES:
-            block_count = end_block - start_block + 1
-            iterations = range(math.ceil(block_count / granularity))
-            start_blocks = [(start_block + i * granularity) for i in iterations]
-            end_blocks = [min(b + granularity - 1, end_block) for b in start_blocks]
-            try:
-                return self._fetch_batch_parallel(start_blocks, end_blocks)
-            except Exception:  # pylint: disable=broad-except
-                pass
-        raise ValueError(
-            f"unable to fetch events for {self.contract.address} "
-            f"from block {start_block} to {end_block}"
+    def _update_block_range(self, succeeded: bool, block_count: int, events_count=0):
+        with self._lock:
+            if not succeeded:
+                self.block_range = max(min(self.block_range, block_count // 2), 1)
+                self._small_responses_streak = 0
+            elif (
+                events_count >= self.SMALL_RESPONSE_SIZE
+                or block_count < self.block_range
+            ):
+                self._small_responses_streak = 0
+            else:
+                self._small_responses_streak += 1
+                if self._small_responses_streak >= self.GROWTH_STREAK:
+                    self.block_range = min(self.block_range * 2, self.MAX_BLOCK_RANGE)
+                    self._small_responses_streak = 0
+
+    def _split_failed_range(
+        self, start_block: int, end_block: int, error: Exception
+    ) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        block_count = end_block - start_block + 1
+        if block_count == 1:
+            raise ValueError(
+                f"unable to fetch events for {self.contract.address} "
+                f"from block {start_block} to {end_block}"
+            ) from error
+        self._update_block_range(False, block_count)
+        middle_block = start_block + block_count // 2 - 1
+        return (start_block, middle_block), (middle_block + 1, end_block)
+
+    def _refetch_failed_range(
+        self, start_block: int, end_block: int, error: Exception
+    ) -> List[LogReceipt]:
+        first_half, second_half = self._split_failed_range(
+            start_block, end_block, error
         )
+        return self._fetch_ranges([first_half]) + self._fetch_ranges([second_half])
+
+    def _count_requests(self, count: int):
+        with self._lock:
+            self.requests_count += count
+
+    def _fetch_batch(self, start_block: int, end_block: int) -> List[LogReceipt]:
+        self._count_requests(1)
+        try:
+            events = self._fetch_events(start_block, end_block)
+        except Exception as ex:  # pylint: disable=broad-except
+            return self._refetch_failed_range(start_block, end_block, ex)
+        self._update_block_range(True, end_block - start_block + 1, len(events))
+        return events
+
+    def _make_batch_request(
+        self, calls: List[RPCCall], raise_on_error: bool = True
+    ) -> list:
+        """Sends ``calls`` in a single batch request, through the event loop
+        of the engine when one is given
+        """
+        if self.engine is not None:
+            return self.engine.run(
+                self.engine.client.make_batch_request(
+                    calls, raise_on_error=raise_on_error
+                )
+            )
+        return self.rpc_client.make_batch_request(calls, raise_on_error=raise_on_error)
+
+    def _fetch_ranges(self, block_ranges: List[Tuple[int, int]]) -> List[LogReceipt]:
+        """Fetches all ``block_ranges`` using a single batch request
+        and splits the ranges which failed
+        """
+        if len(block_ranges) == 1 and self.engine is None:
+            return self._fetch_batch(*block_ranges[0])
+        calls = [self._get_logs_call(*block_range) for block_range in block_ranges]
+        self._count_requests(len(calls))
+        results = self._make_batch_request(calls, raise_on_error=False)
+        events = []
+        for (start_block, end_block), result in zip(block_ranges, results):
+            if isinstance(result, Exception):
+                events.extend(
+                    self._refetch_failed_range(start_block, end_block, result)
+                )
+                continue
+            self._update_block_range(True, end_block - start_block + 1, len(result))
+            events.extend(self.process_logs([format_log(log) for log in result]))
+        return events
+
+    def _get_logs_call(self, start_block: int, end_block: int) -> RPCCall:
+        filter_params = dict(self._filter_params(start_block, end_block))
+        filter_params.update(fromBlock=hex(start_block), toBlock=hex(end_block))
+        return ("eth_getLogs", [filter_params])
+
+    def _iterate_block_ranges(
+        self, start_block: int, end_block: int
+    ) -> Iterator[List[Tuple[int, int]]]:
+        """Yields the block ranges to fetch in each batch request
+        Ranges are computed lazily so that they use the latest block range
+        """
+        block_count = end_block - start_block + 1
+        batch_start_block = start_block
+        while batch_start_block <= end_block:
+            logger.info(
+                "%s progress: %s/%s",
+                self.contract.address,
+                batch_start_block - start_block,
+                block_count,
+            )
+            block_ranges = []
+            while (
+                len(block_ranges) < self.batch_size and batch_start_block <= end_block
+            ):
+                batch_end_block = min(
+                    batch_start_block + self.block_range - 1, end_block
+                )
+                block_ranges.append((batch_start_block, batch_end_block))
+                batch_start_block = batch_end_block + 1
+            yield block_ranges
+
+    def fetch_events_batches(
+        self, start_block: int, end_block: int
+    ) -> Iterator[Tuple[int, List[LogReceipt]]]:
+        """Yields, in order, the events of each batch of block ranges
+        together with the last block of the batch
+        """
+        all_block_ranges = self._iterate_block_ranges(start_block, end_block)
+        if self.concurrency == 1:
+            for block_ranges in all_block_ranges:
+                yield block_ranges[-1][1], self._fetch_ranges(block_ranges)
+            return
+
+        max_pending = 2 * self.concurrency
+        pending: Deque[Tuple[int, Future]] = deque()
+        try:
+            for block_ranges in all_block_ranges:
+                future = self.executor.submit(self._fetch_ranges, block_ranges)
+                pending.append((block_ranges[-1][1], future))
+                if len(pending) >= max_pending:
+                    last_block, future = pending.popleft()
+                    yield last_block, future.result()
+            while pending:
+                last_block, future = pending.popleft()
+                yield last_block, future.result()
+        finally:
+            for _last_block, future in pending:
+                future.cancel()
+
+    def _get_block_headers(
+        self, blocks: List[int]
+    ) -> Dict[int, Optional[Tuple[HexBytes, HexBytes]]]:
+        """Returns the hash and parent hash of each of the ``blocks``
+        fetched with a single batch request
+        """
+        calls = [("eth_getBlockByNumber", [hex(block), False]) for block in blocks]
+        results = self._make_batch_request(calls)
+        return {
+            block: (
+                (HexBytes(result["hash"]), HexBytes(result["parentHash"]))
+                if result
+                else None
+            )
+            for block, result in zip(blocks, results)
+        }
+
+    def _get_block_hashes(self, blocks: List[int]) -> Dict[int, Optional[HexBytes]]:
+        return {
+            block: header[0] if header else None
+            for block, header in self._get_block_headers(blocks).items()
+        }
+
+    def _find_reorged_block(
+        self,
+        unconfirmed: "OrderedDict[int, Tuple[HexBytes, List[LogReceipt]]]",
+        last_confirmed: Optional[Tuple[int, HexBytes]],
+    ) -> Optional[int]:
+        """Returns the first unconfirmed block of which the hash changed
+        Buffered blocks are chained by their parent hash, so only the hash of
+        the last one is fetched unless it changed.
+        """
+        known_hashes = {
+            block: block_hash for block, (block_hash, _) in unconfirmed.items()
+        }
+        if last_confirmed is not None:
+            known_hashes[last_confirmed[0]] = last_confirmed[1]
+        if not known_hashes:
+            return None
+        last_block = max(known_hashes)
+        hashes = self._get_block_hashes([last_block])
+        if hashes[last_block] == known_hashes[last_block]:
+            return None
+        hashes = self._get_block_hashes(sorted(known_hashes))
+        if (
+            last_confirmed is not None
+            and hashes[last_confirmed[0]] != last_confirmed[1]
+        ):
+            raise ValueError(
+                f"block {last_confirmed[0]} was reorganized after being confirmed"
+            )
+        for block, (block_hash, _events) in unconfirmed.items():
+            if hashes[block] != block_hash:
+                return block
+        return None
+
+    def _fetch_unconfirmed_blocks(
+        self, start_block: int, end_block: int, parent_hash: Optional[HexBytes]
+    ) -> Iterator[Tuple[int, HexBytes, List[LogReceipt]]]:
+        """Yields each block from ``start_block`` to ``end_block`` with its hash and
+        events, up to the first block which changed while it was being fetched
+        or which is not the child of the previous block, the block before
+        ``start_block`` being expected to have the hash ``parent_hash``
+        """
+        blocks = list(range(start_block, end_block + 1))
+        events = list(self.fetch_events(start_block, end_block))
+        headers = self._get_block_headers(blocks)
+        events_by_block: Dict[int, List[LogReceipt]] = {}
+        for event in events:
+            events_by_block.setdefault(event["blockNumber"], []).append(event)
+        for block in blocks:
+            header = headers[block]
+            if header is None:
+                return
+            block_hash, block_parent_hash = header
+            block_events = events_by_block.get(block, [])
+            if (parent_hash is not None and block_parent_hash != parent_hash) or any(
+                event["blockHash"] != block_hash for event in block_events
+            ):
+                return
+            yield block, block_hash, block_events
+            parent_hash = block_hash
+
+    def follow_events_batches(
+        self,
+        start_block: int,
+        confirmations: int = DEFAULT_CONFIRMATIONS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ) -> Iterator[Tuple[int, List[LogReceipt]]]:
+        """Same as ``fetch_events_batches`` but never stops: the head of the
+        chain is polled every ``poll_interval`` seconds to fetch the new blocks.
+        Events of the last ``confirmations`` blocks are buffered together with
+        the hash of their block and yielded once the block is confirmed.
+        When the hash of a buffered block changes, the events from this block
+        on are discarded and fetched again. A ``ValueError`` is raised if the
+        last confirmed block is reorganized.
+        """
+        next_block = start_block
+        unconfirmed: "OrderedDict[int, Tuple[HexBytes, List[LogReceipt]]]"
+        unconfirmed = OrderedDict()
+        last_confirmed: Optional[Tuple[int, HexBytes]] = None
+        while True:
+            head = self.contract.web3.eth.blockNumber
+            confirmed_block = head - confirmations
+
+            reorged_block = self._find_reorged_block(unconfirmed, last_confirmed)
+            if reorged_block is not None:
+                logger.warning(
+                    "%s: block %s was reorganized, fetching events again",
+                    self.contract.address,
+                    reorged_block,
+                )
+                for block in range(reorged_block, next_block):
+                    unconfirmed.pop(block, None)
+                next_block = reorged_block
+
+            confirmed_events: List[LogReceipt] = []
+            confirmed_count = 0
+            while unconfirmed and next(iter(unconfirmed)) <= confirmed_block:
+                block, (block_hash, events) = unconfirmed.popitem(last=False)
+                confirmed_events.extend(events)
+                confirmed_count += 1
+                last_confirmed = (block, block_hash)
+            if confirmed_count > 0:
+                yield block, confirmed_events
+
+            if next_block <= confirmed_block:
+                yield from self.fetch_events_batches(next_block, confirmed_block)
+                block_hash = self._get_block_hashes([confirmed_block])[confirmed_block]
+                last_confirmed = (confirmed_block, block_hash)
+                next_block = confirmed_block + 1
+
+            if next_block > head:
+                time.sleep(poll_interval)
+                continue
+            parent_hash = None
+            if unconfirmed:
+                parent_hash = next(reversed(unconfirmed.values()))[0]
+            elif last_confirmed is not None:
+                parent_hash = last_confirmed[1]
+            for block, block_hash, events in self._fetch_unconfirmed_blocks(
+                next_block, head, parent_hash
+            ):
+                unconfirmed[block] = (block_hash, events)
+                next_block = block + 1
 
     def fetch_events(
         self, start_block: int, end_block: int = None
     ) -> Iterator[LogReceipt]:
         if end_block is None:
             end_block = self.contract.web3.eth.blockNumber
+        for _last_block, events in self.fetch_events_batches(start_block, end_block):
+            yield from events
 
-        block_count = end_block - start_block + 1
-        granularity = self.BLOCK_GRANULARITIES[0]
 
-        for i in range(math.ceil(block_count / granularity)):
-            logger.info(
-                "%s progress: %s/%s",
-                self.contract.address,
-                i * granularity,
-                block_count,
+class MultiContractFetcher(ContractFetcher):
+    """Fetches the events of several contracts with a single ``eth_getLogs``
+    filter per block range, each log being decoded by the fetcher of the
+    contract which emitted it. All the fetchers must filter the same topics.
+    """
+
+    def __init__(
+        self,
+        fetchers: List[ContractFetcher],
+        batch_size: int = 1,
+        concurrency: int = 1,
+        engine: Optional[AsyncEngine] = None,
+        raw: bool = False,
+    ):
+        super().__init__(
+            fetchers[0].contract,
+            batch_size=batch_size,
+            concurrency=concurrency,
+            engine=engine,
+            raw=raw,
+        )
+        self.topics = fetchers[0].topics
+        self.fetchers = {
+            fetcher.contract.address.lower(): fetcher for fetcher in fetchers
+        }
+        self.addresses = [
+            fetcher.contract.address for fetcher in self.fetchers.values()
+        ]
+
+    def process_log(self, event: LogReceipt) -> LogReceipt:
+        return self.fetchers[event["address"].lower()].process_log(event)
+
+    def _filter_params(self, start_block: int, end_block: int) -> FilterParams:
+        filter_params = super()._filter_params(start_block, end_block)
+        filter_params["address"] = self.addresses
+        return filter_params
+
+
+class TaskWriter:
+    """Writes the events of a ``FetchTask`` to ``output_file``
+    Local ``.jsonl`` and ``.jsonl.gz`` outputs are checkpointed at most every
+    ``checkpoint_interval`` seconds and, when ``resume`` is true, appended
+    to from their last checkpoint. With ``output_format="store"``, events are
+    written to the ``EventStore`` at ``output_file`` under the name of the task
+    and resumed in the same way. ``start_block`` is the first block of
+    which the events still need to be written.
+    When an ``encoder`` is given, JSON outputs receive raw logs which are
+    decoded, unless ``raw`` is true, serialized and compressed by the worker
+    processes of the encoder, with at most ``2 * encoder.processes`` batches
+    in flight, and written in order.
+    """
+
+    def __init__(
+        self,
+        task: FetchTask,
+        output_file: str,
+        resume: bool = False,
+        output_format: str = "jsonl",
+        raw: bool = False,
+        checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+        encoder: Optional["EventEncoder"] = None,
+    ):
+        self.checkpoint_interval = checkpoint_interval
+        self.start_block = task.start_block
+        self._parquet_writer: Optional[ParquetWriter] = None
+        self._checkpointed_writer: Optional[CheckpointedWriter] = None
+        self._event_store: Optional[EventStore] = None
+        self._store_writer: Optional[EventStoreWriter] = None
+        self._file: Optional[IO[str]] = None
+        if output_format == "store":
+            self._event_store = EventStore(output_file)
+            self._store_writer = self._event_store.writer(
+                task.display_name, task.address, task.start_block, resume=resume
             )
-            batch_start_block = start_block + i * granularity
-            batch_end_block = min(batch_start_block + granularity - 1, end_block)
-            yield from self._fetch_batch(batch_start_block, batch_end_block)
+            self.start_block = self._store_writer.last_block + 1
+            encoder = None
+        elif output_format == "parquet":
+            if resume:
+                raise ValueError(
+                    f"cannot resume {output_file}: Parquet files have no checkpoints"
+                )
+            columns = event_columns(task.abi, task.events, raw=raw)
+            self._parquet_writer = ParquetWriter(output_file, columns)
+            encoder = None
+        elif CheckpointedWriter.supports(output_file):
+            self._checkpointed_writer = CheckpointedWriter(
+                output_file, task.address, task.start_block, resume=resume
+            )
+            self.start_block = self._checkpointed_writer.last_block + 1
+        else:
+            if resume:
+                raise ValueError(
+                    f"cannot resume {output_file}: only local "
+                    ".jsonl and .jsonl.gz files are supported"
+                )
+            self._file = smart_open(output_file, "w")
+        self._encoder = encoder
+        self._abi = None if raw else task.abi
+        self._pending: Deque[Tuple[int, Optional[Future]]] = deque()
+        self._last_commit_time = time.time()
+
+    def _commit(self, last_block: int):
+        if self._checkpointed_writer is not None:
+            self._checkpointed_writer.commit(last_block)
+        elif self._store_writer is not None:
+            self._store_writer.commit(last_block)
+
+    def _commit_if_due(self, last_block: int):
+        if time.time() - self._last_commit_time >= self.checkpoint_interval:
+            self._commit(last_block)
+            self._last_commit_time = time.time()
+
+    def _write_next_encoded(self):
+        last_block, future = self._pending.popleft()
+        if future is not None:
+            if self._checkpointed_writer is not None:
+                self._checkpointed_writer.write_encoded(future.result())
+            else:
+                assert self._file is not None
+                self._file.write(future.result().decode())
+        self._commit_if_due(last_block)
+
+    def write(self, events: List[LogReceipt], last_block: int):
+        """Writes the ``events`` of all the blocks up to ``last_block``"""
+        if self._encoder is not None:
+            future = None
+            if events:
+                compress = bool(
+                    self._checkpointed_writer and self._checkpointed_writer.compress
+                )
+                future = self._encoder.submit(events, self._abi, compress)
+            self._pending.append((last_block, future))
+            while len(self._pending) > 2 * self._encoder.processes:
+                self._write_next_encoded()
+        elif self._parquet_writer is not None:
+            for event in events:
+                self._parquet_writer.write(event_to_row(event))
+        elif self._file is not None:
+            self._file.writelines(to_json(event) + "\n" for event in events)
+        elif self._store_writer is not None:
+            for event in events:
+                self._store_writer.write(event)
+            self._commit_if_due(last_block)
+        else:
+            assert self._checkpointed_writer is not None
+            for event in events:
+                self._checkpointed_writer.write(to_json(event))
+            self._commit_if_due(last_block)
+
+    def finish(self, end_block: int):
+        """Marks all the events up to ``end_block`` as written"""
+        while self._pending:
+            self._write_next_encoded()
+        self._commit(end_block)
+
+    def close(self):
+        """Closes the output, events still being encoded are dropped"""
+        for _last_block, future in self._pending:
+            if future is not None:
+                future.cancel()
+        self._pending.clear()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif self._file is not None:
+            self._file.close()
+        elif self._event_store is not None:
+            assert self._store_writer is not None
+            self._store_writer.close()
+            self._event_store.close()
+        else:
+            assert self._checkpointed_writer is not None
+            self._checkpointed_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+
+@dataclass
+class BulkTask:
+    """Tasks fetched together by ``EventFetcher.fetch_all_events``, split into
+    work units of ``unit_blocks`` blocks. Fetched units are kept in ``results``
+    until all the previous units are written, and the events of each unit are
+    written to the tasks whose block range overlaps it.
+    """
+
+    tasks: List[FetchTask]
+    end_blocks: List[int]
+    writers: List[TaskWriter]
+    fetcher: ContractFetcher
+    unit_blocks: int
+    results: Dict[int, List[LogReceipt]] = field(default_factory=dict)
+    written_count: int = 0
+    failed: bool = False
+    errors: Dict[str, Exception] = field(default_factory=dict)
+    start_block: int = field(init=False, default=0)
+    end_block: int = field(init=False, default=-1)
+    units_count: int = field(init=False, default=0)
+    _indexes_by_address: Dict[str, List[int]] = field(init=False, default_factory=dict)
+    _open_indexes: Set[int] = field(init=False, default_factory=set)
+
+    def __post_init__(self):
+        for index, task in enumerate(self.tasks):
+            indexes = self._indexes_by_address.setdefault(task.address.lower(), [])
+            indexes.append(index)
+        self._open_indexes.update(range(len(self.tasks)))
+
+    def start(self):
+        """Finishes the tasks which have no blocks left to fetch
+        and splits the block range of the others into work units
+        """
+        for index, writer in enumerate(self.writers):
+            if writer.start_block > self.end_blocks[index]:
+                self._finish(index)
+        if not self._open_indexes:
+            return
+        self.start_block = min(
+            self.writers[index].start_block for index in self._open_indexes
+        )
+        self.end_block = max(self.end_blocks[index] for index in self._open_indexes)
+        block_count = self.end_block - self.start_block + 1
+        self.units_count = math.ceil(block_count / self.unit_blocks)
+
+    def unit_range(self, unit_index: int) -> Tuple[int, int]:
+        start_block = self.start_block + unit_index * self.unit_blocks
+        return start_block, min(start_block + self.unit_blocks - 1, self.end_block)
+
+    def _finish(self, index: int):
+        self.writers[index].finish(self.end_blocks[index])
+        self.writers[index].close()
+        self._open_indexes.discard(index)
+        task = self.tasks[index]
+        logger.info("completed to process %s (%s)", task.name, task.address)
+
+    def _write_unit(self, unit_index: int, events: List[LogReceipt]):
+        start_block, end_block = self.unit_range(unit_index)
+        events_by_index: Dict[int, List[LogReceipt]] = {
+            index: [] for index in self._open_indexes
+        }
+        for event in events:
+            for index in self._indexes_by_address[event["address"].lower()]:
+                if index in events_by_index:
+                    events_by_index[index].append(event)
+        for index, task_events in events_by_index.items():
+            writer, task_end_block = self.writers[index], self.end_blocks[index]
+            if end_block < writer.start_block or start_block > task_end_block:
+                continue
+            if start_block < writer.start_block or end_block > task_end_block:
+                task_events = [
+                    event
+                    for event in task_events
+                    if writer.start_block <= event["blockNumber"] <= task_end_block
+                ]
+            writer.write(task_events, min(end_block, task_end_block))
+            if end_block >= task_end_block:
+                self._finish(index)
+
+    def write_fetched_units(self) -> int:
+        """Writes the fetched units following the last written one
+        and returns the number of units written
+        """
+        written_count = self.written_count
+        while self.written_count in self.results:
+            self._write_unit(self.written_count, self.results.pop(self.written_count))
+            self.written_count += 1
+        return self.written_count - written_count
+
+    def fail(self, error: Exception) -> int:
+        """Stops fetching the tasks and returns the number of units dropped"""
+        for index in sorted(self._open_indexes):
+            task = self.tasks[index]
+            logger.error(
+                "failed to process %s (%s): %s", task.name, task.address, error
+            )
+            self.errors[task.display_name] = error
+        self.failed = True
+        dropped_count = len(self.results)
+        self.results.clear()
+        self.close()
+        return dropped_count
+
+    def close(self):
+        for index in self._open_indexes:
+            self.writers[index].close()
+        self._open_indexes.clear()
+        self.fetcher.close()
 
 
 class EventFetcher:
-    def __init__(self, web3: Web3):
+    """Fetches and persists the events of ``FetchTask``
+    When persisting events to a local ``.jsonl`` or ``.jsonl.gz`` file, a
+    checkpoint is written at most every ``checkpoint_interval`` seconds, which
+    allows to resume fetching from the last checkpoint after a failure.
+    With ``output_format="parquet"``, events are written to a Parquet file
+    with one column per event argument instead, without checkpoints, and with
+    ``output_format="store"`` to an ``EventStore``, see ``TaskWriter``.
+    When ``raw`` is true, logs are persisted without being decoded.
+    ``confirmations`` and ``poll_interval`` are used when following new blocks,
+    see ``ContractFetcher.follow_events_batches``, and ``workers``, ``unit_blocks``
+    and ``group_size`` when fetching several tasks, see ``fetch_all_events``.
+    With an ``encoder``, JSON outputs are decoded, serialized and compressed
+    by its worker processes instead of the fetching threads, see ``TaskWriter``.
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        batch_size: int = 1,
+        concurrency: int = 1,
+        checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+        engine: Optional[AsyncEngine] = None,
+        raw: bool = False,
+        confirmations: int = DEFAULT_CONFIRMATIONS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        workers: int = DEFAULT_BULK_WORKERS,
+        unit_blocks: int = DEFAULT_UNIT_BLOCKS,
+        group_size: int = DEFAULT_GROUP_SIZE,
+        encoder: Optional["EventEncoder"] = None,
+    ):
         self.web3 = web3
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.checkpoint_interval = checkpoint_interval
+        self.engine = engine
+        self.raw = raw
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.workers = max(workers, 1)
+        self.unit_blocks = max(unit_blocks, 1)
+        self.group_size = max(group_size, 1)
+        self.encoder = encoder
 
-    def fetch_events(self, task: FetchTask) -> Iterator[LogReceipt]:
+    def _fetches_raw(self, output_format: str) -> bool:
+        """Logs written by the encoder are decoded in its worker processes"""
+        return self.raw or (self.encoder is not None and output_format == "jsonl")
+
+    def _make_fetcher(
+        self, task: FetchTask, concurrency: int, raw: Optional[bool] = None
+    ) -> ContractFetcher:
         contract = self.web3.eth.contract(address=task.checksum_address, abi=task.abi)
-        fetcher = ContractFetcher(contract)
-        return fetcher.fetch_events(task.start_block, task.end_block)
-
-    def fetch_and_persist_events(self, task: FetchTask, output_file: str):
-        with smart_open(output_file, "w") as f:
-            for event in self.fetch_events(task):
-                print(json.dumps(event, cls=EthJSONEncoder), file=f)
-
-    def fetch_all_events(self, fetch_tasks: List[FetchTask], output_directory: str):
-        with ThreadPoolExecutor() as executor:
-            filepaths = [
-                path.join(output_directory, task.display_name) + ".jsonl.gz"
-                for task in fetch_tasks
-            ]
-            futures = {
-                executor.submit(self.fetch_and_persist_events, task, output): task
-                for task, output in zip(fetch_tasks, filepaths)
-            }
-            for future in as_completed(futures):
-                task = futures[future]
-                ex = future.exception()
-                if ex:
-                    logger.error(
-                        "failed to process %s (%s): %s", task.name, task.address, ex
+        return ContractFetcher(
+            contract,
+            task.events,
+            batch_size=self.batch_size,
+            concurrency=concurrency,
+            engine=self.engine,
+            raw=self.raw if raw is None else raw,
+        )
+
+    @contextmanager
+    def _create_fetcher(
+        self, task: FetchTask, raw: Optional[bool] = None
+    ) -> Iterator[ContractFetcher]:
+        fetcher = self._make_fetcher(task, self.concurrency, raw)
+        try:
+            yield fetcher
+        finally:
+            fetcher.close()
+
+    def _create_writer(
+        self, task: FetchTask, output_file: str, resume: bool, output_format: str
+    ) -> TaskWriter:
+        return TaskWriter(
+            task,
+            output_file,
+            resume=resume,
+            output_format=output_format,
+            raw=self.raw,
+            checkpoint_interval=self.checkpoint_interval,
+            encoder=self.encoder,
+        )
+
+    def fetch_events(self, task: FetchTask) -> Iterator[LogReceipt]:
+        with self._create_fetcher(task) as fetcher:
+            yield from fetcher.fetch_events(task.start_block, task.end_block)
+
+    def fetch_and_persist_events(
+        self,
+        task: FetchTask,
+        output_file: str,
+        resume: bool = False,
+        output_format: str = "jsonl",
+    ):
+        raw = self._fetches_raw(output_format)
+        with self._create_writer(
+            task, output_file, resume, output_format
+        ) as writer, self._create_fetcher(task, raw) as fetcher:
+            start_block = writer.start_block
+            end_block = task.end_block
+            if end_block is None:
+                end_block = self.web3.eth.blockNumber
+            if start_block > end_block:
+                logger.info("%s already fetched up to block %s", task, end_block)
+                return
+            if start_block > task.start_block:
+                logger.info("resuming %s from block %s", task, start_block)
+
+            batches = fetcher.fetch_events_batches(start_block, end_block)
+            for last_block, events in batches:
+                writer.write(events, last_block)
+            writer.finish(end_block)
+
+    def follow_and_persist_events(
+        self, task: FetchTask, output_file: str, resume: bool = False
+    ):
+        """Same as ``fetch_and_persist_events`` but never stops and keeps
+        appending the events of new blocks once they are confirmed.
+        Events are written as jsonl, and a checkpoint is written after
+        every batch of events.
+        """
+        if task.end_block is not None:
+            raise ValueError(f"cannot follow {task} up to an end block")
+        if not CheckpointedWriter.supports(output_file):
+            raise ValueError(
+                f"cannot follow events in {output_file}: only local "
+                ".jsonl and .jsonl.gz files are supported"
+            )
+        raw = self._fetches_raw("jsonl")
+        with self._create_writer(
+            task, output_file, resume, "jsonl"
+        ) as writer, self._create_fetcher(task, raw) as fetcher:
+            start_block = writer.start_block
+            if start_block > task.start_block:
+                logger.info("resuming %s from block %s", task, start_block)
+            batches = fetcher.follow_events_batches(
+                start_block, self.confirmations, self.poll_interval
+            )
+            for last_block, events in batches:
+                writer.write(events, last_block)
+                writer.finish(last_block)
+
+    def _group_tasks(
+        self, fetch_tasks: List[FetchTask]
+    ) -> Tuple[List[List[int]], List[int]]:
+        """Groups the indexes of tasks filtering the same events and with
+        overlapping block ranges, with at most ``group_size`` tasks per group,
+        and returns the groups and the end block of each task
+        """
+        head = None
+        end_blocks = []
+        tasks_by_topics: Dict[str, List[int]] = {}
+        for index, task in enumerate(fetch_tasks):
+            end_block = task.end_block
+            if end_block is None:
+                if head is None:
+                    head = self.web3.eth.blockNumber
+                end_block = head
+            end_blocks.append(end_block)
+            topics = None
+            if task.events:
+                topics = self._make_fetcher(task, 1).topics
+            tasks_by_topics.setdefault(json.dumps(topics), []).append(index)
+
+        groups: List[List[int]] = []
+        for indexes in tasks_by_topics.values():
+            indexes.sort(key=lambda index: fetch_tasks[index].start_block)
+            group: List[int] = []
+            group_end_block = -1
+            for index in indexes:
+                if group and (
+                    len(group) >= self.group_size
+                    or fetch_tasks[index].start_block > group_end_block
+                ):
+                    groups.append(group)
+                    group = []
+                group.append(index)
+                group_end_block = max(group_end_block, end_blocks[index])
+            groups.append(group)
+        return groups, end_blocks
+
+    def _open_bulk_task(
+        self,
+        fetch_tasks: List[FetchTask],
+        end_blocks: List[int],
+        filepaths: List[str],
+        resume: bool,
+        output_format: str,
+        errors: Dict[str, Exception],
+    ) -> Optional[BulkTask]:
+        tasks, task_end_blocks, writers = [], [], []
+        for task, end_block, output_file in zip(fetch_tasks, end_blocks, filepaths):
+            try:
+                writer = self._create_writer(task, output_file, resume, output_format)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.error(
+                    "failed to process %s (%s): %s", task.name, task.address, ex
+                )
+                errors[task.display_name] = ex
+                continue
+            if writer.start_block > task.start_block:
+                logger.info("resuming %s from block %s", task, writer.start_block)
+            tasks.append(task)
+            task_end_blocks.append(end_block)
+            writers.append(writer)
+        if not tasks:
+            return None
+        raw = self._fetches_raw(output_format)
+        fetchers = [self._make_fetcher(task, 1, raw) for task in tasks]
+        fetcher = fetchers[0]
+        if len(fetchers) > 1:
+            fetcher = MultiContractFetcher(
+                fetchers, self.batch_size, engine=self.engine, raw=raw
+            )
+        return BulkTask(tasks, task_end_blocks, writers, fetcher, self.unit_blocks)
+
+    def _iterate_work_units(
+        self,
+        fetch_tasks: List[FetchTask],
+        filepaths: List[str],
+        resume: bool,
+        output_format: str,
+        bulk_tasks: List[BulkTask],
+        errors: Dict[str, Exception],
+    ) -> Iterator[Tuple[BulkTask, int]]:
+        """Yields ``(bulk_task, unit_index)`` for each work unit
+        Tasks are opened lazily, when the first unit of their group is needed,
+        and appended to ``bulk_tasks``. Units of groups which failed are skipped
+        and tasks which could not be opened are added to ``errors``.
+        """
+        groups, end_blocks = self._group_tasks(fetch_tasks)
+        for group in groups:
+            bulk_task = self._open_bulk_task(
+                [fetch_tasks[index] for index in group],
+                [end_blocks[index] for index in group],
+                [filepaths[index] for index in group],
+                resume,
+                output_format,
+                errors,
+            )
+            if bulk_task is None:
+                continue
+            bulk_tasks.append(bulk_task)
+            bulk_task.start()
+            for unit_index in range(bulk_task.units_count):
+                if bulk_task.failed:
+                    break
+                yield bulk_task, unit_index
+
+    @staticmethod
+    def _fetch_work_unit(bulk_task: BulkTask, unit_index: int) -> List[LogReceipt]:
+        start_block, end_block = bulk_task.unit_range(unit_index)
+        return list(bulk_task.fetcher.fetch_events(start_block, end_block))
+
+    @staticmethod
+    def _complete_work_units(
+        done: Iterable[Future], pending: Dict[Future, Tuple[BulkTask, int]]
+    ) -> int:
+        """Writes the events of the ``done`` units and returns the number
+        of units written or dropped because their tasks failed
+        """
+        completed_count = 0
+        for future in done:
+            bulk_task, unit_index = pending.pop(future)
+            if bulk_task.failed:
+                completed_count += 1
+                continue
+            ex = future.exception()
+            if ex is not None:
+                completed_count += 1 + bulk_task.fail(ex)
+                continue
+            bulk_task.results[unit_index] = future.result()
+            completed_count += bulk_task.write_fetched_units()
+        return completed_count
+
+    def fetch_all_events(
+        self,
+        fetch_tasks: List[FetchTask],
+        output_directory: str,
+        resume=False,
+        output_format: str = "jsonl",
+    ) -> Dict[str, Exception]:
+        """Fetches the events of all the ``fetch_tasks`` using ``workers`` threads
+        Each task is split into work units of ``unit_blocks`` blocks, fetched
+        from a single queue shared by all the workers, so that idle workers
+        help with the busiest contracts instead of waiting for them.
+        Units are queued task after task and written in order by the calling
+        thread, with at most ``2 * workers`` units fetched ahead of the
+        units being written.
+        Tasks filtering the same events and with overlapping block ranges are
+        grouped by up to ``group_size`` tasks, and the logs of a group are
+        fetched with a single ``eth_getLogs`` filter on all its addresses.
+        Returns the errors of the tasks which failed, by display name.
+        """
+        extension = OUTPUT_EXTENSIONS[output_format]
+        filepaths = [
+            path.join(output_directory, task.display_name) + extension
+            for task in fetch_tasks
+        ]
+        if output_format == "store":
+            # all the tasks are written to a single store
+            store_file = path.join(output_directory, EVENT_STORE_FILENAME)
+            filepaths = [store_file] * len(fetch_tasks)
+        bulk_tasks: List[BulkTask] = []
+        errors: Dict[str, Exception] = {}
+        units = self._iterate_work_units(
+            fetch_tasks, filepaths, resume, output_format, bulk_tasks, errors
+        )
+        max_unwritten = 2 * self.workers
+        unwritten_count = 0
+        pending: Dict[Future, Tuple[BulkTask, int]] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for bulk_task, unit_index in units:
+                    future = executor.submit(
+                        self._fetch_work_unit, bulk_task, unit_index
                     )
-                else:
-                    logger.info("completed to process %s (%s)", task.name, task.address)
+                    pending[future] = (bulk_task, unit_index)
+                    unwritten_count += 1
+                    while pending and unwritten_count >= max_unwritten:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        unwritten_count -= self._complete_work_units(done, pending)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self._complete_work_units(done, pending)
+            finally:
+                for future in pending:
+                    future.cancel()
+                for bulk_task in bulk_tasks:
+                    bulk_task.close()
+        for bulk_task in bulk_tasks:
+            errors.update(bulk_task.errors)
+        return errors
@@ -0,0 +1,333 @@
+import heapq
+import json
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from os import path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from web3.types import HexBytes
+
+from eth_tools.checkpoint import CHECKPOINT_SUFFIX, Checkpoint
+from eth_tools.json_encoder import to_json
+from eth_tools.logger import logger
+from eth_tools.utils import smart_open
+
+DEFAULT_CHUNK_EVENTS = 1_000
+EVENT_STORE_FILENAME = "events.sqlite3"
+EVENT_STORE_COMPRESS_LEVEL = 6
+
+
+def event_key(event: dict) -> Tuple[str, str]:
+    """Returns the ``(address, event)`` under which ``event`` is indexed:
+    its lowercase address and its name, or its first topic for raw logs
+    """
+    name = event.get("event")
+    if name is None:
+        topics = event.get("topics")
+        name = HexBytes(topics[0]).hex() if topics else ""
+    return event["address"].lower(), name
+
+
+class EventStore:
+    """Events stored in a single SQLite database, indexed by contract address,
+    event name, or first topic for raw logs, and block number.
+    Events of each contract and event are stored in compressed chunks of up to
+    ``chunk_events`` events, so that queries only decompress the chunks of the
+    contracts and events requested overlapping the requested blocks.
+    The progress of each writer is recorded with its chunks, see ``writer``.
+    """
+
+    def __init__(self, filepath: str, chunk_events: int = DEFAULT_CHUNK_EVENTS):
+        self.filepath = filepath
+        self.chunk_events = chunk_events
+        self._connection = sqlite3.connect(filepath, timeout=60, isolation_level=None)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY,"
+            " task TEXT NOT NULL,"
+            " address TEXT NOT NULL,"
+            " event TEXT NOT NULL,"
+            " start_block INTEGER NOT NULL,"
+            " end_block INTEGER NOT NULL,"
+            " events_count INTEGER NOT NULL,"
+            " data BLOB NOT NULL"
+            ")"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_event "
+            "ON chunks (address, event, start_block)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_task ON chunks (task, start_block)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " name TEXT PRIMARY KEY,"
+            " address TEXT NOT NULL,"
+            " start_block INTEGER NOT NULL,"
+            " last_block INTEGER NOT NULL"
+            ")"
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def writer(
+        self, task: str, address: str, start_block: int, resume: bool = False
+    ) -> "EventStoreWriter":
+        return EventStoreWriter(self, task, address, start_block, resume=resume)
+
+    def _insert_chunks(self, task: str, chunks: Iterable[Tuple[str, str, List[str]]]):
+        rows = [
+            (
+                task,
+                address,
+                event,
+                json.loads(lines[0])["blockNumber"],
+                json.loads(lines[-1])["blockNumber"],
+                len(lines),
+                zlib.compress("\n".join(lines).encode(), EVENT_STORE_COMPRESS_LEVEL),
+            )
+            for address, event, lines in chunks
+        ]
+        self._connection.executemany(
+            "INSERT INTO chunks (task, address, event, start_block, end_block,"
+            " events_count, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def _select_chunks(
+        self,
+        addresses: Optional[List[str]],
+        events: Optional[List[str]],
+        start_block: Optional[int],
+        end_block: Optional[int],
+    ) -> Dict[Tuple[str, str, str], List[int]]:
+        """Returns the IDs of the matching chunks, ordered by block, grouped
+        by the task, contract and event they were written by
+        """
+        conditions, params = [], []
+        if addresses:
+            conditions.append(f"address IN ({', '.join('?' * len(addresses))})")
+            params += [address.lower() for address in addresses]
+        if events:
+            conditions.append(f"event IN ({', '.join('?' * len(events))})")
+            params += events
+        if start_block is not None:
+            conditions.append("end_block >= ?")
+            params.append(start_block)
+        if end_block is not None:
+            conditions.append("start_block <= ?")
+            params.append(end_block)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection.execute(
+            f"SELECT id, task, address, event FROM chunks {where} "
+            "ORDER BY task, address, event, start_block, id",
+            params,
+        ).fetchall()
+        chunk_ids: Dict[Tuple[str, str, str], List[int]] = defaultdict(list)
+        for chunk_id, task, address, event in rows:
+            chunk_ids[(task, address, event)].append(chunk_id)
+        return chunk_ids
+
+    def _iterate_chunks(
+        self,
+        chunk_ids: List[int],
+        start_block: Optional[int],
+        end_block: Optional[int],
+    ) -> Iterator[Tuple[Tuple[int, int], str, dict]]:
+        for chunk_id in chunk_ids:
+            (data,) = self._connection.execute(
+                "SELECT data FROM chunks WHERE id = ?", (chunk_id,)
+            ).fetchone()
+            for line in zlib.decompress(data).decode().split("\n"):
+                event = json.loads(line)
+                block_number = event["blockNumber"]
+                if start_block is not None and block_number < start_block:
+                    continue
+                if end_block is not None and block_number > end_block:
+                    return
+                yield (block_number, event.get("logIndex") or 0), line, event
+
+    def _query(
+        self,
+        addresses: Optional[List[str]],
+        events: Optional[List[str]],
+        start_block: Optional[int],
+        end_block: Optional[int],
+    ) -> Iterator[Tuple[str, dict]]:
+        """Yields the JSON line and the parsed event of the matching events,
+        skipping the events also written by another task
+        """
+        chunk_ids = self._select_chunks(addresses, events, start_block, end_block)
+        streams = [
+            self._iterate_chunks(ids, start_block, end_block)
+            for ids in chunk_ids.values()
+        ]
+        previous_key = None
+        addresses_seen: Set[str] = set()
+        for key, line, event in heapq.merge(*streams, key=lambda item: item[0]):
+            # duplicates have the same block and log index, so they are adjacent
+            if key != previous_key:
+                previous_key = key
+                addresses_seen.clear()
+            address = event["address"].lower()
+            if address in addresses_seen:
+                continue
+            addresses_seen.add(address)
+            yield line, event
+
+    def query_lines(
+        self,
+        addresses: Optional[List[str]] = None,
+        events: Optional[List[str]] = None,
+        start_block: Optional[int] = None,
+        end_block: Optional[int] = None,
+    ) -> Iterator[str]:
+        """Yields the JSON lines of the events matching all the given filters,
+        ordered by block and log index. ``events`` contains event names or,
+        for raw logs, first topics. Events written by several tasks, e.g. with
+        overlapping block ranges, are only yielded once.
+        """
+        for line, _event in self._query(addresses, events, start_block, end_block):
+            yield line
+
+    def query(
+        self,
+        addresses: Optional[List[str]] = None,
+        events: Optional[List[str]] = None,
+        start_block: Optional[int] = None,
+        end_block: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """Same as ``query_lines`` but yields the parsed events"""
+        for _line, event in self._query(addresses, events, start_block, end_block):
+            yield event
+
+    def import_file(self, filepath: str, task: Optional[str] = None) -> int:
+        """Imports the events of a ``.jsonl`` or ``.jsonl.gz`` file written
+        by ``fetch-events``, replacing the events previously imported or fetched
+        by ``task``, the name of the file without extensions by default.
+        Events after the checkpoint of the file, if any, are skipped.
+        Returns the number of events imported
+        """
+        if task is None:
+            task = re.sub(r"(\.jsonl)?(\.gz)?$", "", path.basename(filepath))
+        checkpoint = Checkpoint.load(filepath + CHECKPOINT_SUFFIX)
+        writer = None
+        events_count = 0
+        last_block = None
+        with smart_open(filepath) as f:
+            for line in f:
+                event = json.loads(line)
+                last_block = event["blockNumber"]
+                if checkpoint is not None and last_block > checkpoint.last_block:
+                    break
+                if writer is None:
+                    address = checkpoint.address if checkpoint else event["address"]
+                    start_block = checkpoint.start_block if checkpoint else last_block
+                    writer = self.writer(task, address, start_block)
+                writer.write(event)
+                events_count += 1
+        if checkpoint is not None:
+            if writer is None:
+                writer = self.writer(task, checkpoint.address, checkpoint.start_block)
+            last_block = checkpoint.last_block
+        if writer is not None:
+            writer.commit(last_block)  # type: ignore
+            writer.close()
+        logger.info("imported %s events from %s", events_count, filepath)
+        return events_count
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+
+class EventStoreWriter:
+    """Writes the events of a task, fetched in block order, to an ``EventStore``
+    Events are written in chunks and ``commit`` records that all the events up
+    to ``last_block`` have been written. When ``resume`` is true, events written
+    after the last commit are deleted and new events are appended after it,
+    otherwise all the events previously written by the task are replaced.
+    """
+
+    def __init__(
+        self,
+        store: EventStore,
+        task: str,
+        address: str,
+        start_block: int,
+        resume: bool = False,
+    ):
+        self.store = store
+        self.task = task
+        self.last_block = start_block - 1
+        self._buffers: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        with store._transaction() as connection:
+            row = connection.execute(
+                "SELECT address, start_block, last_block FROM tasks WHERE name = ?",
+                (task,),
+            ).fetchone()
+            if resume and row is not None:
+                if row[0] != address.lower() or row[1] != start_block:
+                    raise ValueError(
+                        f"{task} in {store.filepath} does not match "
+                        f"{address} from block {start_block}"
+                    )
+                self.last_block = row[2]
+                connection.execute(
+                    "DELETE FROM chunks WHERE task = ? AND start_block > ?",
+                    (task, self.last_block),
+                )
+                return
+            connection.execute("DELETE FROM chunks WHERE task = ?", (task,))
+            connection.execute(
+                "INSERT OR REPLACE INTO tasks (name, address, start_block, last_block)"
+                " VALUES (?, ?, ?, ?)",
+                (task, address.lower(), start_block, self.last_block),
+            )
+
+    def write(self, event: dict):
+        key = event_key(event)
+        buffer = self._buffers[key]
+        buffer.append(to_json(event))
+        if len(buffer) >= self.store.chunk_events:
+            self.store._insert_chunks(self.task, [(*key, buffer)])
+            del self._buffers[key]
+
+    def commit(self, last_block: int):
+        """Writes the buffered events and records ``last_block``"""
+        chunks = [(*key, lines) for key, lines in self._buffers.items()]
+        self._buffers.clear()
+        with self.store._transaction() as connection:
+            self.store._insert_chunks(self.task, chunks)
+            connection.execute(
+                "UPDATE tasks SET last_block = ? WHERE name = ?",
+                (last_block, self.task),
+            )
+        self.last_block = last_block
+
+    def close(self):
+        """Events written after the last commit are dropped"""
+        self._buffers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
@@ -1,8 +1,12 @@
+import json
 from json import JSONEncoder
+from typing import Any
 
 from web3.types import HexBytes
 from web3.datastructures import AttributeDict
 
+_PRIMITIVE_TYPES = frozenset([str, int, float, bool, type(None)])
+
 
 class EthJSONEncoder(JSONEncoder):
     def default(self, o):
@@ -13,3 +17,36 @@ class EthJSONEncoder(JSONEncoder):
         if isinstance(o, bytes):
             return o.hex()
         return super().default(o)
+
+
+def to_json_compatible(o: Any) -> Any:
+    """Converts ``HexBytes``, ``bytes`` and ``AttributeDict`` values nested
+    in ``o`` to the values ``EthJSONEncoder`` encodes them as, in a single pass
+    """
+    o_type = type(o)
+    if o_type in _PRIMITIVE_TYPES:
+        return o
+    if o_type is AttributeDict:
+        # reading the underlying dict avoids the slow ``Mapping.items``
+        o = o.__dict__
+    elif not isinstance(o, (dict, AttributeDict)):
+        if o_type is HexBytes:
+            return o.hex()
+        if isinstance(o, (list, tuple)):
+            return [to_json_compatible(value) for value in o]
+        if isinstance(o, bytes):
+            return o.hex()
+        return o
+    return {
+        key: value if type(value) in _PRIMITIVE_TYPES else to_json_compatible(value)
+        for key, value in o.items()
+    }
+
+
+def to_json(o: Any) -> str:
+    """Returns the same string as ``json.dumps(o, cls=EthJSONEncoder)``
+    Converting the web3 values upfront lets the C encoder of the ``json``
+    module encode the whole object, without calling back
+    ``EthJSONEncoder.default`` for each value.
+    """
+    return json.dumps(to_json_compatible(o))
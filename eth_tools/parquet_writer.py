@@ -0,0 +1,258 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from eth_utils import to_bytes
+
+from eth_tools.json_encoder import to_json
+from eth_tools.utils import smart_open
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+# prefix of the columns holding the arguments of events
+ARGS_PREFIX = "args_"
+
+
+def to_binary(value: Any) -> Optional[bytes]:
+    """Converts hex strings, such as hashes and addresses, to bytes"""
+    if value is None or isinstance(value, bytes):
+        return value
+    return to_bytes(hexstr=value)
+
+
+def to_string(value: Any) -> Optional[str]:
+    """Converts values without a matching Arrow type, such as 256-bit integers
+    or arrays, to strings
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bytes, list, tuple, dict)):
+        return to_json(value).strip('"')
+    return str(value)
+
+
+def identity(value: Any) -> Any:
+    return value
+
+
+@dataclass
+class Column:
+    name: str
+    type: "pa.DataType"
+    convert: Callable[[Any], Any] = identity
+
+
+def _int_column(name: str) -> Column:
+    return Column(name, pa.int64())
+
+
+def _binary_column(name: str, size: int = -1) -> Column:
+    return Column(name, pa.binary(size), to_binary)
+
+
+def _string_column(name: str) -> Column:
+    return Column(name, pa.string(), to_string)
+
+
+BLOCK_COLUMNS: Dict[str, Callable[[str], Column]] = {
+    "number": _int_column,
+    "timestamp": _int_column,
+    "gasUsed": _int_column,
+    "gasLimit": _int_column,
+    "baseFeePerGas": _int_column,
+    "difficulty": _int_column,
+    "size": _int_column,
+    "transactions_count": _int_column,
+    "hash": lambda name: _binary_column(name, 32),
+    "parentHash": lambda name: _binary_column(name, 32),
+    "sha3Uncles": lambda name: _binary_column(name, 32),
+    "mixHash": lambda name: _binary_column(name, 32),
+    "receiptsRoot": lambda name: _binary_column(name, 32),
+    "stateRoot": lambda name: _binary_column(name, 32),
+    "transactionsRoot": lambda name: _binary_column(name, 32),
+    "miner": lambda name: _binary_column(name, 20),
+    "nonce": lambda name: _binary_column(name, 8),
+    "extraData": _binary_column,
+    "logsBloom": _binary_column,
+}
+
+
+def block_columns(fields: List[str]) -> List[Column]:
+    """Returns the columns of ``fields`` of a block, fields without a known
+    type, e.g. ``totalDifficulty`` which overflows 64 bits, are stored as strings
+    """
+    _check_pyarrow()
+    return [BLOCK_COLUMNS.get(field, _string_column)(field) for field in fields]
+
+
+def balance_columns() -> List[Column]:
+    """Returns the columns of ``(blockNumber, balance)`` rows, balances
+    are stored as strings as they may overflow 64 bits
+    """
+    _check_pyarrow()
+    return [_int_column("blockNumber"), _string_column("balance")]
+
+
+def holder_balance_columns() -> List[Column]:
+    """Returns the columns of ``(address, balance)`` rows"""
+    _check_pyarrow()
+    return [_binary_column("address", 20), _string_column("balance")]
+
+
+def abi_type_column(name: str, abi_type: str) -> Column:
+    """Returns the column storing values of the given ABI type"""
+    match = re.fullmatch(r"(u?)int(\d*)", abi_type)
+    if match:
+        unsigned, bits = match.group(1), int(match.group(2) or 256)
+        if bits > 64:
+            return _string_column(name)
+        return Column(name, pa.uint64() if unsigned else pa.int64())
+    match = re.fullmatch(r"bytes(\d+)", abi_type)
+    if match:
+        return _binary_column(name, int(match.group(1)))
+    if abi_type == "address":
+        return _binary_column(name, 20)
+    if abi_type == "bytes":
+        return _binary_column(name)
+    if abi_type == "bool":
+        return Column(name, pa.bool_())
+    return _string_column(name)
+
+
+def to_topics(topics: Optional[list]) -> Optional[List[bytes]]:
+    if topics is None:
+        return None
+    return [to_binary(topic) for topic in topics]
+
+
+def event_columns(
+    abi: List[dict], event_names: Optional[List[str]] = None, raw: bool = False
+):
+    """Returns the columns of the logs of the events of ``abi``, with one
+    ``args_<name>`` column per event argument. Arguments with the same name
+    but different types in different events are stored as strings.
+    If ``raw`` is true, the undecoded ``topics`` and ``data`` are stored instead
+    of the arguments.
+    """
+    _check_pyarrow()
+    columns = [
+        _int_column("blockNumber"),
+        _binary_column("blockHash", 32),
+        Column("transactionIndex", pa.int32()),
+        _binary_column("transactionHash", 32),
+        Column("logIndex", pa.int32()),
+        _binary_column("address", 20),
+        _string_column("event"),
+    ]
+    if raw:
+        return columns[:-1] + [
+            Column("topics", pa.list_(pa.binary(32)), to_topics),
+            _binary_column("data"),
+        ]
+    args_columns: Dict[str, Column] = {}
+    for entry in abi:
+        if entry.get("type") != "event" or entry.get("anonymous"):
+            continue
+        if event_names and entry["name"] not in event_names:
+            continue
+        for i, arg in enumerate(entry["inputs"]):
+            name = ARGS_PREFIX + (arg["name"] or str(i))
+            column = abi_type_column(name, arg["type"])
+            existing = args_columns.get(name)
+            if existing is not None and existing.type != column.type:
+                column = _string_column(name)
+            args_columns[name] = column
+    return columns + list(args_columns.values())
+
+
+def event_to_row(event: dict) -> dict:
+    """Flattens the arguments of a decoded log"""
+    row = dict(event)
+    for i, (name, value) in enumerate(event.get("args", {}).items()):
+        row[ARGS_PREFIX + (name or str(i))] = value
+    return row
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "pyarrow is required to write Parquet files, "
+            "install it with `pip install ethereum-tools[parquet]`"
+        )
+
+
+class ParquetWriter:
+    """Writes rows to a Parquet file with one typed column per ``columns``
+    Rows are buffered and written as row groups of ``row_group_size`` rows,
+    so that at most a row group is held in memory.
+    Missing values are written as nulls.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        columns: List[Column],
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    ):
+        _check_pyarrow()
+        self.columns = columns
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([(column.name, column.type) for column in columns])
+        self._file = smart_open(filepath, "wb")
+        self._writer = pq.ParquetWriter(self._file, self.schema)
+        self._buffers: List[list] = [[] for _ in columns]
+
+    def write(self, row: dict):
+        for column, buffer in zip(self.columns, self._buffers):
+            buffer.append(column.convert(row.get(column.name)))
+        if len(self._buffers[0]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows as a row group"""
+        if not self._buffers[0]:
+            return
+        arrays = [
+            pa.array(buffer, type=column.type)
+            for column, buffer in zip(self.columns, self._buffers)
+        ]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._buffers = [[] for _ in self.columns]
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+
+def concat_parquet_files(filepaths: List[str], output_file: str):
+    """Writes the rows of all ``filepaths``, which must share the same schema,
+    to ``output_file``, keeping their row groups
+    """
+    if pq is None:
+        raise ImportError("pyarrow is required, install ethereum-tools[parquet]")
+    writer = None
+    try:
+        for filepath in filepaths:
+            parquet_file = pq.ParquetFile(filepath)
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, parquet_file.schema_arrow)
+            for index in range(parquet_file.num_row_groups):
+                writer.write_table(parquet_file.read_row_group(index))
+    finally:
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,203 @@
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import HTTPProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from eth_tools.logger import logger
+
+if TYPE_CHECKING:
+    from eth_tools.rpc_cache import RPCCache
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 32
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+def compute_retry_delay(
+    backoff: float, attempt: int, retry_after: Optional[str] = None
+) -> float:
+    """Exponential backoff with jitter, at least ``Retry-After`` seconds if given"""
+    delay = backoff * 2**attempt * (1 + random.random())
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+class TokenBucket:
+    """Token bucket allowing ``rate`` tokens per second on average
+    and bursts of up to ``capacity`` tokens
+    Acquiring more than ``capacity`` tokens at once waits for a full bucket
+    and leaves it in debt, so that later acquisitions wait until it is repaid.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = max(capacity or rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Consumes ``tokens`` tokens if available and returns 0, otherwise
+        returns the time to wait before they are available
+        """
+        required = min(tokens, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+            if self._tokens >= required:
+                self._tokens -= tokens
+                return 0
+            return (required - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """Blocks until ``tokens`` tokens are available and consumes them"""
+        wait_time = self.try_acquire(tokens)
+        while wait_time > 0:
+            time.sleep(wait_time)
+            wait_time = self.try_acquire(tokens)
+
+
+class RequestScheduler:
+    """Schedules the HTTP requests sent to a single JSON-RPC provider
+    All the requests share a connection pool, at most ``max_concurrent_requests``
+    requests are in flight at any time and, if ``requests_per_second`` is given,
+    requests are rate limited using a token bucket, where each JSON-RPC call
+    of a batch request consumes a token.
+    Requests failing with a timeout, a connection error or a 429/5xx status are
+    retried up to ``max_retries`` times with an exponential backoff, and a 429
+    response pauses all the requests until it is safe to retry.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        requests_per_second: Optional[float] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+    ):
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_concurrent_requests)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphore = threading.BoundedSemaphore(max_concurrent_requests)
+        self._token_bucket = None
+        if requests_per_second:
+            self._token_bucket = TokenBucket(requests_per_second)
+        self._paused_until = 0.0
+
+    @property
+    def token_bucket(self) -> Optional[TokenBucket]:
+        return self._token_bucket
+
+    def pause_time(self) -> float:
+        """Returns the time to wait before sending requests after a 429 response"""
+        return max(self._paused_until - time.monotonic(), 0.0)
+
+    def pause(self, delay: float):
+        """Pauses all the requests for ``delay`` seconds"""
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def try_acquire_slot(self) -> bool:
+        """Reserves one of the ``max_concurrent_requests`` slots without blocking,
+        used by requests sent from an event loop, see ``AsyncRPCClient``
+        """
+        return self._semaphore.acquire(blocking=False)
+
+    def release_slot(self):
+        self._semaphore.release()
+
+    def _wait_turn(self, cost: int):
+        pause = self.pause_time()
+        if pause > 0:
+            time.sleep(pause)
+        if self._token_bucket is not None:
+            self._token_bucket.acquire(cost)
+
+    def post(self, url: str, cost: int = 1, **kwargs: Any) -> requests.Response:
+        """Sends a POST request to ``url`` once allowed by the limits
+        ``cost`` is the number of JSON-RPC calls contained in the request
+        """
+        attempt = 0
+        while True:
+            self._wait_turn(cost)
+            response = None
+            try:
+                with self._semaphore:
+                    response = self.session.post(url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                error: Exception = requests.HTTPError(
+                    f"{response.status_code} response from {url}", response=response
+                )
+            except (requests.Timeout, requests.ConnectionError) as ex:
+                error = ex
+            if attempt >= self.max_retries:
+                raise error
+            retry_after = None
+            if response is not None:
+                retry_after = response.headers.get("Retry-After")
+            delay = compute_retry_delay(self.backoff, attempt, retry_after)
+            if response is not None and response.status_code == 429:
+                self.pause(delay)
+            logger.warning("request failed (%s), retrying in %.2fs", error, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+class ScheduledHTTPProvider(HTTPProvider):
+    """HTTP provider sending all its requests through a ``RequestScheduler``
+    If ``rpc_cache`` is given, results of calls which cannot change anymore
+    are served from it
+    """
+
+    def __init__(
+        self,
+        endpoint_uri: str,
+        request_kwargs: Optional[Any] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        rpc_cache: Optional["RPCCache"] = None,
+    ):
+        super().__init__(endpoint_uri, request_kwargs)
+        if scheduler is None:
+            scheduler = RequestScheduler()
+        self.scheduler = scheduler
+        self.rpc_cache = rpc_cache
+
+    def _send_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+        response = self.scheduler.post(
+            self.endpoint_uri, data=request_data, **self.get_request_kwargs()
+        )
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if self.rpc_cache is None:
+            return self._send_request(method, params)
+        result, cached = self.rpc_cache.get(method, params)
+        if cached:
+            return {"jsonrpc": "2.0", "id": 0, "result": result}
+        response = self._send_request(method, params)
+        if "error" not in response:
+            self.rpc_cache.set(method, params, response.get("result"))
+        return response
+
+    def make_uncached_request(self, method: str, params: Any) -> Any:
+        """Returns the result of the call, bypassing the cache"""
+        response = self._send_request(RPCEndpoint(method), params)
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["result"]
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import threading
+import time
+from os import path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from eth_tools.caching import CACHE_PATH, CacheStore
+from eth_tools.json_encoder import to_json_compatible
+
+DEFAULT_FINALITY_DEPTH = 64
+DEFAULT_RPC_CACHE_SIZE = 10 << 30
+RPC_CACHE_FILENAME = "rpc-cache.sqlite3"
+
+# interval at which the head of the chain is refreshed, in seconds
+HEAD_REFRESH_INTERVAL = 12
+
+# index of the block number in the params of methods pinned to a block
+BLOCK_PARAM_INDEX = {
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockReceipts": 0,
+    "eth_getBlockTransactionCountByNumber": 0,
+    "debug_traceBlockByNumber": 0,
+    "eth_call": 1,
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getStorageAt": 2,
+}
+# methods returning an object with the ``blockNumber`` it was included in
+TRANSACTION_METHODS = {"eth_getTransactionByHash", "eth_getTransactionReceipt"}
+
+
+def parse_block_number(block_identifier: Any) -> Optional[int]:
+    """Returns the block number of ``block_identifier`` or ``None`` for tags
+    such as ``latest`` or ``pending``
+    """
+    if isinstance(block_identifier, int) and not isinstance(block_identifier, bool):
+        return block_identifier
+    if isinstance(block_identifier, str) and block_identifier.startswith("0x"):
+        return int(block_identifier, 16)
+    return None
+
+
+class RPCCache:
+    """Caches the results of JSON-RPC calls which cannot change anymore,
+    i.e. calls pinned to a block at least ``finality_depth`` blocks behind the
+    head of the chain, and transactions included in such a block.
+    Traces of transactions are cached once the transaction has been cached.
+    Calls using block tags such as ``latest`` or ``pending`` are never cached.
+    ``make_request(method, params)`` is used to retrieve the chain ID, which
+    namespaces the cache, and the head of the chain.
+    """
+
+    def __init__(
+        self,
+        store: CacheStore,
+        make_request: Callable[[str, list], Any],
+        finality_depth: int = DEFAULT_FINALITY_DEPTH,
+    ):
+        self.store = store
+        self.make_request = make_request
+        self.finality_depth = finality_depth
+        self._lock = threading.Lock()
+        self._chain_id: Optional[str] = None
+        self._head: Optional[int] = None
+        self._head_updated_at = 0.0
+
+    @classmethod
+    def create(
+        cls,
+        make_request: Callable[[str, list], Any],
+        finality_depth: int = DEFAULT_FINALITY_DEPTH,
+        directory: str = CACHE_PATH,
+        max_size: int = DEFAULT_RPC_CACHE_SIZE,
+    ) -> "RPCCache":
+        store = CacheStore(path.join(directory, RPC_CACHE_FILENAME), max_size)
+        return cls(store, make_request, finality_depth)
+
+    @property
+    def chain_id(self) -> str:
+        if self._chain_id is None:
+            self._chain_id = self.make_request("eth_chainId", [])
+        return self._chain_id
+
+    @property
+    def finalized_block(self) -> int:
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._head is None
+                or now - self._head_updated_at >= HEAD_REFRESH_INTERVAL
+            ):
+                self._head = int(self.make_request("eth_blockNumber", []), 16)
+                self._head_updated_at = now
+            return self._head - self.finality_depth
+
+    def _compute_key(self, method: str, params: Sequence[Any]) -> str:
+        to_hash = json.dumps(
+            to_json_compatible([self.chain_id, method, params]), sort_keys=True
+        )
+        return hashlib.md5(to_hash.encode()).hexdigest()
+
+    def _get_pinned_block(self, method: str, params: Sequence[Any]) -> Optional[int]:
+        if method == "eth_getLogs":
+            log_filter = params[0] if params else {}
+            from_block = parse_block_number(log_filter.get("fromBlock"))
+            to_block = parse_block_number(log_filter.get("toBlock"))
+            if from_block is None or "blockHash" in log_filter:
+                return None
+            return to_block
+        index = BLOCK_PARAM_INDEX.get(method)
+        if index is None or len(params) <= index:
+            return None
+        return parse_block_number(params[index])
+
+    def is_final(self, method: str, params: Sequence[Any], result: Any) -> bool:
+        """Returns true if ``result`` of the call can be cached forever"""
+        if result is None:
+            return False
+        if method in TRANSACTION_METHODS:
+            block_number = parse_block_number(result.get("blockNumber"))
+        elif method == "debug_traceTransaction":
+            return self._has_final_transaction(params[0])
+        else:
+            block_number = self._get_pinned_block(method, params)
+        return block_number is not None and block_number <= self.finalized_block
+
+    def _has_final_transaction(self, tx_hash: str) -> bool:
+        return any(
+            self.get(method, [tx_hash])[1] for method in sorted(TRANSACTION_METHODS)
+        )
+
+    def get(self, method: str, params: Sequence[Any]) -> Tuple[Any, bool]:
+        """Returns the cached result of the call and whether it was cached"""
+        if method not in TRANSACTION_METHODS and method != "debug_traceTransaction":
+            if self._get_pinned_block(method, params) is None:
+                return None, False
+        return self.store.get(self._compute_key(method, params))
+
+    def set(self, method: str, params: Sequence[Any], result: Any):
+        """Caches ``result`` if the call cannot return anything else anymore"""
+        if self.is_final(method, params, result):
+            self.store.set(self._compute_key(method, params), result)
+
+    def get_many(self, calls: List[Tuple[str, Sequence[Any]]]) -> Dict[int, Any]:
+        """Returns the cached results of ``calls`` indexed by call position"""
+        cached = {}
+        for i, (method, params) in enumerate(calls):
+            result, found = self.get(method, params)
+            if found:
+                cached[i] = result
+        return cached
+
+    def set_many(self, calls: List[Tuple[str, Sequence[Any]]], results: List[Any]):
+        for (method, params), result in zip(calls, results):
+            if not isinstance(result, Exception):
+                self.set(method, params, result)
@@ -0,0 +1,134 @@
+import itertools
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Sequence, Tuple
+from urllib.parse import urlparse
+
+from web3 import Web3
+
+from eth_tools.request_scheduler import RequestScheduler
+
+if TYPE_CHECKING:
+    from eth_tools.rpc_cache import RPCCache
+
+RPCCall = Tuple[str, Sequence[Any]]
+
+
+def build_batch_payload(calls: List[RPCCall], ids: Iterator[int]) -> List[dict]:
+    return [
+        {"jsonrpc": "2.0", "method": method, "params": list(params), "id": next(ids)}
+        for method, params in calls
+    ]
+
+
+def get_rpc_result(response: dict, raise_on_error: bool = True) -> Any:
+    if "error" not in response:
+        return response["result"]
+    error = ValueError(response["error"])
+    if raise_on_error:
+        raise error
+    return error
+
+
+def parse_batch_response(
+    payload: List[dict], raw_responses: Any, raise_on_error: bool = True
+) -> List[Any]:
+    """Returns the results of the batch response ``raw_responses``
+    in the order of the requests in ``payload``
+    """
+    if not isinstance(raw_responses, list):
+        # some nodes reply with a single error object to malformed batches
+        raise ValueError(raw_responses.get("error", raw_responses))
+    responses_by_id = {raw["id"]: raw for raw in raw_responses}
+    return [
+        get_rpc_result(responses_by_id[request["id"]], raise_on_error)
+        for request in payload
+    ]
+
+
+def with_rpc_cache(
+    rpc_cache: "RPCCache",
+    calls: List[RPCCall],
+    make_batch_request: Callable[[List[RPCCall]], List[Any]],
+) -> List[Any]:
+    """Returns the results of ``calls`` from ``rpc_cache`` if possible and
+    executes the other calls using ``make_batch_request``
+    """
+    results = rpc_cache.get_many(calls)
+    missing_indices = [i for i in range(len(calls)) if i not in results]
+    if missing_indices:
+        missing_calls = [calls[i] for i in missing_indices]
+        missing_results = make_batch_request(missing_calls)
+        rpc_cache.set_many(missing_calls, missing_results)
+        results.update(zip(missing_indices, missing_results))
+    return [results[i] for i in range(len(calls))]
+
+
+class RPCClient:
+    """Thin JSON-RPC client sharing the endpoint of a ``web3`` instance
+    It can send several calls in a single JSON-RPC batch request when the
+    provider uses HTTP, and falls back to sequential calls otherwise.
+    Results are returned raw, i.e. without web3 result formatters applied.
+    Batch requests go through the ``RequestScheduler`` of the provider when it
+    has one, so that they share its connection pool and limits, and results are
+    read from and stored in the ``RPCCache`` of the provider when it has one.
+    """
+
+    def __init__(self, web3: Web3):
+        self.web3 = web3
+        self.provider = web3.provider
+        self.endpoint_uri = getattr(self.provider, "endpoint_uri", None)
+        scheduler = getattr(self.provider, "scheduler", None)
+        if not isinstance(scheduler, RequestScheduler):
+            scheduler = RequestScheduler()
+        self.scheduler = scheduler
+        self._ids = itertools.count()
+
+    @property
+    def supports_batch(self) -> bool:
+        if not self.endpoint_uri:
+            return False
+        return urlparse(str(self.endpoint_uri)).scheme in ("http", "https")
+
+    def _request_kwargs(self) -> dict:
+        get_request_kwargs = getattr(self.provider, "get_request_kwargs", None)
+        if get_request_kwargs is None:
+            return {}
+        return dict(get_request_kwargs())
+
+    def make_request(self, method: str, params: Sequence[Any]) -> Any:
+        return self.make_batch_request([(method, params)])[0]
+
+    def make_batch_request(
+        self, calls: List[RPCCall], raise_on_error: bool = True
+    ) -> List[Any]:
+        """Executes all the ``calls`` and returns their results in the same order
+        Raises a ``ValueError`` if any of the calls returns an error, unless
+        ``raise_on_error`` is false, in which case the ``ValueError`` is returned
+        in place of the result of the failed call
+        """
+        if not calls:
+            return []
+        rpc_cache = getattr(self.provider, "rpc_cache", None)
+        if rpc_cache is not None:
+            return with_rpc_cache(
+                rpc_cache,
+                calls,
+                lambda missing_calls: self._make_batch_request(
+                    missing_calls, raise_on_error
+                ),
+            )
+        return self._make_batch_request(calls, raise_on_error)
+
+    def _make_batch_request(self, calls: List[RPCCall], raise_on_error: bool):
+        if not self.supports_batch:
+            responses = [
+                self.provider.make_request(method, list(params))
+                for method, params in calls
+            ]
+            return [get_rpc_result(response, raise_on_error) for response in responses]
+
+        payload = build_batch_payload(calls, self._ids)
+        response = self.scheduler.post(
+            self.endpoint_uri, cost=len(payload), json=payload, **self._request_kwargs()
+        )
+        response.raise_for_status()
+        return parse_batch_response(payload, response.json(), raise_on_error)
@@ -0,0 +1,393 @@
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import time
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from os import path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from eth_tools.checkpoint import CHECKPOINT_SUFFIX
+from eth_tools.event_fetcher import OUTPUT_EXTENSIONS, EventFetcher, FetchTask
+from eth_tools.logger import logger
+from eth_tools.parquet_writer import concat_parquet_files
+from eth_tools.utils import smart_open
+
+DEFAULT_SHARD_BLOCKS = 1_000_000
+DEFAULT_CLAIM_SIZE = 4
+# marker written next to a slice file once all its blocks have been written
+COMPLETE_SUFFIX = ".complete"
+
+# slice files are named <prefix>.<start block>-<end block><extension>
+SLICE_PATTERN = re.compile(
+    r"^(?P<prefix>.+)\.(?P<start>\d+)-(?P<end>\d+)(?P<extension>(\.[a-z]+)+)$"
+)
+EXTENSION_PATTERN = re.compile(r"^(?P<prefix>.+?)(?P<extension>(\.[a-z]+)*)$")
+
+
+def iterate_slices(
+    start_block: int, end_block: int, slice_blocks: int = DEFAULT_SHARD_BLOCKS
+) -> Iterator[Tuple[int, int]]:
+    """Yields the ``(start_block, end_block)`` slices of the range, aligned on
+    multiples of ``slice_blocks`` so that they only depend on the block numbers
+    """
+    slice_start_block = start_block
+    while slice_start_block <= end_block:
+        slice_end_block = min(
+            (slice_start_block // slice_blocks + 1) * slice_blocks - 1, end_block
+        )
+        yield slice_start_block, slice_end_block
+        slice_start_block = slice_end_block + 1
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Shard ``index`` out of ``count``, with ``0 <= index < count``
+    Block ranges are split into slices of ``slice_blocks`` blocks and the
+    slice starting in the ``n``-th multiple of ``slice_blocks`` belongs to
+    shard ``n % count``, which spreads busy periods of the chain across shards.
+    """
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """Parses a shard given as ``i/N``"""
+        try:
+            index, count = map(int, value.split("/"))
+        except ValueError:
+            raise ValueError(f"invalid shard {value}, expected i/N") from None
+        if not 0 <= index < count:
+            raise ValueError(f"invalid shard {value}, expected 0 <= i < N")
+        return cls(index, count)
+
+    def slices(
+        self, start_block: int, end_block: int, slice_blocks: int = DEFAULT_SHARD_BLOCKS
+    ) -> List[Tuple[int, int]]:
+        return [
+            (slice_start_block, slice_end_block)
+            for slice_start_block, slice_end_block in iterate_slices(
+                start_block, end_block, slice_blocks
+            )
+            if slice_start_block // slice_blocks % self.count == self.index
+        ]
+
+
+def slice_filepath(filepath: str, start_block: int, end_block: int) -> str:
+    """Inserts the block range of a slice before the extensions of ``filepath``"""
+    directory, filename = path.split(filepath)
+    match = EXTENSION_PATTERN.match(filename)
+    if match is None:
+        raise ValueError(f"invalid output file {filepath}")
+    filename = f"{match['prefix']}.{start_block}-{end_block}{match['extension']}"
+    return path.join(directory, filename)
+
+
+def mark_incomplete(filepath: str):
+    """Removes the completion marker of a slice file before it is written"""
+    if path.exists(filepath + COMPLETE_SUFFIX):
+        os.remove(filepath + COMPLETE_SUFFIX)
+
+
+def mark_complete(filepath: str):
+    """Records that all the blocks of a slice file have been written"""
+    with open(filepath + COMPLETE_SUFFIX, "w"):
+        pass
+
+
+def slice_task(task: FetchTask, start_block: int, end_block: int) -> FetchTask:
+    """Returns the task fetching the slice, written to its own slice file"""
+    name = f"{task.display_name}.{start_block}-{end_block}"
+    return replace(task, start_block=start_block, end_block=end_block, name=name)
+
+
+def _check_end_block(task: FetchTask):
+    if task.end_block is None:
+        raise ValueError(f"{task.display_name} needs an end block to be sharded")
+
+
+def shard_tasks(
+    tasks: List[FetchTask], shard: Shard, slice_blocks: int = DEFAULT_SHARD_BLOCKS
+) -> List[FetchTask]:
+    """Returns the tasks fetching the slices of ``tasks`` belonging to ``shard``"""
+    sharded_tasks = []
+    for task in tasks:
+        _check_end_block(task)
+        for start_block, end_block in shard.slices(
+            task.start_block, task.end_block, slice_blocks  # type: ignore
+        ):
+            sharded_tasks.append(slice_task(task, start_block, end_block))
+    return sharded_tasks
+
+
+def fetch_slices(
+    fetcher: EventFetcher,
+    tasks: List[FetchTask],
+    output_directory: str,
+    resume: bool = False,
+    output_format: str = "jsonl",
+) -> Dict[str, Exception]:
+    """Same as ``fetcher.fetch_all_events`` for the tasks of slices, whose
+    files are marked as complete once fetched without error
+    """
+    filepaths = {}
+    if output_format != "store":
+        extension = OUTPUT_EXTENSIONS[output_format]
+        filepaths = {
+            task.display_name: path.join(output_directory, task.display_name)
+            + extension
+            for task in tasks
+        }
+    for filepath in filepaths.values():
+        mark_incomplete(filepath)
+    errors = fetcher.fetch_all_events(
+        tasks, output_directory, resume=resume, output_format=output_format
+    )
+    for name, filepath in filepaths.items():
+        if name not in errors:
+            mark_complete(filepath)
+    return errors
+
+
+def _concat_files(filepaths: List[str], output_file: str):
+    if output_file.endswith(".parquet"):
+        concat_parquet_files(filepaths, output_file)
+    elif ".csv" in path.basename(output_file):
+        # only the header of the first file is kept
+        with smart_open(output_file, "w") as fout:
+            for index, filepath in enumerate(filepaths):
+                with smart_open(filepath) as fin:
+                    if index > 0:
+                        fin.readline()
+                    shutil.copyfileobj(fin, fout)
+    else:
+        # gzip files can be concatenated as a multi-member gzip file
+        with open(output_file, "wb") as fout:
+            for filepath in filepaths:
+                with open(filepath, "rb") as fin:
+                    shutil.copyfileobj(fin, fout)
+
+
+def merge_slices(input_directories: List[str], output_directory: str) -> List[str]:
+    """Merges the slice files of ``input_directories``, e.g. written by
+    different shards, into one file per output, ordered by block,
+    and returns the merged files. Fails if a slice is missing or was not
+    marked as complete, see ``mark_complete``.
+    """
+    slices: Dict[Tuple[str, str], List[Tuple[int, int, str]]] = defaultdict(list)
+    for input_directory in input_directories:
+        for filename in sorted(os.listdir(input_directory)):
+            match = SLICE_PATTERN.match(filename)
+            if match is None or filename.endswith((CHECKPOINT_SUFFIX, COMPLETE_SUFFIX)):
+                continue
+            filepath = path.join(input_directory, filename)
+            start_block, end_block = int(match["start"]), int(match["end"])
+            if not path.exists(filepath + COMPLETE_SUFFIX):
+                raise ValueError(f"{filepath} was not fetched completely")
+            key = (match["prefix"], match["extension"])
+            slices[key].append((start_block, end_block, filepath))
+
+    merged_files = []
+    for (prefix, extension), output_slices in sorted(slices.items()):
+        output_slices.sort()
+        for (_, previous_end_block, previous_file), (start_block, _, filepath) in zip(
+            output_slices, output_slices[1:]
+        ):
+            if start_block != previous_end_block + 1:
+                raise ValueError(
+                    f"cannot merge {previous_file} and {filepath}: "
+                    f"expected a slice starting at block {previous_end_block + 1}"
+                )
+        output_file = path.join(output_directory, prefix + extension)
+        _concat_files([filepath for _, _, filepath in output_slices], output_file)
+        logger.info(
+            "merged %s slices from block %s to %s into %s",
+            len(output_slices),
+            output_slices[0][0],
+            output_slices[-1][1],
+            output_file,
+        )
+        merged_files.append(output_file)
+    return merged_files
+
+
+def _process_start_time(pid: int) -> str:
+    """Returns the start time of a local process, in clock ticks since boot,
+    or an empty string if it is unknown, e.g. on systems without ``/proc``
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return ""
+    # fields after the command name, which may contain spaces, start at the state
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def worker_id(pid: int) -> str:
+    """Identifies a worker process by its host, PID and start time, so that
+    another process reusing its PID is not mistaken for it
+    """
+    return f"{socket.gethostname()}:{pid}:{_process_start_time(pid)}"
+
+
+def _is_local_process_alive(worker: str) -> bool:
+    """Workers on other hosts are assumed to be alive. Without a start time,
+    a process reusing the PID of a dead worker is mistaken for it
+    """
+    hostname, pid, start_time = worker.rsplit(":", 2)
+    if hostname != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return not start_time or _process_start_time(int(pid)) in ("", start_time)
+
+
+class Manifest:
+    """Slices of a bulk job, shared by workers through a SQLite database
+    Each worker claims pending slices, fetches them to their slice files and
+    marks them as done or failed. Slices claimed by a process of this host
+    which is not running anymore are claimed again, and failed slices are
+    retried when claiming with ``retry_failed``.
+    """
+
+    def __init__(self, filepath: str, worker: Optional[str] = None):
+        self.filepath = filepath
+        self.worker = worker or worker_id(os.getpid())
+        self._connection = sqlite3.connect(filepath, timeout=60, isolation_level=None)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS slices ("
+            " name TEXT PRIMARY KEY,"
+            " task_index INTEGER NOT NULL,"
+            " start_block INTEGER NOT NULL,"
+            " end_block INTEGER NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " worker TEXT,"
+            " error TEXT,"
+            " updated_at REAL"
+            ")"
+        )
+
+    def add_tasks(
+        self, tasks: List[FetchTask], slice_blocks: int = DEFAULT_SHARD_BLOCKS
+    ):
+        """Adds the slices of ``tasks``, slices already in the manifest are kept"""
+        rows = []
+        for task_index, task in enumerate(tasks):
+            _check_end_block(task)
+            for start_block, end_block in iterate_slices(
+                task.start_block, task.end_block, slice_blocks  # type: ignore
+            ):
+                name = slice_task(task, start_block, end_block).display_name
+                rows.append((name, task_index, start_block, end_block))
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO slices (name, task_index, start_block, end_block)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def _release_dead_workers(self, retry_failed: bool):
+        rows = self._connection.execute(
+            "SELECT DISTINCT worker FROM slices WHERE status = 'running'"
+        ).fetchall()
+        for (worker,) in rows:
+            if worker != self.worker and not _is_local_process_alive(worker):
+                logger.warning("releasing the slices claimed by %s", worker)
+                self._connection.execute(
+                    "UPDATE slices SET status = 'pending' "
+                    "WHERE status = 'running' AND worker = ?",
+                    (worker,),
+                )
+        if retry_failed:
+            self._connection.execute(
+                "UPDATE slices SET status = 'pending' WHERE status = 'failed'"
+            )
+
+    def claim(
+        self, count: int, retry_failed: bool = False
+    ) -> List[Tuple[int, int, int]]:
+        """Claims up to ``count`` slices and returns their
+        ``(task_index, start_block, end_block)``
+        """
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._release_dead_workers(retry_failed)
+            rows = self._connection.execute(
+                "SELECT name, task_index, start_block, end_block FROM slices "
+                "WHERE status = 'pending' ORDER BY start_block, task_index LIMIT ?",
+                (count,),
+            ).fetchall()
+            self._connection.executemany(
+                "UPDATE slices SET status = 'running', worker = ?, updated_at = ? "
+                "WHERE name = ?",
+                [(self.worker, time.time(), name) for name, *_ in rows],
+            )
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        return [tuple(row[1:]) for row in rows]  # type: ignore
+
+    def complete(self, name: str, error: Optional[Exception] = None):
+        status = "done" if error is None else "failed"
+        with self._connection:
+            self._connection.execute(
+                "UPDATE slices SET status = ?, error = ?, updated_at = ? "
+                "WHERE name = ?",
+                (status, error and str(error), time.time(), name),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of slices by status"""
+        rows = self._connection.execute(
+            "SELECT status, COUNT(*) FROM slices GROUP BY status"
+        ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+
+def run_manifest_worker(
+    fetcher: EventFetcher,
+    manifest: Manifest,
+    tasks: List[FetchTask],
+    output_directory: str,
+    resume: bool = False,
+    output_format: str = "jsonl",
+    claim_size: int = DEFAULT_CLAIM_SIZE,
+):
+    """Fetches the slices claimed from ``manifest`` until none is left
+    ``tasks`` must be the tasks the manifest was created from. With ``resume``,
+    failed slices are retried and resumed from their checkpoint.
+    """
+    retry_failed = resume
+    while True:
+        claimed = manifest.claim(claim_size, retry_failed=retry_failed)
+        retry_failed = False
+        if not claimed:
+            break
+        slice_tasks = [
+            slice_task(tasks[task_index], start_block, end_block)
+            for task_index, start_block, end_block in claimed
+        ]
+        errors = fetch_slices(
+            fetcher, slice_tasks, output_directory, resume, output_format
+        )
+        for task in slice_tasks:
+            manifest.complete(task.display_name, errors.get(task.display_name))
+    logger.info("no slice left to fetch: %s", manifest.counts())
@@ -0,0 +1,390 @@
+import itertools
+import json
+import os
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from os import path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set
+
+from web3 import Web3
+from web3._utils.method_formatters import get_result_formatters
+from web3._utils.rpc_abi import RPC
+from web3.datastructures import AttributeDict
+
+from eth_tools.logger import logger
+from eth_tools.rpc_client import RPCClient
+from eth_tools.transaction_tracer import TransactionTracer
+from eth_tools.utils import smart_open
+
+DEFAULT_TRANSACTIONS_BATCH_SIZE = 50
+DEFAULT_TRANSACTIONS_CONCURRENCY = 4
+DEFAULT_TRACES_CONCURRENCY = 8
+DEFAULT_MIN_BLOCK_TRANSACTIONS = 5
+# minimum share of the transactions of a block needed to fetch the whole block
+MIN_BLOCK_TRANSACTIONS_SHARE = 0.5
+
+
+def _keep_first_lines(filename: str, lines_count: int):
+    """Rewrites ``filename`` with only its first ``lines_count`` lines"""
+    directory, basename = path.split(filename)
+    # the temporary file keeps the extension to be compressed the same way
+    tmp_filename = path.join(directory, "." + basename)
+    with smart_open(filename) as fin, smart_open(tmp_filename, "w") as fout:
+        fout.writelines(itertools.islice(fin, lines_count))
+    os.replace(tmp_filename, filename)
+
+
+def load_fetched_hashes(filename: str) -> Set[str]:
+    """Returns the hashes of the transactions already written to ``filename``
+    The file is truncated after its last complete transaction, e.g. when its end
+    was not written or compressed fully because of a crash, so that new
+    transactions can be appended to it
+    """
+    hashes = set()
+    lines_count = 0
+    complete = True
+    try:
+        with smart_open(filename) as f:
+            for line in f:
+                try:
+                    tx_hash = json.loads(line)["hash"]
+                except (ValueError, KeyError):
+                    complete = False
+                    break
+                if not line.endswith("\n"):
+                    complete = False
+                    break
+                hashes.add(tx_hash)
+                lines_count += 1
+    except FileNotFoundError:
+        return hashes
+    except (EOFError, OSError, zlib.error) as ex:
+        logger.warning("failed to read %s: %s", filename, ex)
+        complete = False
+    if not complete:
+        logger.warning(
+            "truncating %s after its %s complete transactions", filename, lines_count
+        )
+        _keep_first_lines(filename, lines_count)
+    return hashes
+
+
+class TransactionDetailsFetcher:
+    """Fetches transactions, and optionally their receipts and traces, from a node
+    Transactions and receipts of ``batch_size`` transactions are fetched using
+    JSON-RPC batch requests and up to ``concurrency`` batches are in flight.
+    Traces cannot be batched and are fetched individually, with up to
+    ``traces_concurrency`` traces in flight.
+    Hashes are processed in windows of ``2 * concurrency`` batches. When at least
+    ``min_block_transactions`` transactions of a window, and at least half of
+    the transactions of their block, are in the same block, their receipts and
+    traces are fetched for the whole block using ``eth_getBlockReceipts`` and
+    ``debug_traceBlockByNumber``, falling back to individual calls if the node
+    does not support them. Setting it to 0 disables block-level fetching.
+    Transactions are returned in the order of the given hashes, unless ``ordered``
+    is false, in which case they are returned as soon as they are fetched.
+    Transactions which cannot be fetched are logged and skipped.
+    """
+
+    def __init__(
+        self,
+        web3: Web3,
+        include_receipt: bool = False,
+        include_traces: bool = False,
+        batch_size: int = DEFAULT_TRANSACTIONS_BATCH_SIZE,
+        concurrency: int = DEFAULT_TRANSACTIONS_CONCURRENCY,
+        traces_concurrency: int = DEFAULT_TRACES_CONCURRENCY,
+        ordered: bool = True,
+        tracer: Optional[TransactionTracer] = None,
+        min_block_transactions: int = DEFAULT_MIN_BLOCK_TRANSACTIONS,
+    ):
+        self.web3 = web3
+        self.include_receipt = include_receipt
+        self.include_traces = include_traces
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.traces_concurrency = traces_concurrency
+        self.ordered = ordered
+        self.min_block_transactions = min_block_transactions
+        if tracer is None:
+            tracer = TransactionTracer(web3)
+        self.tracer = tracer
+        self.rpc_client = RPCClient(web3)
+        self._format_transaction = get_result_formatters(
+            RPC.eth_getTransactionByHash, web3.eth
+        )
+        self._format_receipt = get_result_formatters(
+            RPC.eth_getTransactionReceipt, web3.eth
+        )
+
+    def _fetch_transactions(self, tx_hashes: List[str]) -> Dict[str, dict]:
+        """Fetches the transactions and, unless they are grouped by block,
+        their receipts in a single batch request
+        """
+        calls = [("eth_getTransactionByHash", [tx_hash]) for tx_hash in tx_hashes]
+        fetch_receipts = self.include_receipt and not self.min_block_transactions
+        if fetch_receipts:
+            calls += [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes]
+        results = self.rpc_client.make_batch_request(calls, raise_on_error=False)
+        raw_receipts = results[len(tx_hashes) :] or [None] * len(tx_hashes)
+
+        transactions = {}
+        for tx_hash, raw_tx, raw_receipt in zip(tx_hashes, results, raw_receipts):
+            try:
+                if isinstance(raw_tx, Exception):
+                    raise raw_tx
+                if raw_tx is None:
+                    raise ValueError(f"transaction {tx_hash} not found")
+                tx = dict(self._format_transaction(raw_tx))
+                if fetch_receipts:
+                    tx["receipt"] = self._make_receipt(tx_hash, raw_receipt)
+            except ValueError as ex:
+                logger.warning("failed to fetch %s: %s", tx_hash, ex)
+                continue
+            transactions[tx_hash] = tx
+        return transactions
+
+    def _make_receipt(self, tx_hash: str, raw_receipt: Any) -> AttributeDict:
+        if isinstance(raw_receipt, Exception):
+            raise raw_receipt
+        if raw_receipt is None:
+            raise ValueError(f"receipt of {tx_hash} not found")
+        return self._format_receipt(raw_receipt)
+
+    def _group_by_block(self, transactions: Dict[str, dict]) -> Dict[int, List[str]]:
+        """Returns the blocks containing at least ``min_block_transactions``
+        of the ``transactions``, and at least ``MIN_BLOCK_TRANSACTIONS_SHARE``
+        of the transactions of the block, with the hashes of these transactions
+        """
+        if not self.min_block_transactions:
+            return {}
+        blocks: Dict[int, List[str]] = defaultdict(list)
+        for tx_hash, tx in transactions.items():
+            blocks[tx["blockNumber"]].append(tx_hash)
+        candidates = [
+            block_number
+            for block_number, tx_hashes in blocks.items()
+            if len(tx_hashes) >= self.min_block_transactions
+        ]
+        calls = [("eth_getBlockTransactionCountByNumber", [hex(n)]) for n in candidates]
+        counts = self.rpc_client.make_batch_request(calls, raise_on_error=False)
+        dense_blocks = {}
+        for block_number, count in zip(candidates, counts):
+            if isinstance(count, Exception) or count is None:
+                logger.debug(
+                    "failed to fetch transactions count of block %s: %s",
+                    block_number,
+                    count,
+                )
+                continue
+            tx_hashes = blocks[block_number]
+            if len(tx_hashes) >= int(count, 16) * MIN_BLOCK_TRANSACTIONS_SHARE:
+                dense_blocks[block_number] = tx_hashes
+        return dense_blocks
+
+    def _fetch_block_receipts(self, block_numbers: List[int]) -> Dict[str, Any]:
+        """Returns the receipts of all the transactions of ``block_numbers``
+        by lowercase transaction hash, without the blocks which failed
+        """
+        calls = [("eth_getBlockReceipts", [hex(n)]) for n in block_numbers]
+        results = self.rpc_client.make_batch_request(calls, raise_on_error=False)
+        receipts: Dict[str, Any] = {}
+        for block_number, block_receipts in zip(block_numbers, results):
+            if isinstance(block_receipts, Exception) or block_receipts is None:
+                logger.debug(
+                    "failed to fetch receipts of block %s: %s",
+                    block_number,
+                    block_receipts,
+                )
+                continue
+            for receipt in block_receipts:
+                receipts[receipt["transactionHash"].lower()] = receipt
+        return receipts
+
+    def _fetch_receipts(
+        self, transactions: Dict[str, dict], block_receipts: Dict[str, Any]
+    ):
+        """Adds the receipts to ``transactions``, using ``block_receipts``
+        and fetching the other ones individually
+        """
+        receipts = {
+            h.lower(): block_receipts[h.lower()]
+            for h in transactions
+            if h.lower() in block_receipts
+        }
+        missing_hashes = [h for h in transactions if h.lower() not in receipts]
+        calls = [("eth_getTransactionReceipt", [h]) for h in missing_hashes]
+        results = self.rpc_client.make_batch_request(calls, raise_on_error=False)
+        receipts.update(zip((h.lower() for h in missing_hashes), results))
+
+        for tx_hash in list(transactions):
+            try:
+                raw_receipt = receipts[tx_hash.lower()]
+                transactions[tx_hash]["receipt"] = self._make_receipt(
+                    tx_hash, raw_receipt
+                )
+            except ValueError as ex:
+                logger.warning("failed to fetch %s: %s", tx_hash, ex)
+                del transactions[tx_hash]
+
+    def _trace_block(self, block_number: int, transactions: Dict[str, dict]):
+        """Returns the traces of ``transactions`` included in ``block_number``
+        using a single call, or an empty dict if the block cannot be traced
+        """
+        try:
+            traces = self.tracer.trace_block(block_number)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.debug("failed to trace block %s: %s", block_number, ex)
+            return {}
+        hashes_by_index = {
+            tx["transactionIndex"]: tx_hash for tx_hash, tx in transactions.items()
+        }
+        block_traces = {}
+        for index, trace in enumerate(traces):
+            tx_hash = hashes_by_index.get(index)
+            if tx_hash is not None and "result" in trace:
+                block_traces[tx_hash] = trace["result"]
+        return block_traces
+
+    def _submit_window(
+        self,
+        tx_hashes: List[str],
+        executor: ThreadPoolExecutor,
+        traces_executor: Optional[ThreadPoolExecutor],
+    ) -> List[Future]:
+        """Fetches the transactions of a window of hashes and the receipts and
+        traces of its dense blocks, then submits the completion of each batch
+        """
+        batches = [
+            tx_hashes[i : i + self.batch_size]
+            for i in range(0, len(tx_hashes), self.batch_size)
+        ]
+        transactions: Dict[str, dict] = {}
+        for batch_transactions in executor.map(self._fetch_transactions, batches):
+            transactions.update(batch_transactions)
+        dense_blocks = self._group_by_block(transactions)
+        block_receipts: Dict[str, Any] = {}
+        if self.include_receipt and self.min_block_transactions:
+            block_receipts = self._fetch_block_receipts(list(dense_blocks))
+        block_traces: Dict[int, Future] = {}
+        if traces_executor is not None:
+            block_traces = {
+                block_number: traces_executor.submit(
+                    self._trace_block,
+                    block_number,
+                    {tx_hash: transactions[tx_hash] for tx_hash in block_tx_hashes},
+                )
+                for block_number, block_tx_hashes in dense_blocks.items()
+            }
+        return [
+            executor.submit(
+                self._complete_batch,
+                {h: transactions[h] for h in batch if h in transactions},
+                block_receipts,
+                block_traces,
+                traces_executor,
+            )
+            for batch in batches
+        ]
+
+    def _complete_batch(
+        self,
+        transactions: Dict[str, dict],
+        block_receipts: Dict[str, Any],
+        block_traces: Dict[int, Future],
+        traces_executor: Optional[ThreadPoolExecutor],
+    ) -> List[dict]:
+        """Adds the receipts and traces to the ``transactions`` of a batch,
+        using those of the dense blocks of its window when available
+        """
+        if self.include_receipt and self.min_block_transactions:
+            self._fetch_receipts(transactions, block_receipts)
+        if traces_executor is None:
+            return list(transactions.values())
+
+        dense_hashes = {
+            tx_hash
+            for tx_hash, tx in transactions.items()
+            if tx["blockNumber"] in block_traces
+        }
+        trace_futures = self.tracer.submit_traces(
+            [tx_hash for tx_hash in transactions if tx_hash not in dense_hashes],
+            traces_executor,
+        )
+        traces: Dict[str, Any] = {}
+        for block_number in {transactions[h]["blockNumber"] for h in dense_hashes}:
+            traces.update(block_traces[block_number].result())
+
+        result = []
+        for tx_hash, tx in transactions.items():
+            try:
+                if tx_hash in traces:
+                    tx["traces"] = traces[tx_hash]
+                elif tx_hash in trace_futures:
+                    tx["traces"] = trace_futures[tx_hash].result()
+                else:
+                    # the block of the transaction could not be traced
+                    tx["traces"] = self.tracer.trace_transaction(tx_hash)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.warning("failed to trace %s: %s", tx_hash, ex)
+                continue
+            result.append(tx)
+        return result
+
+    def fetch_transactions(self, tx_hashes: Iterable[str]) -> Iterator[dict]:
+        """Fetches the transactions with the given hashes, ignoring duplicates"""
+        unique_hashes = list(dict.fromkeys(tx_hashes))
+        window_size = 2 * self.concurrency * self.batch_size
+        traces_executor = None
+        if self.include_traces:
+            traces_executor = ThreadPoolExecutor(max_workers=self.traces_concurrency)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                # the next window is fetched while the batches of the previous
+                # one are completed
+                futures = (
+                    future
+                    for i in range(0, len(unique_hashes), window_size)
+                    for future in self._submit_window(
+                        unique_hashes[i : i + window_size], executor, traces_executor
+                    )
+                )
+                if self.ordered:
+                    completed = self._iterate_in_order(futures)
+                else:
+                    completed = self._iterate_as_completed(futures)
+                fetched_count = 0
+                for i, transactions in enumerate(completed):
+                    yield from transactions
+                    fetched_count += len(transactions)
+                    if i % 10 == 0:
+                        logger.info(
+                            "progress: %s/%s", fetched_count, len(unique_hashes)
+                        )
+        finally:
+            if traces_executor is not None:
+                traces_executor.shutdown()
+
+    def _iterate_in_order(self, futures: Iterator[Future]) -> Iterator[List[dict]]:
+        pending: Deque[Future] = deque(itertools.islice(futures, 2 * self.concurrency))
+        try:
+            while pending:
+                transactions = pending.popleft().result()
+                pending.extend(itertools.islice(futures, 1))
+                yield transactions
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _iterate_as_completed(self, futures: Iterator[Future]) -> Iterator[List[dict]]:
+        pending = set(itertools.islice(futures, 2 * self.concurrency))
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.update(itertools.islice(futures, len(done)))
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -1,14 +1,69 @@
+from concurrent.futures import Executor, Future
+from typing import Any, Dict, Iterable, Optional
+
 from web3 import Web3
 from retry import retry
 
+from eth_tools.async_engine import AsyncEngine, async_retry
 from eth_tools.logger import logger
 
 
 class TransactionTracer:
-    def __init__(self, web3: Web3):
+    def __init__(self, web3: Web3, engine: Optional[AsyncEngine] = None):
         self.web3 = web3
+        self.engine = engine
+
+    @staticmethod
+    def _make_params(target: str, disable_memory: bool, disable_storage: bool):
+        return [target, {"disableMemory": disable_memory, "disableStorage": disable_storage}]
 
-    @retry(delay=1, backoff=2, tries=3, logger=logger)
     def trace_transaction(self, tx_hash: str, disable_memory=True, disable_storage=True):
-        params = [tx_hash, {"disableMemory": disable_memory, "disableStorage": disable_storage}]
+        if self.engine is not None:
+            return self.engine.run(
+                self.trace_transaction_async(tx_hash, disable_memory, disable_storage)
+            )
+        return self._trace_transaction(tx_hash, disable_memory, disable_storage)
+
+    @retry(delay=1, backoff=2, tries=3, logger=logger)
+    def _trace_transaction(self, tx_hash: str, disable_memory: bool, disable_storage: bool):
+        params = self._make_params(tx_hash, disable_memory, disable_storage)
         return self.web3.manager.request_blocking("debug_traceTransaction", params=params)
+
+    def submit_traces(
+        self, tx_hashes: Iterable[str], executor: Executor
+    ) -> Dict[str, "Future[Any]"]:
+        """Starts tracing ``tx_hashes`` and returns the future trace of each
+        With an engine, all the traces are sent concurrently by its event loop,
+        otherwise they are traced by the threads of ``executor``
+        """
+        if self.engine is None:
+            return {
+                tx_hash: executor.submit(self.trace_transaction, tx_hash)
+                for tx_hash in tx_hashes
+            }
+        return {
+            tx_hash: self.engine.submit(self.trace_transaction_async(tx_hash))
+            for tx_hash in tx_hashes
+        }
+
+    def trace_block(self, block_number: int, disable_memory=True, disable_storage=True):
+        """Returns the traces of all the transactions of the block, in order
+        Not retried, as callers are expected to fall back to ``trace_transaction``
+        """
+        params = self._make_params(hex(block_number), disable_memory, disable_storage)
+        if self.engine is not None:
+            return self.engine.run(
+                self.engine.client.make_request("debug_traceBlockByNumber", params)
+            )
+        return self.web3.manager.request_blocking("debug_traceBlockByNumber", params=params)
+
+    @async_retry(delay=1, backoff=2, tries=3)
+    async def trace_transaction_async(
+        self, tx_hash: str, disable_memory=True, disable_storage=True
+    ):
+        """Same as ``trace_transaction`` but sent using the async engine
+        The trace is returned as raw JSON
+        """
+        assert self.engine is not None
+        params = self._make_params(tx_hash, disable_memory, disable_storage)
+        return await self.engine.client.make_request("debug_traceTransaction", params)
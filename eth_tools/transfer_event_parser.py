@@ -1,19 +1,40 @@
-import os
+import csv
 import json
-
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, Tuple
+
 from eth_tools.logger import logger
+from eth_tools.parquet_writer import ParquetWriter, balance_columns
+from eth_tools.utils import smart_open
+
+# names used by ERC20 contracts for the arguments of 'transfer' events
+TRANSFER_ARGS_KEYS = {
+    'from': {'from', '_from'},
+    'to': {'to', '_to'},
+    'amount': {'amount', 'value', '_value'},
+}
+
+BALANCES_FORMATS = ['jsonl', 'csv', 'parquet']
+# JSON lines balances have historically been written to .csv files
+BALANCES_EXTENSIONS = {'jsonl': '.csv', 'csv': '.csv', 'parquet': '.parquet'}
 
 
 class TransferEventParser:
-    """Parses ERC20 'transfer' events"""
+    """Parses ERC20 'transfer' events
+    Events are streamed and only the transfers of the tracked ``addresses``,
+    looked up in a set, are recorded as per-account arrays of blocks and balance
+    changes. Balances are computed from these arrays using a cumulative sum,
+    with Python ints so that uint256 amounts cannot overflow."""
 
     def __init__(self, addresses: dict, start: int = None, end: int = None):
         self.addresses = addresses
-        for key, val in self.addresses.items():
-            self.addresses[key] = val
-        self.balances = defaultdict(lambda: defaultdict(lambda: 0))
-        self.last_update = defaultdict(lambda: 0)
+        self.tracked_addresses = set(addresses.values())
+        self.blocks = defaultdict(lambda: array('q'))
+        self.changes = defaultdict(list)
+        self._balances = None
         self.start = start
         self.end = end
         self.keys = {}
@@ -21,7 +42,7 @@ class TransferEventParser:
         self.keys['to'] = 'to'
         self.keys['from'] = 'from'
 
-    def execute_events(self, events: list):
+    def execute_events(self, events: Iterable[dict]):
         first_event = True
         for event in events:
             if event['event'] == 'Transfer':
@@ -39,17 +60,36 @@ class TransferEventParser:
         key_from = self.keys['from']
         key_amount = self.keys['amount']
         block = event['blockNumber']
-        if event['args'][key_from] in self.addresses.values():
-            self.update_balance(event['args'][key_from],
-                                -1 * event['args'][key_amount], block)
-        if event['args'][key_to] in self.addresses.values():
-            self.update_balance(event['args'][key_to],
-                                event['args'][key_amount], block)
+        args = event['args']
+        if args[key_from] in self.tracked_addresses:
+            self.update_balance(args[key_from], -args[key_amount], block)
+        if args[key_to] in self.tracked_addresses:
+            self.update_balance(args[key_to], args[key_amount], block)
 
     def update_balance(self, account: str, change: int, block: int):
-        last_updated_block = self.last_update[account]
-        self.balances[account][block] = self.balances[account][last_updated_block] + change
-        self.last_update[account] = block
+        self.blocks[account].append(block)
+        self.changes[account].append(change)
+        self._balances = None
+
+    @property
+    def balances(self) -> Dict[str, Dict[int, int]]:
+        """Balance of each account at the end of each block it was updated in"""
+        if self._balances is None:
+            self._balances = defaultdict(dict)
+            for account in self.blocks:
+                self._balances[account] = self.compute_balances(account)
+        return self._balances
+
+    @balances.setter
+    def balances(self, balances: Dict[str, Dict[int, int]]):
+        self._balances = defaultdict(dict, balances)
+
+    def compute_balances(self, account: str) -> Dict[int, int]:
+        blocks, changes = self.blocks[account], self.changes[account]
+        order = sorted(range(len(blocks)), key=blocks.__getitem__)
+        cumulative_balances = accumulate(changes[i] for i in order)
+        # later balances of a block overwrite the earlier ones
+        return dict(zip((blocks[i] for i in order), cumulative_balances))
 
     def find_key(self, event: dict, candidates: set):
         key = next(iter(candidates & event.keys()), None)
@@ -60,50 +100,88 @@ class TransferEventParser:
     def set_keys(self, event: dict) -> bool:
         """ERC20 contracts don't follow a standard name for transfer args.
         This should be handled here."""
-        self.keys["from"] = self.find_key(event['args'], {"from", "_from"})
-        self.keys["to"] = self.find_key(event['args'], {"to", "_to"})
-        self.keys["amount"] = self.find_key(
-            event['args'], {"amount", "value", "_value"})
+        for name, candidates in TRANSFER_ARGS_KEYS.items():
+            self.keys[name] = self.find_key(event['args'], candidates)
+
+    def iterate_balance_changes(self, address) -> Iterator[Tuple[int, int]]:
+        """Yields the ``(block, balance)`` change points of ``address`` between
+        ``start`` and ``end``: each balance holds until the next change point.
+        If the balance changed before ``start``, it is yielded at ``start``."""
+        balances = self.balances[address]
+        blocks = list(balances.keys())
+        values = list(balances.values())
+        first_index = 0
+        if self.start is not None:
+            first_index = bisect_left(blocks, self.start)
+            if first_index > 0 and (first_index == len(blocks)
+                                    or blocks[first_index] > self.start):
+                yield self.start, values[first_index - 1]
+        last_index = len(blocks)
+        if self.end is not None:
+            last_index = bisect_right(blocks, self.end)
+        yield from zip(blocks[first_index:last_index], values[first_index:last_index])
 
-    def write_balances(self, token: str, interval: int = None, filepath: str = None):
+    def iterate_sampled_balances(self, address,
+                                 interval: int = None) -> Iterator[Tuple[int, int]]:
+        """Yields the balance of ``address`` at the end of every block multiple
+        of ``interval``, up to the last block in which its balance changed.
+        The balance of each sampled block is found using a binary search
+        over the change points, so blocks in between are never visited."""
+        balances = self.balances[address]
+        if not balances:
+            return
+        blocks = list(balances.keys())
+        values = list(balances.values())
+        inter = 1 if interval is None else interval
+        first_block = max(self.start or 1, 1)
+        first_block += -first_block % inter
+        last_block = blocks[-1] if self.end is None else min(self.end, blocks[-1])
+        index = 0
+        for block_number in range(first_block, last_block + 1, inter):
+            # index of the first change point after the current block
+            index = bisect_right(blocks, block_number, index)
+            yield block_number, values[index - 1] if index > 0 else 0
+
+    def write_balances(self, token: str, interval: int = None, filepath: str = None,
+                       changes_only: bool = False, output_format: str = 'jsonl'):
+        """Writes the balances of each address to its own file, either at every
+        ``interval`` blocks or, if ``changes_only`` is true, only at the blocks
+        at which they change"""
         for name, address in self.addresses.items():
-            fname = token.lower()+"-balances:"+name.lower()+'.csv'
+            fname = (token.lower()+"-balances:"+name.lower()
+                     + BALANCES_EXTENSIONS[output_format])
             if filepath is not None:
                 fname = filepath + fname
-            with open(fname, "w") as f:
-                self.write_address_balances(address, f, interval)
+            if changes_only:
+                rows = self.iterate_balance_changes(address)
+            else:
+                rows = self.iterate_sampled_balances(address, interval)
+            write_balance_rows(rows, fname, output_format)
+            logger.info("wrote balances of %s to %s", address, fname)
 
     def write_address_balances(self, address, f, interval: int = None):
-        first_block = True
-        last_balance = 0
-        inter = 1 if interval is None else interval
-        counter = 0
-        for block in self.balances[address].keys():
-            if first_block:
-                last_block = block
-                first_block = False
-            if block == 0:
-                continue
-            # fill in missing blocks
-            block_number = last_block + 1
-            while block_number <= block - 1:
-                counter += 1
-                if counter % inter == 0:
-                    self.log_balance(
-                        counter, f, block_number, last_balance)
-                block_number += 1
-            counter += 1
-            if counter % inter == 0:
-                self.log_balance(
-                    counter, f, block, self.balances[address][block])
-            last_balance = self.balances[address][block]
-            last_block = block
-
-    def log_balance(self, counter: int, f, block_number: int, balance: int):
-        if self.start is not None and self.start > block_number:
-            return
-        if self.end is not None and self.end < block_number:
+        """Writes the balance of ``address`` at the end of every block multiple
+        of ``interval`` as JSON lines"""
+        for block_number, balance in self.iterate_sampled_balances(address, interval):
+            f.write(json.dumps(
+                {'blockNumber': block_number, 'balance': balance})+"\n")
+
+
+def write_balance_rows(rows: Iterable[Tuple[int, int]], filepath: str,
+                       output_format: str = 'jsonl'):
+    """Writes ``(block, balance)`` rows as JSON lines, CSV or Parquet.
+    Balances do not fit 64-bit integers and are stored as strings in Parquet."""
+    if output_format == 'parquet':
+        with ParquetWriter(filepath, balance_columns()) as writer:
+            for block_number, balance in rows:
+                writer.write({'blockNumber': block_number, 'balance': balance})
+        return
+    with smart_open(filepath, "w") as f:
+        if output_format == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(['blockNumber', 'balance'])
+            writer.writerows(rows)
             return
-        logger.info("Blocks: %i", counter)
-        f.write(json.dumps(
-            {'blockNumber': block_number, 'balance': balance})+"\n")
+        for block_number, balance in rows:
+            f.write(json.dumps(
+                {'blockNumber': block_number, 'balance': balance})+"\n")
@@ -19,6 +19,12 @@ setup(
         "retry",
     ],
     extras_require={
+        "async": [
+            "aiohttp",
+        ],
+        "parquet": [
+            "pyarrow",
+        ],
         "dev": [
             "pylint",
             "black",
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from web3 import HTTPProvider, Web3
+
+from eth_tools.async_engine import AsyncEngine
+from eth_tools.block_iterator import BlockIterator
+from eth_tools.contract_caller import ContractCaller
+from eth_tools.event_fetcher import ContractFetcher
+from eth_tools.request_scheduler import RequestScheduler, ScheduledHTTPProvider
+from eth_tools.transaction_details_fetcher import TransactionDetailsFetcher
+from eth_tools.transaction_tracer import TransactionTracer
+
+
+@pytest.fixture
+def engine(fake_node):
+    with AsyncEngine(fake_node.uri, max_concurrent_requests=64) as async_engine:
+        yield async_engine
+
+
+def test_blocks_with_engine(fake_node, engine):
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    block_iterator = BlockIterator(
+        web3, start_block=0, end_block=249, batch_size=7, concurrency=8, engine=engine
+    )
+    assert [block.number for block in block_iterator] == list(range(250))
+    assert fake_node.requests_count == 36
+
+
+def test_blocks_with_engine_concurrency(fake_node, engine):
+    fake_node.latency = 0.05
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    block_iterator = BlockIterator(
+        web3, start_block=0, end_block=639, batch_size=10, concurrency=32, engine=engine
+    )
+    start = time.time()
+    assert len(list(block_iterator)) == 640
+    elapsed = time.time() - start
+    # more requests in flight than the threads used by the default path
+    assert fake_node.max_in_flight > 8
+    assert elapsed < 64 * fake_node.latency / 4
+
+
+def test_events_with_engine(fake_node, token_contract, engine):
+    expected_events = list(ContractFetcher(token_contract).fetch_events(0, 49_999))
+    fake_node.max_logs = 100
+
+    fetcher = ContractFetcher(
+        token_contract, batch_size=2, concurrency=4, engine=engine
+    )
+    assert list(fetcher.fetch_events(0, 49_999)) == expected_events
+    # ranges over the limit are split
+    assert fetcher.requests_count > 5
+
+
+def test_call_contract_with_engine(token_contract, engine):
+    expected_results = list(
+        ContractCaller(token_contract).collect_results(
+            "totalSupply", start_block=0, end_block=9_999, block_interval=100
+        )
+    )
+    contract_caller = ContractCaller(token_contract, engine=engine)
+    results = contract_caller.collect_results(
+        "totalSupply", start_block=0, end_block=9_999, block_interval=100
+    )
+    assert list(results) == expected_results
+    assert expected_results[1] == (100, 100)
+
+
+def test_trace_transaction_with_engine(engine):
+    tracer = TransactionTracer(Web3(), engine=engine)
+    trace = tracer.trace_transaction("0x" + "ab" * 32)
+    assert trace["returnValue"] == "0x" + "ab" * 32
+
+
+def test_engine_shares_scheduler_limits(fake_node):
+    fake_node.latency = 0.02
+    scheduler = RequestScheduler(max_concurrent_requests=4)
+    web3 = Web3(ScheduledHTTPProvider(fake_node.uri, scheduler=scheduler))
+    with AsyncEngine(fake_node.uri, scheduler=scheduler) as engine:
+        assert engine.max_concurrent_requests == 4
+
+        async def send_requests():
+            calls = [
+                engine.client.make_request("eth_blockNumber", []) for _ in range(40)
+            ]
+            return await asyncio.gather(*calls)
+
+        future = engine.submit(send_requests())
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: web3.eth.blockNumber, range(40)))
+        assert future.result() == [hex(fake_node.head)] * 40
+    assert results == [fake_node.head] * 40
+    # synchronous and asynchronous requests share the same slots
+    assert fake_node.max_in_flight == 4
+
+
+def test_engine_rate_limited_pauses_scheduler(fake_node):
+    fake_node.rate_limited_count = 1
+    scheduler = RequestScheduler(backoff=0.05)
+    with AsyncEngine(fake_node.uri, scheduler=scheduler) as engine:
+        start = time.monotonic()
+        assert engine.run(engine.client.make_request("eth_blockNumber", []))
+    # the 429 response paused the scheduler shared with synchronous requests
+    assert scheduler._paused_until > start  # pylint: disable=protected-access
+
+
+def test_call_contract_with_engine_retries(fake_node, token_contract, engine):
+    call = fake_node.methods["eth_call"]
+    failures = [ValueError("node error")]
+
+    def failing_call(*params):
+        if failures:
+            raise failures.pop()
+        return call(*params)
+
+    fake_node.methods["eth_call"] = failing_call
+    contract_caller = ContractCaller(token_contract, engine=engine)
+    assert contract_caller.call_func("totalSupply", 100, []) == 100
+    assert not failures
+
+
+def test_trace_transactions_with_engine(fake_node, engine):
+    fake_node.latency = 0.05
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    tx_hashes = [
+        "0x" + format(block * 1_000, "064x") for block in range(1, 26) if block % 5
+    ]
+    fetcher = TransactionDetailsFetcher(
+        web3,
+        include_traces=True,
+        batch_size=20,
+        traces_concurrency=1,
+        min_block_transactions=0,
+        tracer=TransactionTracer(web3, engine=engine),
+    )
+    transactions = list(fetcher.fetch_transactions(tx_hashes))
+    assert [tx["traces"]["returnValue"] for tx in transactions] == tx_hashes
+    # traces are sent concurrently by the engine, not by the single thread
+    assert fake_node.max_in_flight > 10
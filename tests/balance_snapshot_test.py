@@ -0,0 +1,102 @@
+import csv
+import json
+import random
+from collections import defaultdict
+
+import pytest
+
+from eth_tools.balance_snapshot import BalanceSnapshotter, take_snapshots
+
+ZERO_ADDRESS = "0x" + "00" * 20
+HOLDERS = ["0x" + format(i, "040x") for i in range(1, 50)]
+
+
+def make_transfers(start_block: int, end_block: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [
+        {
+            "event": "Transfer",
+            "blockNumber": block,
+            "args": {
+                "_from": rng.choice(HOLDERS),
+                "_to": rng.choice(HOLDERS),
+                "_value": rng.getrandbits(255),
+            },
+        }
+        for block in range(start_block, end_block + 1)
+        for _ in range(block % 3)
+    ]
+
+
+def expected_balances(events, block: int):
+    balances = defaultdict(int)
+    for event in events:
+        if event["blockNumber"] <= block:
+            balances[event["args"]["_from"]] -= event["args"]["_value"]
+            balances[event["args"]["_to"]] += event["args"]["_value"]
+    return {address: balance for address, balance in balances.items() if balance}
+
+
+def test_replay():
+    events = make_transfers(1, 1_000)
+    snapshotter = BalanceSnapshotter()
+    snapshots = {
+        block: {"0x" + address.hex(): balance for address, balance in holders}
+        for block, holders in snapshotter.replay(events, [500, 100, 2_000])
+    }
+    assert list(snapshots) == [100, 500, 2_000]
+    for block, balances in snapshots.items():
+        assert balances == expected_balances(events, block)
+
+
+def test_replay_mints_and_burns():
+    def transfer(block, sender, receiver, value):
+        return {
+            "event": "Transfer",
+            "blockNumber": block,
+            "args": {"_from": sender, "_to": receiver, "_value": value},
+        }
+
+    events = [
+        transfer(1, ZERO_ADDRESS, HOLDERS[0], 100),
+        transfer(2, HOLDERS[0], HOLDERS[1], 30),
+        transfer(3, HOLDERS[1], ZERO_ADDRESS, 10),
+    ]
+    snapshots = {
+        block: {"0x" + address.hex(): balance for address, balance in holders}
+        for block, holders in BalanceSnapshotter().replay(events, [1, 3])
+    }
+    assert snapshots == {
+        1: {HOLDERS[0]: 100},
+        3: {HOLDERS[0]: 70, HOLDERS[1]: 20},
+    }
+
+
+def read_snapshot(filepath: str) -> dict:
+    with open(filepath) as f:
+        return {row["address"]: int(row["balance"]) for row in csv.DictReader(f)}
+
+
+def test_take_snapshots_from_checkpoint(tmp_path):
+    events = make_transfers(1, 1_000)
+    lines = [json.dumps(event) for event in events]
+    checkpoint = str(tmp_path / "balances.checkpoint")
+    output_prefix = str(tmp_path / "snapshot-")
+    first_events = [event for event in events if event["blockNumber"] <= 600]
+    take_snapshots(
+        lines[: len(first_events)], [300], output_prefix, checkpoint=checkpoint
+    )
+    assert read_snapshot(output_prefix + "300.csv") == expected_balances(events, 300)
+
+    # events already applied are skipped without being parsed
+    lines[: len(first_events)] = ["not json"] * len(first_events)
+    filepaths = take_snapshots(
+        lines, [800, 1_000], output_prefix, checkpoint=checkpoint
+    )
+    assert filepaths == [output_prefix + "800.csv", output_prefix + "1000.csv"]
+    for block in (800, 1_000):
+        expected = expected_balances(events, block)
+        assert read_snapshot(output_prefix + f"{block}.csv") == expected
+
+    with pytest.raises(ValueError, match="already computed"):
+        take_snapshots(lines, [900], output_prefix, checkpoint=checkpoint)
@@ -1,6 +1,10 @@
+import math
+import time
 from unittest.mock import PropertyMock, MagicMock, call
 
 import pytest
+from web3 import HTTPProvider, Web3
+from web3.exceptions import BlockNotFound
 from web3.types import BlockData
 
 from eth_tools.block_iterator import BlockIterator
@@ -31,3 +35,47 @@ def test_next(web3):
     assert block_iterator.processed_count == 2
 
     web3.eth.getBlock.assert_has_calls([call(0), call(1)])
+
+
+def test_batched_blocks_are_ordered(fake_node):
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    block_iterator = BlockIterator(
+        web3, start_block=10, end_block=259, batch_size=7, concurrency=4
+    )
+    blocks = list(block_iterator)
+    assert [block.number for block in blocks] == list(range(10, 260))
+    assert blocks[3].miner == Web3.toChecksumAddress("0x" + "ab" * 20)
+    assert blocks[3].transactions_count == 13 % 5
+    assert block_iterator.processed_count == 250
+    assert block_iterator.current_block is None
+    assert fake_node.requests_count == math.ceil(250 / 7)
+
+
+def test_batched_blocks_from_list(fake_node):
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    block_numbers = [5, 1, 42, 3, 17]
+    block_iterator = BlockIterator(web3, blocks=block_numbers, batch_size=2)
+    assert [block.number for block in block_iterator] == block_numbers
+
+
+def test_batched_blocks_throughput(fake_node):
+    fake_node.latency = 0.05
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    block_iterator = BlockIterator(
+        web3, start_block=0, end_block=399, batch_size=25, concurrency=8
+    )
+    start = time.time()
+    assert len(list(block_iterator)) == 400
+    elapsed = time.time() - start
+    assert fake_node.requests_count == 16
+    assert fake_node.max_in_flight > 1
+    # fetching the 16 batches sequentially would take at least 16 * latency
+    assert elapsed < 16 * fake_node.latency
+
+
+def test_missing_block(fake_node):
+    fake_node.head = 10
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    block_iterator = BlockIterator(web3, start_block=5, end_block=15, batch_size=4)
+    with pytest.raises(BlockNotFound):
+        list(block_iterator)
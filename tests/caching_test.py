@@ -0,0 +1,123 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from eth_tools.caching import CacheStore, MemoryCache, cache
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CacheStore(str(tmp_path / "cache.sqlite3"), max_size=10_000)
+
+
+def test_store_get_set(store):
+    assert store.get("key") == (None, False)
+    store.set("key", {"value": [1, 2]})
+    assert store.get("key") == ({"value": [1, 2]}, True)
+
+
+def test_store_ttl(store):
+    store.set("expired", 1, ttl=0)
+    store.set("valid", 2, ttl=60)
+    assert store.get("expired") == (None, False)
+    assert store.get("valid") == (2, True)
+    store.sweep()
+    count = store._connection().execute("SELECT COUNT(*) FROM entries").fetchone()
+    assert count == (1,)
+
+
+def test_store_evicts_least_recently_used(store, monkeypatch):
+    monkeypatch.setattr("eth_tools.caching.ACCESS_TIME_RESOLUTION", 0)
+    for i in range(8):
+        store.set(f"key-{i}", b"x" * 2_000)
+        time.sleep(0.01)
+    assert [i for i in range(8) if store.get(f"key-{i}")[1]] == [4, 5, 6, 7]
+    time.sleep(0.01)
+    store.get("key-4")
+    store.set("key-8", b"x" * 2_000)
+    assert [i for i in range(9) if store.get(f"key-{i}")[1]] == [4, 6, 7, 8]
+
+
+def test_store_total_size(store):
+    store.set("a", b"x" * 1_000)
+    store.set("b", b"x" * 2_000)
+    store.set("a", b"x" * 500)
+    sizes = store._connection().execute("SELECT SUM(size) FROM entries").fetchone()
+    assert store.total_size() == sizes[0]
+    store.set("expired", b"x" * 3_000, ttl=0)
+    store.sweep()
+    assert store.total_size() == sizes[0]
+    # the total size is shared with the other stores of the file
+    assert CacheStore(store.filepath).total_size() == sizes[0]
+    store.clear()
+    assert store.total_size() == 0
+
+
+def test_store_concurrent_writes(store):
+    def write(i):
+        store.set(f"key-{i % 10}", i)
+        return store.get(f"key-{i % 10}")[1]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(write, range(200)))
+
+
+def test_memory_cache_bounded():
+    memory_cache = MemoryCache(ttl=-1, max_entries=2)
+    memory_cache.set("a", 1)
+    memory_cache.set("b", 2)
+    memory_cache.get("a")
+    memory_cache.set("c", 3)
+    assert memory_cache.get("b") == (None, False)
+    assert memory_cache.get("a") == (1, True)
+
+
+def test_cache_decorator(store):
+    calls = []
+
+    @cache(ttl=-1, min_disk_time=0, store=store)
+    def compute(value):
+        calls.append(value)
+        return value * 2
+
+    assert compute(2) == 4
+    assert compute(2) == 4
+    assert compute(3) == 6
+    assert calls == [2, 3]
+
+
+def test_cache_single_flight(store):
+    calls = []
+    barrier = threading.Barrier(20)
+
+    @cache(ttl=-1, min_disk_time=0, store=store)
+    def fetch(address):
+        calls.append(address)
+        time.sleep(0.2)
+        return address.upper()
+
+    def run(_i):
+        barrier.wait()
+        return fetch("0xabc")
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = list(executor.map(run, range(20)))
+    assert results == ["0XABC"] * 20
+    assert calls == ["0xabc"]
+
+
+def test_cache_single_flight_error(store):
+    calls = []
+
+    @cache(ttl=-1, min_disk_time=0, store=store)
+    def failing(value):
+        calls.append(value)
+        raise ValueError("failed")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            failing(1)
+    # errors are not cached
+    assert calls == [1, 1]
@@ -0,0 +1,89 @@
+import gzip
+
+import pytest
+
+from eth_tools.checkpoint import Checkpoint, CheckpointedWriter
+
+ADDRESS = "0x" + "12" * 20
+
+
+@pytest.mark.parametrize("filename", ["events.jsonl", "events.jsonl.gz"])
+def test_resume_after_failure(tmp_path, filename):
+    filepath = str(tmp_path / filename)
+    with CheckpointedWriter(filepath, ADDRESS, 100) as writer:
+        assert writer.last_block == 99
+        writer.write("a")
+        writer.write("b")
+        writer.commit(199)
+        writer.write("lost")
+
+    checkpoint = Checkpoint.load(filepath + ".checkpoint")
+    assert checkpoint.last_block == 199
+
+    with CheckpointedWriter(filepath, ADDRESS, 100, resume=True) as writer:
+        assert writer.last_block == 199
+        writer.write("c")
+        writer.commit(299)
+
+    open_file = gzip.open if filename.endswith(".gz") else open
+    with open_file(filepath, "rt") as f:
+        assert f.read().splitlines() == ["a", "b", "c"]
+
+
+def test_resume_without_checkpoint(tmp_path):
+    filepath = str(tmp_path / "events.jsonl")
+    with CheckpointedWriter(filepath, ADDRESS, 100, resume=True) as writer:
+        assert writer.last_block == 99
+
+
+def test_resume_deleted_file(tmp_path):
+    filepath = tmp_path / "events.jsonl"
+    with CheckpointedWriter(str(filepath), ADDRESS, 100) as writer:
+        writer.write("a")
+        writer.commit(199)
+    filepath.unlink()
+    with CheckpointedWriter(str(filepath), ADDRESS, 100, resume=True) as writer:
+        assert writer.last_block == 99
+        writer.write("b")
+        writer.commit(299)
+    assert filepath.read_text().splitlines() == ["b"]
+
+
+def test_resume_after_failed_fresh_run(tmp_path):
+    filepath = tmp_path / "events.jsonl"
+    with CheckpointedWriter(str(filepath), ADDRESS, 100) as writer:
+        writer.write("a" * 100)
+        writer.commit(199)
+    # a new run without resume fails before its first commit
+    with CheckpointedWriter(str(filepath), ADDRESS, 100) as writer:
+        writer.write("b")
+    with CheckpointedWriter(str(filepath), ADDRESS, 100, resume=True) as writer:
+        assert writer.last_block == 99
+        writer.write("c")
+        writer.commit(299)
+    assert filepath.read_text().splitlines() == ["c"]
+
+
+def test_resume_truncated_file(tmp_path):
+    filepath = tmp_path / "events.jsonl"
+    with CheckpointedWriter(str(filepath), ADDRESS, 100) as writer:
+        writer.write("a")
+        writer.commit(199)
+    filepath.write_text("")
+    with CheckpointedWriter(str(filepath), ADDRESS, 100, resume=True) as writer:
+        assert writer.last_block == 99
+
+
+def test_resume_other_task(tmp_path):
+    filepath = str(tmp_path / "events.jsonl")
+    with CheckpointedWriter(filepath, ADDRESS, 100) as writer:
+        writer.commit(199)
+    with pytest.raises(ValueError):
+        CheckpointedWriter(filepath, ADDRESS, 150, resume=True)
+
+
+def test_supports():
+    assert CheckpointedWriter.supports("/tmp/events.jsonl.gz")
+    assert CheckpointedWriter.supports("events.jsonl")
+    assert not CheckpointedWriter.supports("s3://bucket/events.jsonl.gz")
+    assert not CheckpointedWriter.supports("events.jsonl.bz2")
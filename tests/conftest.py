@@ -1,9 +1,29 @@
+import json
 from unittest.mock import MagicMock
 
 import pytest
+from web3 import HTTPProvider, Web3
+
+from tests.fake_node import ERC20_ABI_PATH, TOKEN_ADDRESS, FakeNode, make_token_logs
 
 
 @pytest.fixture(scope="module")
 def web3():
     web3_mock = MagicMock()
     return web3_mock
+
+
+@pytest.fixture
+def fake_node():
+    node = FakeNode().start()
+    yield node
+    node.stop()
+
+
+@pytest.fixture
+def token_contract(fake_node):
+    fake_node.logs = make_token_logs(0, 49_999)
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    with open(ERC20_ABI_PATH) as f:
+        abi = json.load(f)
+    return web3.eth.contract(address=Web3.toChecksumAddress(TOKEN_ADDRESS), abi=abi)
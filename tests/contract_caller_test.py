@@ -0,0 +1,150 @@
+import json
+
+import pytest
+from eth_abi import decode_abi, encode_abi
+from eth_utils import function_signature_to_4byte_selector, to_bytes
+from web3 import HTTPProvider, Web3
+
+from eth_tools.async_engine import AsyncEngine
+from eth_tools.commands import parse_call
+from eth_tools.constants import MULTICALL_ADDRESS
+from eth_tools.contract_caller import ContractCaller
+from tests.fake_node import ERC20_ABI_PATH, TOKEN_ADDRESS
+
+BALANCE_OF_SELECTOR = function_signature_to_4byte_selector("balanceOf(address)")
+SYMBOL_SELECTOR = function_signature_to_4byte_selector("symbol()")
+HOLDERS = [Web3.toChecksumAddress("0x" + format(i, "040x")) for i in range(1, 8)]
+
+
+def call_token(call_data: bytes, block_number: int) -> bytes:
+    """Balance of holder ``i`` at block ``b`` is ``i * b``, holder 3 reverts"""
+    if call_data[:4] == SYMBOL_SELECTOR:
+        return encode_abi(["string"], ["TOK"])
+    assert call_data[:4] == BALANCE_OF_SELECTOR
+    (holder,) = decode_abi(["address"], call_data[4:])
+    holder_index = int(holder, 16)
+    if holder_index == 3:
+        raise ValueError("execution reverted")
+    return encode_abi(["uint256"], [holder_index * block_number])
+
+
+def eth_call(transaction: dict, block_number: str):
+    data = to_bytes(hexstr=transaction["data"])
+    block = int(block_number, 16)
+    if transaction["to"].lower() != MULTICALL_ADDRESS.lower():
+        return "0x" + call_token(data, block).hex()
+    _require_success, calls = decode_abi(["bool", "(address,bytes)[]"], data[4:])
+    results = []
+    for _target, call_data in calls:
+        try:
+            results.append((True, call_token(call_data, block)))
+        except ValueError:
+            results.append((False, b""))
+    return "0x" + encode_abi(["(bool,bytes)[]"], [results]).hex()
+
+
+def eth_call_count(fake_node) -> int:
+    return fake_node.methods["eth_call"].calls_count
+
+
+@pytest.fixture
+def token_contract(fake_node):
+    def counted_eth_call(transaction: dict, block_number: str):
+        counted_eth_call.calls_count += 1
+        return eth_call(transaction, block_number)
+
+    counted_eth_call.calls_count = 0
+    fake_node.methods["eth_call"] = counted_eth_call
+    web3 = Web3(HTTPProvider(fake_node.uri))
+    with open(ERC20_ABI_PATH) as f:
+        abi = json.load(f)
+    return web3.eth.contract(address=Web3.toChecksumAddress(TOKEN_ADDRESS), abi=abi)
+
+
+def test_collect_multicall_results(fake_node, token_contract):
+    contract_caller = ContractCaller(token_contract)
+    calls = [("balanceOf", [holder]) for holder in HOLDERS]
+    results = list(
+        contract_caller.collect_multicall_results(
+            calls,
+            start_block=100,
+            end_block=1_000,
+            block_interval=100,
+            calls_per_request=4,
+        )
+    )
+    expected_results = [
+        (block, "balanceOf", [holder], int(holder, 16) * block)
+        for block in range(100, 1_001, 100)
+        for holder in HOLDERS
+        if int(holder, 16) != 3
+    ]
+    assert results == expected_results
+    # two calls per block of at most 4 balanceOf each
+    assert eth_call_count(fake_node) == 2 * 10
+
+
+def test_collect_multicall_results_before_deployment(fake_node, token_contract):
+    fake_node.methods["eth_getCode"] = lambda _address, block_number: (
+        "0x6080" if int(block_number, 16) >= 450 else "0x"
+    )
+    calls = [("balanceOf", [holder]) for holder in HOLDERS if int(holder, 16) != 3]
+    expected_results = [
+        (block, "balanceOf", [holder], int(holder, 16) * block)
+        for block in range(100, 1_001, 100)
+        for _func, [holder] in calls
+    ]
+    contract_caller = ContractCaller(token_contract)
+    results = contract_caller.collect_multicall_results(
+        calls, 100, 1_000, 100, calls_per_request=4
+    )
+    assert list(results) == expected_results
+    # one call per holder before block 500, then two calls per block
+    assert eth_call_count(fake_node) == 4 * 6 + 2 * 6
+
+    with AsyncEngine(fake_node.uri) as engine:
+        contract_caller = ContractCaller(token_contract, engine=engine)
+        results = contract_caller.collect_multicall_results(
+            calls, 100, 1_000, 100, calls_per_request=4
+        )
+        assert list(results) == expected_results
+
+
+def test_collect_multicall_results_with_engine(fake_node, token_contract):
+    calls = [("balanceOf", [f"{holder}:address"]) for holder in HOLDERS]
+    expected_results = list(
+        ContractCaller(token_contract).collect_multicall_results(calls, 0, 500, 50)
+    )
+    with AsyncEngine(fake_node.uri) as engine:
+        contract_caller = ContractCaller(token_contract, engine=engine)
+        results = contract_caller.collect_multicall_results(calls, 0, 500, 50)
+        assert list(results) == expected_results
+
+
+def test_collect_multicall_results_different_functions(fake_node, token_contract):
+    calls = [("symbol", []), ("balanceOf", [HOLDERS[1]])]
+    contract_caller = ContractCaller(token_contract)
+    results = contract_caller.collect_multicall_results(calls, 100, 200, 100)
+    assert list(results) == [
+        (100, "symbol", [], "TOK"),
+        (100, "balanceOf", [HOLDERS[1]], 200),
+        (200, "symbol", [], "TOK"),
+        (200, "balanceOf", [HOLDERS[1]], 400),
+    ]
+    assert eth_call_count(fake_node) == 2
+
+
+def test_parse_call():
+    assert parse_call("0x01, 2:u256", "balanceOf") == ("balanceOf", ["0x01", "2:u256"])
+    assert parse_call("totalSupply()", None) == ("totalSupply", [])
+    assert parse_call("allowance(0x01,0x02)", None) == ("allowance", ["0x01", "0x02"])
+    with pytest.raises(ValueError, match="no function"):
+        parse_call("0x01", None)
+
+
+def test_collect_results_single_call(token_contract):
+    contract_caller = ContractCaller(token_contract)
+    results = contract_caller.collect_results(
+        "balanceOf", 100, 300, 100, contract_args=[HOLDERS[1]]
+    )
+    assert list(results) == [(100, 200), (200, 400), (300, 600)]
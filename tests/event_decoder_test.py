@@ -0,0 +1,77 @@
+import gzip
+
+import pytest
+
+from eth_tools.commands import create_encoder
+from eth_tools.event_decoder import EventEncoder, decode_events
+from eth_tools.event_fetcher import ContractFetcher, EventFetcher, FetchTask
+from tests.fake_node import (
+    TOKEN_ADDRESS,
+    TRANSFER_TOPIC,
+    make_bulk_tasks,
+    read_events_files,
+)
+
+
+def test_fetch_raw_events(token_contract):
+    events = list(ContractFetcher(token_contract, raw=True).fetch_events(0, 9_999))
+    assert len(events) == 150
+    assert "args" not in events[0]
+    assert events[0]["topics"][0].hex() == TRANSFER_TOPIC
+    assert events[0]["data"] == "0x" + format(0, "064x")
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_decode_events(token_contract, tmp_path, processes):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 49_999)
+    decoded_file = str(tmp_path / "events.jsonl")
+    raw_file = str(tmp_path / "raw-events.jsonl.gz")
+    EventFetcher(token_contract.web3).fetch_and_persist_events(task, decoded_file)
+    fetcher = EventFetcher(token_contract.web3, raw=True)
+    fetcher.fetch_and_persist_events(task, raw_file)
+
+    output_file = str(tmp_path / "decoded-events.jsonl")
+    decode_events(
+        raw_file, output_file, token_contract.abi, processes=processes, chunk_size=64
+    )
+    with open(output_file) as f, open(decoded_file) as expected_f:
+        assert f.read() == expected_f.read()
+
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_fetch_and_persist_events_with_encoder(token_contract, tmp_path, raw):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 49_999)
+    expected_file = str(tmp_path / "expected-events.jsonl")
+    fetcher = EventFetcher(token_contract.web3, raw=raw, batch_size=2)
+    fetcher.fetch_and_persist_events(task, expected_file)
+
+    output_file = str(tmp_path / "events.jsonl.gz")
+    with EventEncoder(processes=2) as encoder:
+        fetcher = EventFetcher(
+            token_contract.web3, raw=raw, batch_size=2, encoder=encoder
+        )
+        fetcher.fetch_and_persist_events(task, output_file)
+    with gzip.open(output_file, "rt") as f, open(expected_file) as expected_f:
+        assert f.read() == expected_f.read()
+
+
+def test_fetch_all_events_with_encoder(fake_node, token_contract, tmp_path):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    (tmp_path / "expected").mkdir()
+    fetcher = EventFetcher(token_contract.web3, unit_blocks=2_000, group_size=3)
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path / "expected"))
+
+    with EventEncoder(processes=2) as encoder:
+        fetcher = EventFetcher(
+            token_contract.web3, unit_blocks=2_000, group_size=3, encoder=encoder
+        )
+        fetcher.fetch_all_events(fetch_tasks, str(tmp_path))
+    expected_lines = read_events_files(tmp_path / "expected", fetch_tasks)
+    assert read_events_files(tmp_path, fetch_tasks) == expected_lines
+
+
+def test_create_encoder():
+    with create_encoder({"processes": 0}) as encoder:
+        assert encoder is None
+    with create_encoder({"processes": 1}) as encoder:
+        assert encoder is not None and encoder.processes == 1
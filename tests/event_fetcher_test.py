@@ -0,0 +1,364 @@
+import gzip
+import json
+import math
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from web3 import Web3
+
+from eth_tools.event_fetcher import BulkTask, ContractFetcher, EventFetcher, FetchTask
+from tests.fake_node import (
+    OTHER_TOKEN_ADDRESS,
+    TOKEN_ADDRESS,
+    TRANSFER_TOPIC,
+    encode_address,
+    make_bulk_tasks,
+    make_log,
+    read_events_files,
+)
+
+MAX_LOGS = 500
+
+
+def make_events(start_block: int, end_block: int):
+    """One event every 100 blocks, except between blocks 55,000 and 55,009
+    where there are 100 events per block
+    """
+    events = []
+    for block in range(start_block, end_block + 1):
+        if 55_000 <= block < 55_010:
+            events.extend({"blockNumber": block, "logIndex": i} for i in range(100))
+        elif block % 100 == 0:
+            events.append({"blockNumber": block, "logIndex": 0})
+    return events
+
+
+def limited_fetch_events(start_block: int, end_block: int):
+    events = make_events(start_block, end_block)
+    if len(events) > MAX_LOGS:
+        raise ValueError("query returned more than 500 results")
+    return events
+
+
+@pytest.fixture
+def contract_fetcher():
+    contract = MagicMock(events=[], address="0x" + "12" * 20)
+    fetcher = ContractFetcher(contract)
+    fetcher._fetch_events = MagicMock(side_effect=limited_fetch_events)
+    return fetcher
+
+
+def test_fetch_events_adaptive_range(contract_fetcher):
+    events = list(contract_fetcher.fetch_events(0, 199_999))
+    assert events == make_events(0, 199_999)
+    # falling back to fixed granularities would need 10,000 single block
+    # requests for the range containing blocks 55,000 to 55,009
+    assert contract_fetcher.requests_count < 100
+    assert contract_fetcher.block_range == ContractFetcher.MAX_BLOCK_RANGE
+
+
+def test_fetch_events_shrinks_only_failing_range(contract_fetcher):
+    events = list(contract_fetcher.fetch_events(50_000, 59_999))
+    assert events == make_events(50_000, 59_999)
+    fetched_ranges = [c.args for c in contract_fetcher._fetch_events.call_args_list]
+    assert fetched_ranges[:3] == [(50_000, 59_999), (50_000, 54_999), (55_000, 59_999)]
+    assert (50_000, 52_499) not in fetched_ranges
+
+
+def test_fetch_events_concurrent(contract_fetcher):
+    contract_fetcher.concurrency = 4
+    events = list(contract_fetcher.fetch_events(0, 199_999))
+    assert events == make_events(0, 199_999)
+    executor = contract_fetcher.executor
+    list(contract_fetcher.fetch_events(0, 99_999))
+    assert contract_fetcher.executor is executor
+    contract_fetcher.close()
+
+
+def test_fetch_events_bounded_read_ahead(contract_fetcher):
+    contract_fetcher.concurrency = 2
+    events = contract_fetcher.fetch_events(0, 10_000_000)
+    assert next(events) == {"blockNumber": 0, "logIndex": 0}
+    time.sleep(0.1)
+    assert contract_fetcher._fetch_events.call_count <= 4
+    events.close()
+    contract_fetcher.close()
+
+
+def test_fetch_events_single_block_failure(contract_fetcher):
+    contract_fetcher._fetch_events.side_effect = ValueError("node error")
+    with pytest.raises(ValueError, match="from block 10 to 10"):
+        list(contract_fetcher.fetch_events(10, 10))
+
+
+def test_fetch_events_get_logs(fake_node, token_contract):
+    events = list(ContractFetcher(token_contract).fetch_events(0, 49_999))
+    assert len(events) == 500 + 250
+    assert events[0]["event"] == "Transfer"
+    assert events[0]["args"] == {
+        "from": Web3.toChecksumAddress("0x" + "01" * 20),
+        "to": Web3.toChecksumAddress("0x" + "02" * 20),
+        "value": 0,
+    }
+    assert events[1]["event"] == "Approval"
+    # a single eth_getLogs call per range, where filters needed
+    # eth_newFilter and eth_getFilterLogs calls
+    assert fake_node.calls_count == 5
+    assert fake_node.requests_count == 5
+
+
+def test_fetch_events_batched(fake_node, token_contract):
+    expected_events = list(ContractFetcher(token_contract).fetch_events(0, 49_999))
+    fake_node.requests_count = fake_node.calls_count = 0
+
+    fetcher = ContractFetcher(token_contract, batch_size=2)
+    assert list(fetcher.fetch_events(0, 49_999)) == expected_events
+    assert fake_node.calls_count == 5
+    assert fake_node.requests_count == math.ceil(5 / 2)
+
+
+def test_fetch_events_batched_with_limit(fake_node, token_contract):
+    expected_events = list(ContractFetcher(token_contract).fetch_events(0, 49_999))
+    fake_node.max_logs = 100
+
+    fetcher = ContractFetcher(token_contract, batch_size=4)
+    assert list(fetcher.fetch_events(0, 49_999)) == expected_events
+    assert fetcher.block_range < ContractFetcher.MAX_BLOCK_RANGE
+
+
+def test_fetch_events_by_name(fake_node, token_contract):
+    list(ContractFetcher(token_contract).fetch_events(0, 49_999))
+    all_events_bytes = fake_node.bytes_sent
+    fake_node.bytes_sent = 0
+
+    fetcher = ContractFetcher(token_contract, event_names=["Transfer"])
+    events = list(fetcher.fetch_events(0, 49_999))
+    assert len(events) == 500
+    assert all(event["event"] == "Transfer" for event in events)
+    assert fake_node.bytes_sent < all_events_bytes * 0.7
+
+
+def test_fetch_events_unknown_name(token_contract):
+    with pytest.raises(ValueError, match="Swap"):
+        ContractFetcher(token_contract, event_names=["Transfer", "Swap"])
+
+
+def test_fetch_and_persist_events_resume(fake_node, token_contract, tmp_path):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 49_999)
+    output_file = str(tmp_path / "events.jsonl.gz")
+    fetcher = EventFetcher(token_contract.web3, checkpoint_interval=0)
+    fetcher.fetch_and_persist_events(task, output_file)
+    with gzip.open(output_file, "rt") as f:
+        expected_lines = f.readlines()
+
+    get_logs = fake_node.methods["eth_getLogs"]
+
+    def failing_get_logs(log_filter):
+        if int(log_filter["fromBlock"], 16) >= 30_000:
+            raise ValueError("node failure")
+        return get_logs(log_filter)
+
+    fake_node.methods["eth_getLogs"] = failing_get_logs
+    with pytest.raises(ValueError):
+        fetcher.fetch_and_persist_events(task, output_file)
+
+    fake_node.methods["eth_getLogs"] = get_logs
+    fake_node.calls_count = 0
+    fetcher.fetch_and_persist_events(task, output_file, resume=True)
+    assert fake_node.calls_count == 2
+    with gzip.open(output_file, "rt") as f:
+        assert f.readlines() == expected_lines
+
+
+def test_follow_events_reorg(fake_node, token_contract):
+    fork_block = 10_295
+
+    def forked_hash(block_number):
+        return "0x" + "ff" * 16 + format(block_number, "032x")
+
+    forked_log = make_log(TOKEN_ADDRESS, 10_300, 0, [TRANSFER_TOPIC], "0x")
+    forked_log.update(
+        blockHash=forked_hash(10_300),
+        topics=[TRANSFER_TOPIC, encode_address(4), encode_address(5)],
+        data="0x" + format(12_345, "064x"),
+    )
+    get_block = fake_node.methods["eth_getBlockByNumber"]
+
+    def get_block_by_number(block_number, full_transactions=False):
+        block = get_block(block_number, full_transactions)
+        number = int(block_number, 16)
+        if block and fake_node.forked and number >= fork_block:
+            block["hash"] = forked_hash(number)
+            if number > fork_block:
+                block["parentHash"] = forked_hash(number - 1)
+        return block
+
+    def block_number():
+        # the chain grows by 10 blocks at every poll and forks at block 10,310
+        fake_node.head += 10
+        if fake_node.head == 10_310:
+            fake_node.forked = True
+            fake_node.logs = [
+                forked_log if int(log["blockNumber"], 16) == 10_300 else log
+                for log in fake_node.logs
+            ]
+        return hex(fake_node.head)
+
+    fake_node.head, fake_node.forked = 10_000, False
+    fake_node.methods["eth_getBlockByNumber"] = get_block_by_number
+    fake_node.methods["eth_blockNumber"] = block_number
+
+    fetcher = ContractFetcher(token_contract)
+    events = []
+    batches = fetcher.follow_events_batches(9_000, confirmations=10, poll_interval=0)
+    for last_block, batch_events in batches:
+        events.extend(batch_events)
+        if last_block >= 10_400:
+            break
+
+    assert last_block == 10_400
+    transfers = [event for event in events if event["event"] == "Transfer"]
+    assert len(events) == len(transfers) + 2 * 5
+    assert [(event["blockNumber"], event["args"]["value"]) for event in transfers] == [
+        (block, 12_345 if block == 10_300 else block)
+        for block in range(9_000, 10_401, 100)
+    ]
+
+
+def test_follow_and_persist_events_raw(fake_node, token_contract, tmp_path):
+    get_block = fake_node.methods["eth_getBlockByNumber"]
+    requested_blocks = []
+
+    def get_block_by_number(block_number, full_transactions=False):
+        requested_blocks.append(int(block_number, 16))
+        return get_block(block_number, full_transactions)
+
+    def block_number():
+        # the chain grows by 10 blocks at every poll, until the node fails
+        if fake_node.head >= 10_100:
+            raise ValueError("node failure")
+        fake_node.head += 10
+        return hex(fake_node.head)
+
+    fake_node.head = 10_000
+    fake_node.methods["eth_getBlockByNumber"] = get_block_by_number
+    fake_node.methods["eth_blockNumber"] = block_number
+    fetcher = EventFetcher(
+        token_contract.web3, raw=True, confirmations=10, poll_interval=0
+    )
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 9_000)
+    output_file = str(tmp_path / "events.jsonl")
+    with pytest.raises(ValueError):
+        fetcher.follow_and_persist_events(task, output_file)
+
+    with open(output_file) as f:
+        events = [json.loads(line) for line in f]
+    # raw logs are written up to the last confirmed block
+    assert all("event" not in event for event in events)
+    assert {event["blockNumber"] for event in events} == set(range(9_000, 10_091, 100))
+    # the reorg check of each poll only fetches the last buffered block
+    polls_count = (10_100 - 10_010) // 10
+    assert len(requested_blocks) == 1 + 10 + polls_count * (1 + 10)
+
+
+@pytest.mark.parametrize("group_size,calls_count", [(1, 25 + 25 + 3), (3, 25)])
+def test_fetch_all_events(fake_node, token_contract, tmp_path, group_size, calls_count):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    fetcher = EventFetcher(
+        token_contract.web3, workers=4, unit_blocks=2_000, group_size=group_size
+    )
+    expected_dir = tmp_path / "expected"
+    expected_dir.mkdir()
+    for task in fetch_tasks:
+        output_file = str(expected_dir / (task.display_name + ".jsonl.gz"))
+        fetcher.fetch_and_persist_events(task, output_file)
+
+    fake_node.latency = 0.01
+    fake_node.max_in_flight = 0
+    fake_node.calls_count = 0
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path))
+    lines = read_events_files(tmp_path, fetch_tasks)
+    assert lines == read_events_files(expected_dir, fetch_tasks)
+    assert len(lines["busy"]) == 750
+    assert lines["empty"] == []
+    # the units of the busy token are spread across all the workers
+    assert fake_node.max_in_flight == 4
+    # grouped tasks are fetched with a single request per unit
+    assert fake_node.calls_count == calls_count
+
+
+def test_fetch_all_events_failure(fake_node, token_contract, tmp_path):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    fetcher = EventFetcher(
+        token_contract.web3, workers=4, unit_blocks=2_000, checkpoint_interval=0
+    )
+    (tmp_path / "expected").mkdir()
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path / "expected"))
+    expected_lines = read_events_files(tmp_path / "expected", fetch_tasks)
+
+    get_logs = fake_node.methods["eth_getLogs"]
+
+    def failing_get_logs(log_filter):
+        if TOKEN_ADDRESS in log_filter["address"] and (
+            int(log_filter["fromBlock"], 16) >= 30_000
+        ):
+            raise ValueError("node failure")
+        return get_logs(log_filter)
+
+    fake_node.methods["eth_getLogs"] = failing_get_logs
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path))
+    lines = read_events_files(tmp_path, fetch_tasks)
+    assert lines["quiet"] == expected_lines["quiet"]
+    assert lines["busy"] != expected_lines["busy"]
+
+    fake_node.methods["eth_getLogs"] = get_logs
+    fake_node.calls_count = 0
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path), resume=True)
+    assert read_events_files(tmp_path, fetch_tasks) == expected_lines
+    # only the units of the busy token after its checkpoint are fetched again
+    assert fake_node.calls_count == 10
+
+
+def test_fetch_all_events_grouped_resume(fake_node, token_contract, tmp_path):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    fetcher = EventFetcher(
+        token_contract.web3, unit_blocks=2_000, group_size=3, checkpoint_interval=0
+    )
+    (tmp_path / "expected").mkdir()
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path / "expected"))
+    expected_lines = read_events_files(tmp_path / "expected", fetch_tasks)
+
+    get_logs = fake_node.methods["eth_getLogs"]
+
+    def failing_get_logs(log_filter):
+        if int(log_filter["fromBlock"], 16) >= 30_000:
+            raise ValueError("node failure")
+        return get_logs(log_filter)
+
+    fake_node.methods["eth_getLogs"] = failing_get_logs
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path))
+    fake_node.methods["eth_getLogs"] = get_logs
+    fake_node.calls_count = 0
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path), resume=True)
+    assert read_events_files(tmp_path, fetch_tasks) == expected_lines
+    assert fake_node.calls_count == 10
+
+
+def test_bulk_task_start(token_contract):
+    tasks = [
+        FetchTask(TOKEN_ADDRESS, {}, 0, 9_999, name="done"),
+        FetchTask(OTHER_TOKEN_ADDRESS, {}, 0, 19_999, name="open"),
+    ]
+    writers = [MagicMock(start_block=10_000), MagicMock(start_block=5_000)]
+    bulk_task = BulkTask(tasks, [9_999, 19_999], writers, MagicMock(), 2_000)
+    # creating the task does not write anything
+    writers[0].finish.assert_not_called()
+    assert bulk_task.units_count == 0
+
+    bulk_task.start()
+    writers[0].finish.assert_called_once_with(9_999)
+    writers[0].close.assert_called_once_with()
+    writers[1].finish.assert_not_called()
+    assert bulk_task.unit_range(0) == (5_000, 6_999)
+    assert bulk_task.units_count == 8
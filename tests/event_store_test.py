@@ -0,0 +1,152 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+from eth_tools import event_store
+from eth_tools.event_fetcher import EventFetcher, FetchTask
+from eth_tools.event_store import EVENT_STORE_FILENAME, EventStore
+from eth_tools.json_encoder import to_json
+from tests.fake_node import (
+    OTHER_TOKEN_ADDRESS,
+    TOKEN_ADDRESS,
+    TRANSFER_TOPIC,
+    encode_address,
+    make_bulk_tasks,
+    make_log,
+    read_events_files,
+)
+
+
+def read_events(filepath):
+    with gzip.open(filepath, "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_query_fetched_events(fake_node, token_contract, tmp_path):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 49_999, name="token")
+    fetcher = EventFetcher(token_contract.web3, batch_size=5)
+    jsonl_file = str(tmp_path / "token.jsonl.gz")
+    fetcher.fetch_and_persist_events(task, jsonl_file)
+    store_file = str(tmp_path / "events.sqlite3")
+    fetcher.fetch_and_persist_events(task, store_file, output_format="store")
+    expected = read_events(jsonl_file)
+
+    with EventStore(store_file) as store:
+        assert list(store.query()) == expected
+        events = list(
+            store.query([TOKEN_ADDRESS.upper()], ["Transfer"], 10_050, 30_000)
+        )
+    assert events == [
+        event
+        for event in expected
+        if event["event"] == "Transfer" and 10_050 <= event["blockNumber"] <= 30_000
+    ]
+
+
+def test_query_raw_logs_by_topic(fake_node, token_contract, tmp_path):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 9_999, name="token")
+    fetcher = EventFetcher(token_contract.web3, raw=True)
+    store_file = str(tmp_path / "events.sqlite3")
+    fetcher.fetch_and_persist_events(task, store_file, output_format="store")
+    with EventStore(store_file) as store:
+        logs = list(store.query(events=[TRANSFER_TOPIC]))
+    assert [log["blockNumber"] for log in logs] == list(range(0, 10_000, 100))
+
+
+def test_bulk_fetch_to_store(fake_node, token_contract, tmp_path):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    topics = [TRANSFER_TOPIC, encode_address(1), encode_address(2)]
+    data = "0x" + format(47_000, "064x")
+    fake_node.logs.append(make_log(OTHER_TOKEN_ADDRESS, 47_000, 0, topics, data))
+    fetcher = EventFetcher(token_contract.web3, workers=4, unit_blocks=2_000)
+    (tmp_path / "expected").mkdir()
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path / "expected"))
+    expected = read_events_files(tmp_path / "expected", fetch_tasks)
+
+    fetcher.fetch_all_events(fetch_tasks, str(tmp_path), output_format="store")
+    with EventStore(str(tmp_path / EVENT_STORE_FILENAME)) as store:
+        lines = list(store.query_lines([TOKEN_ADDRESS]))
+        assert [json.loads(line) for line in lines] == [
+            json.loads(line) for line in expected["busy"]
+        ]
+        # the quiet and empty tasks both fetched the other token after 45,000
+        events = list(store.query([OTHER_TOKEN_ADDRESS]))
+        assert [event["blockNumber"] for event in events] == [
+            0,
+            10_000,
+            20_000,
+            30_000,
+            40_000,
+            47_000,
+        ]
+
+
+def test_import_file(fake_node, token_contract, tmp_path, monkeypatch):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 49_999, name="token")
+    jsonl_file = str(tmp_path / "token.jsonl.gz")
+    EventFetcher(token_contract.web3).fetch_and_persist_events(task, jsonl_file)
+    expected = read_events(jsonl_file)
+    with EventStore(str(tmp_path / "events.sqlite3"), chunk_events=100) as store:
+        assert store.import_file(jsonl_file) == len(expected)
+        # importing again replaces the events of the file
+        assert store.import_file(jsonl_file) == len(expected)
+        assert list(store.query()) == expected
+        writer = store.writer("token", TOKEN_ADDRESS, 0, resume=True)
+        assert writer.last_block == 49_999
+
+        decompress = zlib.decompress
+        decompressed = []
+        monkeypatch.setattr(
+            event_store.zlib,
+            "decompress",
+            lambda data: decompressed.append(data) or decompress(data),
+        )
+        events = list(store.query(events=["Transfer"], start_block=10_050))
+        assert len(events) == 500 - 101
+        # transfers are stored in 5 chunks of 10,000 blocks
+        assert len(decompressed) == 4
+
+
+def make_event(block, log_index=0):
+    return {
+        "address": TOKEN_ADDRESS,
+        "event": "Transfer",
+        "blockNumber": block,
+        "logIndex": log_index,
+    }
+
+
+def test_query_overlapping_tasks(tmp_path):
+    with EventStore(str(tmp_path / "events.sqlite3"), chunk_events=3) as store:
+        for task, start_block, end_block in [("a", 0, 9), ("b", 5, 14)]:
+            writer = store.writer(task, TOKEN_ADDRESS, start_block)
+            for block in range(start_block, end_block + 1):
+                writer.write(make_event(block))
+                writer.write(make_event(block, 1))
+            writer.commit(end_block)
+        expected = [make_event(block, i) for block in range(15) for i in range(2)]
+        assert list(store.query()) == expected
+        assert [json.loads(line) for line in store.query_lines()] == expected
+
+
+def test_resume_drops_uncommitted_events(tmp_path):
+    with EventStore(str(tmp_path / "events.sqlite3"), chunk_events=2) as store:
+        writer = store.writer("token", TOKEN_ADDRESS, 0)
+        for block in range(5):
+            writer.write(make_event(block))
+        writer.commit(5)
+        # full chunks are written before being committed
+        for block in range(6, 10):
+            writer.write(make_event(block))
+        writer.close()
+        assert len(list(store.query())) == 9
+
+        with pytest.raises(ValueError, match="does not match"):
+            store.writer("token", TOKEN_ADDRESS, 1, resume=True)
+        writer = store.writer("token", TOKEN_ADDRESS, 0, resume=True)
+        assert writer.last_block == 5
+        assert [to_json(event) for event in store.query()] == [
+            to_json(make_event(block)) for block in range(5)
+        ]
@@ -0,0 +1,331 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+from typing import Dict
+
+from web3 import Web3
+
+from eth_tools.event_fetcher import FetchTask
+
+ERC20_ABI_PATH = path.join(path.dirname(__file__), "..", "config", "erc20-abi.json")
+TOKEN_ADDRESS = "0x" + "12" * 20
+OTHER_TOKEN_ADDRESS = "0x" + "34" * 20
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+APPROVAL_TOPIC = Web3.keccak(text="Approval(address,address,uint256)").hex()
+
+
+def make_block(number: int, transactions_count: int) -> dict:
+    return {
+        "number": hex(number),
+        "hash": "0x" + format(number, "064x"),
+        "parentHash": "0x" + format(max(number - 1, 0), "064x"),
+        "sha3Uncles": "0x" + "1d" * 32,
+        "receiptsRoot": "0x" + "56" * 32,
+        "stateRoot": "0x" + "d7" * 32,
+        "miner": "0x" + "ab" * 20,
+        "gasUsed": hex(number * 10),
+        "gasLimit": hex(12_500_000),
+        "timestamp": hex(1_600_000_000 + number * 13),
+        "difficulty": hex(2),
+        "totalDifficulty": hex(2 * number),
+        "size": hex(1_000),
+        "extraData": "0x",
+        "transactions": [
+            "0x" + format(number * 1_000 + i, "064x") for i in range(transactions_count)
+        ],
+    }
+
+
+def make_log(
+    address: str, block_number: int, log_index: int, topics: list, data: str
+) -> dict:
+    return {
+        "address": address.lower(),
+        "blockHash": "0x" + format(block_number, "064x"),
+        "blockNumber": hex(block_number),
+        "data": data,
+        "logIndex": hex(log_index),
+        "removed": False,
+        "topics": topics,
+        "transactionHash": "0x" + format(block_number * 1_000 + log_index, "064x"),
+        "transactionIndex": hex(log_index),
+    }
+
+
+def matches_topics(log: dict, topics: list) -> bool:
+    for expected, actual in zip(topics, log["topics"]):
+        if expected is None:
+            continue
+        if isinstance(expected, list) and actual not in expected:
+            return False
+        if isinstance(expected, str) and actual != expected:
+            return False
+    return True
+
+
+def encode_address(address_byte: int) -> str:
+    return "0x" + "00" * 12 + format(address_byte, "02x") * 20
+
+
+def make_token_logs(start_block: int, end_block: int):
+    """A transfer every 100 blocks and 5 approvals every 1,000 blocks"""
+    logs = []
+    for block in range(start_block, end_block + 1):
+        log_index = 0
+        if block % 100 == 0:
+            topics = [TRANSFER_TOPIC, encode_address(1), encode_address(2)]
+            data = "0x" + format(block, "064x")
+            logs.append(make_log(TOKEN_ADDRESS, block, log_index, topics, data))
+            log_index += 1
+        if block % 1_000 == 0:
+            for _ in range(5):
+                topics = [APPROVAL_TOPIC, encode_address(1), encode_address(3)]
+                data = "0x" + format(2**256 - 1, "064x")
+                logs.append(make_log(TOKEN_ADDRESS, block, log_index, topics, data))
+                log_index += 1
+    return logs
+
+
+def make_bulk_tasks(fake_node, token_contract):
+    """A busy token and a token with a transfer every 10,000 blocks"""
+    topics = [TRANSFER_TOPIC, encode_address(1), encode_address(2)]
+    fake_node.logs += [
+        make_log(OTHER_TOKEN_ADDRESS, block, 0, topics, "0x" + format(block, "064x"))
+        for block in range(0, 50_000, 10_000)
+    ]
+    abi = token_contract.abi
+    return [
+        FetchTask(TOKEN_ADDRESS, abi, 0, 49_999, name="busy"),
+        FetchTask(OTHER_TOKEN_ADDRESS, abi, 0, 49_999, name="quiet"),
+        FetchTask(OTHER_TOKEN_ADDRESS, abi, 45_000, 49_999, name="empty"),
+    ]
+
+
+def read_events_files(tmp_path, fetch_tasks):
+    lines = {}
+    for task in fetch_tasks:
+        with gzip.open(tmp_path / (task.display_name + ".jsonl.gz"), "rt") as f:
+            lines[task.display_name] = f.readlines()
+    return lines
+
+
+class _Server(ThreadingHTTPServer):
+    # the default backlog of 5 connections delays bursts of concurrent requests
+    request_queue_size = 1_024
+    daemon_threads = True
+
+
+class FakeNode:
+    """Minimal JSON-RPC node served over HTTP for tests
+    Every HTTP request (single call or batch) waits ``latency`` seconds.
+    ``eth_getLogs`` serves ``logs`` and fails when more than ``max_logs``
+    logs match the filter. ``eth_call`` returns the block number of the call.
+    Blocks contain ``number % 5`` transactions, unless set in ``transactions_counts``,
+    with hashes ``number * 1000 + i``.
+    The next ``rate_limited_count`` HTTP requests are rejected with a 429 status.
+    """
+
+    def __init__(self, latency: float = 0.0, head: int = 1_000_000):
+        self.latency = latency
+        self.head = head
+        self.logs: list = []
+        self.max_logs = None
+        self.transactions_counts: Dict[int, int] = {}
+        self.methods = {
+            "eth_blockNumber": lambda: hex(self.head),
+            "eth_chainId": lambda: hex(1),
+            "eth_getBlockByNumber": self.get_block_by_number,
+            "eth_getBlockTransactionCountByNumber": self.get_block_transaction_count,
+            "eth_getLogs": self.get_logs,
+            "eth_getTransactionByHash": self.get_transaction,
+            "eth_getTransactionReceipt": self.get_transaction_receipt,
+            "eth_getBlockReceipts": self.get_block_receipts,
+            "eth_call": self.call,
+            "eth_getCode": lambda _address, _block_number: "0x6080",
+            "debug_traceTransaction": self.trace_transaction,
+            "debug_traceBlockByNumber": self.trace_block,
+        }
+        self.requests_count = 0
+        self.calls_count = 0
+        self.bytes_sent = 0
+        self.rate_limited_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def uri(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_block_by_number(self, block_number, _full_transactions=False):
+        number = int(block_number, 16)
+        if number > self.head:
+            return None
+        return make_block(number, self.transactions_count(number))
+
+    def transactions_count(self, block_number: int) -> int:
+        return self.transactions_counts.get(block_number, block_number % 5)
+
+    def get_block_transaction_count(self, block_number: str):
+        block = self.get_block_by_number(block_number)
+        if block is None:
+            return None
+        return hex(len(block["transactions"]))
+
+    def get_logs(self, log_filter: dict):
+        from_block = int(log_filter.get("fromBlock", "0x0"), 16)
+        to_block = int(log_filter.get("toBlock", hex(self.head)), 16)
+        addresses = log_filter.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        if addresses is not None:
+            addresses = {address.lower() for address in addresses}
+        logs = [
+            log
+            for log in self.logs
+            if from_block <= int(log["blockNumber"], 16) <= to_block
+            and (addresses is None or log["address"] in addresses)
+            and matches_topics(log, log_filter.get("topics") or [])
+        ]
+        if self.max_logs is not None and len(logs) > self.max_logs:
+            raise ValueError(f"query returned more than {self.max_logs} results")
+        return logs
+
+    def get_transaction(self, tx_hash: str):
+        number = int(tx_hash, 16)
+        block_number, index = divmod(number, 1_000)
+        if block_number > self.head or index >= self.transactions_count(block_number):
+            return None
+        return {
+            "hash": tx_hash,
+            "blockHash": "0x" + format(block_number, "064x"),
+            "blockNumber": hex(block_number),
+            "transactionIndex": hex(index),
+            "from": "0x" + "01" * 20,
+            "to": "0x" + "02" * 20,
+            "value": hex(number),
+            "gas": hex(21_000),
+            "gasPrice": hex(10**9),
+            "nonce": hex(index),
+            "input": "0x",
+            "v": "0x1b",
+            "r": "0x" + "aa" * 32,
+            "s": "0x" + "bb" * 32,
+        }
+
+    def get_transaction_receipt(self, tx_hash: str):
+        tx = self.get_transaction(tx_hash)
+        if tx is None:
+            return None
+        return {
+            "transactionHash": tx_hash,
+            "blockHash": tx["blockHash"],
+            "blockNumber": tx["blockNumber"],
+            "transactionIndex": tx["transactionIndex"],
+            "from": tx["from"],
+            "to": tx["to"],
+            "gasUsed": hex(21_000),
+            "cumulativeGasUsed": hex(21_000 * (int(tx["transactionIndex"], 16) + 1)),
+            "contractAddress": None,
+            "logs": [],
+            "logsBloom": "0x" + "00" * 256,
+            "status": "0x1",
+        }
+
+    def get_block_receipts(self, block_number: str):
+        block = self.get_block_by_number(block_number)
+        if block is None:
+            return None
+        return [self.get_transaction_receipt(h) for h in block["transactions"]]
+
+    def call(self, _transaction: dict, block_number: str):
+        # every contract function returns the block number as a uint256
+        return "0x" + format(int(block_number, 16), "064x")
+
+    def trace_transaction(self, tx_hash: str, _options: dict = None):
+        return {
+            "gas": 21_000,
+            "failed": False,
+            "returnValue": tx_hash,
+            "structLogs": [],
+        }
+
+    def trace_block(self, block_number: str, options: dict = None):
+        block = self.get_block_by_number(block_number)
+        if block is None:
+            raise ValueError(f"block {block_number} not found")
+        return [
+            {"result": self.trace_transaction(tx_hash, options)}
+            for tx_hash in block["transactions"]
+        ]
+
+    def handle_call(self, request: dict) -> dict:
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        method = self.methods.get(request["method"])
+        if method is None:
+            response["error"] = {"code": -32601, "message": "method not found"}
+            return response
+        try:
+            response["result"] = method(*request.get("params", []))
+        except ValueError as ex:
+            response["error"] = {"code": -32000, "message": str(ex)}
+        return response
+
+    def handle_payload(self, payload):
+        with self._lock:
+            self.requests_count += 1
+            self.calls_count += len(payload) if isinstance(payload, list) else 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if isinstance(payload, list):
+                return [self.handle_call(request) for request in payload]
+            return self.handle_call(payload)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _make_handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):  # pylint: disable=invalid-name
+                length = int(self.headers["Content-Length"])
+                payload = json.loads(self.rfile.read(length))
+                with node._lock:  # pylint: disable=protected-access
+                    rate_limited = node.rate_limited_count > 0
+                    node.rate_limited_count -= int(rate_limited)
+                if rate_limited:
+                    self.send_response(429)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps(node.handle_payload(payload)).encode()
+                with node._lock:  # pylint: disable=protected-access
+                    node.bytes_sent += len(body)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass
+
+        return Handler
@@ -0,0 +1,36 @@
+import json
+from os import path
+
+from web3.datastructures import AttributeDict
+from web3.types import HexBytes
+
+from eth_tools.json_encoder import EthJSONEncoder, to_json
+
+EVENTS_PATH = path.join(path.dirname(__file__), "test_data", "dummyEvents.json")
+
+
+def to_web3_event(raw_event: dict) -> AttributeDict:
+    """Converts a persisted event back to the structures returned by web3"""
+    event = dict(raw_event)
+    event["args"] = AttributeDict(event["args"])
+    for field in ("transactionHash", "blockHash"):
+        event[field] = HexBytes(event[field])
+    return AttributeDict(event)
+
+
+def test_to_json_matches_encoder():
+    with open(EVENTS_PATH) as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        event = to_web3_event(json.loads(line))
+        assert to_json(event) == json.dumps(event, cls=EthJSONEncoder) == line
+
+
+def test_to_json_nested_values():
+    value = {
+        "topics": (HexBytes("0x01"), HexBytes("0xff")),
+        "data": b"\x00\x01",
+        "nested": [AttributeDict({"value": 2**256 - 1, "name": "ü"}), None, 1.5],
+        1: True,
+    }
+    assert to_json(value) == json.dumps(value, cls=EthJSONEncoder)
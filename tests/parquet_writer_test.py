@@ -0,0 +1,76 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from web3 import Web3
+
+from eth_tools.block_iterator import BlockIterator
+from eth_tools.event_fetcher import EventFetcher, FetchTask
+from eth_tools.parquet_writer import ParquetWriter, block_columns, event_columns
+from tests.fake_node import TOKEN_ADDRESS
+
+BLOCK_FIELDS = ["number", "hash", "miner", "timestamp", "totalDifficulty"]
+
+
+def test_write_blocks(fake_node, tmp_path):
+    output_file = str(tmp_path / "blocks.parquet")
+    web3 = Web3(Web3.HTTPProvider(fake_node.uri))
+    blocks = BlockIterator(web3, start_block=1, end_block=250, batch_size=10)
+    with ParquetWriter(output_file, block_columns(BLOCK_FIELDS), 100) as writer:
+        for block in blocks:
+            writer.write({field: getattr(block, field) for field in BLOCK_FIELDS})
+
+    parquet_file = pq.ParquetFile(output_file)
+    assert parquet_file.metadata.num_row_groups == 3
+    table = parquet_file.read()
+    assert table.schema.field("number").type == pa.int64()
+    assert table.schema.field("hash").type == pa.binary(32)
+    assert table.schema.field("miner").type == pa.binary(20)
+    rows = table.to_pylist()
+    assert len(rows) == 250
+    assert rows[9] == {
+        "number": 10,
+        "hash": bytes.fromhex(format(10, "064x")),
+        "miner": bytes.fromhex("ab" * 20),
+        "timestamp": 1_600_000_130,
+        "totalDifficulty": "20",
+    }
+
+
+def test_event_columns(token_contract):
+    columns = {column.name: column.type for column in event_columns(token_contract.abi)}
+    assert columns["args_from"] == pa.binary(20)
+    assert columns["args_spender"] == pa.binary(20)
+    assert columns["args_value"] == pa.string()
+    transfer_columns = event_columns(token_contract.abi, ["Transfer"])
+    assert "args_spender" not in {column.name for column in transfer_columns}
+
+
+def test_fetch_and_persist_events_parquet(token_contract, tmp_path):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 49_999)
+    output_file = str(tmp_path / "events.parquet")
+    fetcher = EventFetcher(token_contract.web3)
+    fetcher.fetch_and_persist_events(task, output_file, output_format="parquet")
+    events = list(fetcher.fetch_events(task))
+
+    rows = pq.read_table(output_file).to_pylist()
+    assert len(rows) == len(events)
+    for row, event in zip(rows, events):
+        assert row["blockNumber"] == event["blockNumber"]
+        assert row["logIndex"] == event["logIndex"]
+        assert row["transactionHash"] == bytes(event["transactionHash"])
+        assert row["event"] == event["event"]
+        assert row["args_value"] == str(event["args"]["value"])
+    assert rows[1]["args_spender"] == bytes.fromhex("03" * 20)
+    assert rows[1]["args_from"] is None
+
+
+def test_fetch_and_persist_raw_events_parquet(token_contract, tmp_path):
+    task = FetchTask(TOKEN_ADDRESS, token_contract.abi, 0, 9_999)
+    output_file = str(tmp_path / "events.parquet")
+    fetcher = EventFetcher(token_contract.web3, raw=True)
+    fetcher.fetch_and_persist_events(task, output_file, output_format="parquet")
+
+    rows = pq.read_table(output_file).to_pylist()
+    assert len(rows) == 150
+    assert "event" not in rows[0]
+    assert rows[0]["topics"][2] == bytes.fromhex("00" * 12 + "02" * 20)
+    assert rows[0]["data"] == bytes(32)
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from web3 import Web3
+
+from eth_tools.request_scheduler import (
+    RequestScheduler,
+    ScheduledHTTPProvider,
+    TokenBucket,
+)
+from eth_tools.rpc_client import RPCClient
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, capacity=1)
+    start = time.monotonic()
+    for _ in range(21):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.19
+
+
+def test_token_bucket_cost_above_capacity():
+    bucket = TokenBucket(rate=100, capacity=10)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire(50)
+    # the first 50 tokens are sent at once, the next ones wait for the debt
+    assert time.monotonic() - start >= 0.95
+
+
+def test_concurrency_limit(fake_node):
+    fake_node.latency = 0.02
+    scheduler = RequestScheduler(max_concurrent_requests=3)
+    web3 = Web3(ScheduledHTTPProvider(fake_node.uri, scheduler=scheduler))
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = list(executor.map(lambda _: web3.eth.blockNumber, range(40)))
+    assert results == [fake_node.head] * 40
+    assert fake_node.max_in_flight == 3
+
+
+def test_rate_limit_counts_batch_calls(fake_node):
+    scheduler = RequestScheduler(requests_per_second=200)
+    web3 = Web3(ScheduledHTTPProvider(fake_node.uri, scheduler=scheduler))
+    rpc_client = RPCClient(web3)
+    assert rpc_client.scheduler is scheduler
+    start = time.monotonic()
+    for _ in range(3):
+        rpc_client.make_batch_request([("eth_blockNumber", [])] * 100)
+    # the initial burst allows 200 calls, the last 100 calls take 0.5s
+    assert time.monotonic() - start >= 0.45
+
+
+def test_retry_rate_limited(fake_node):
+    fake_node.rate_limited_count = 2
+    scheduler = RequestScheduler(backoff=0.01)
+    web3 = Web3(ScheduledHTTPProvider(fake_node.uri, scheduler=scheduler))
+    assert web3.eth.blockNumber == fake_node.head
+    assert fake_node.rate_limited_count == 0
+
+
+def test_retry_give_up(fake_node):
+    fake_node.rate_limited_count = 3
+    scheduler = RequestScheduler(backoff=0.01, max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        scheduler.post(fake_node.uri, json={})
@@ -0,0 +1,73 @@
+import pytest
+from web3 import Web3
+
+from eth_tools.block_iterator import BlockIterator
+from eth_tools.caching import CacheStore
+from eth_tools.request_scheduler import ScheduledHTTPProvider
+from eth_tools.rpc_cache import RPCCache
+from eth_tools.transaction_details_fetcher import TransactionDetailsFetcher
+
+
+@pytest.fixture
+def web3(fake_node, tmp_path):
+    fake_node.head = 1_000
+    provider = ScheduledHTTPProvider(fake_node.uri)
+    store = CacheStore(str(tmp_path / "rpc-cache.sqlite3"))
+    provider.rpc_cache = RPCCache(store, provider.make_uncached_request)
+    return Web3(provider)
+
+
+@pytest.fixture
+def rpc_cache(web3):
+    return web3.provider.rpc_cache
+
+
+def test_is_final(rpc_cache):
+    assert rpc_cache.is_final("eth_getBlockByNumber", [hex(936), False], {})
+    assert not rpc_cache.is_final("eth_getBlockByNumber", [hex(937), False], {})
+    assert not rpc_cache.is_final("eth_getBlockByNumber", ["latest", False], {})
+    assert not rpc_cache.is_final("eth_getBlockByNumber", [hex(10), False], None)
+    assert rpc_cache.is_final("eth_call", [{"to": "0x00"}, hex(500)], "0x")
+    assert not rpc_cache.is_final("eth_call", [{"to": "0x00"}, "pending"], "0x")
+    log_filter = {"fromBlock": hex(10), "toBlock": hex(20)}
+    assert rpc_cache.is_final("eth_getLogs", [log_filter], [])
+    assert not rpc_cache.is_final("eth_getLogs", [{"fromBlock": hex(10)}], [])
+    tx = {"blockNumber": hex(900)}
+    assert rpc_cache.is_final("eth_getTransactionByHash", ["0x01"], tx)
+    assert not rpc_cache.is_final(
+        "eth_getTransactionByHash", ["0x01"], {"blockNumber": None}
+    )
+    assert not rpc_cache.is_final("eth_blockNumber", [], hex(1_000))
+
+
+def test_cached_blocks(fake_node, web3):
+    def fetch_blocks():
+        block_iterator = BlockIterator(
+            web3, start_block=900, end_block=999, batch_size=10, concurrency=2
+        )
+        return [block.hash for block in block_iterator]
+
+    block_hashes = fetch_blocks()
+    fake_node.calls_count = 0
+    assert fetch_blocks() == block_hashes
+    # only the blocks after the finalized block are fetched again
+    assert fake_node.calls_count == 999 - 936
+
+
+def test_cached_web3_calls(fake_node, web3):
+    block = web3.eth.getBlock(100)
+    fake_node.calls_count = 0
+    assert web3.eth.getBlock(100) == block
+    web3.eth.getBlock(950)
+    web3.eth.getBlock(950)
+    assert fake_node.calls_count == 2
+
+
+def test_cached_transactions(fake_node, web3):
+    tx_hashes = ["0x" + format(block * 1_000, "064x") for block in (1, 2, 999)]
+    fetcher = TransactionDetailsFetcher(web3, include_receipt=True, include_traces=True)
+    transactions = list(fetcher.fetch_transactions(tx_hashes))
+    fake_node.calls_count = 0
+    assert list(fetcher.fetch_transactions(tx_hashes)) == transactions
+    # transaction, receipt and trace of the transaction in the last block
+    assert fake_node.calls_count == 3
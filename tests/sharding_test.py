@@ -0,0 +1,173 @@
+import csv
+import gzip
+import multiprocessing
+import os
+import socket
+from os import path
+
+import pytest
+from web3 import HTTPProvider, Web3
+
+from eth_tools.event_fetcher import EventFetcher
+from eth_tools.sharding import (
+    Manifest,
+    Shard,
+    _is_local_process_alive,
+    fetch_slices,
+    iterate_slices,
+    mark_complete,
+    merge_slices,
+    run_manifest_worker,
+    shard_tasks,
+    slice_filepath,
+    worker_id,
+)
+from tests.fake_node import make_bulk_tasks, read_events_files
+
+
+def test_parse_shard():
+    assert Shard.parse("1/3") == Shard(1, 3)
+    for value in ["3/3", "-1/3", "1", "a/b"]:
+        with pytest.raises(ValueError, match="invalid shard"):
+            Shard.parse(value)
+
+
+def test_shards_partition_slices():
+    slices = list(iterate_slices(1_500, 10_200, 1_000))
+    assert slices[:2] == [(1_500, 1_999), (2_000, 2_999)]
+    assert slices[-1] == (10_000, 10_200)
+    sharded = [
+        s for index in range(3) for s in Shard(index, 3).slices(1_500, 10_200, 1_000)
+    ]
+    assert sorted(sharded) == slices
+    assert Shard(1, 3).slices(1_500, 10_200, 1_000)[0] == (1_500, 1_999)
+
+
+def test_slice_filepath():
+    assert slice_filepath("out/blocks.csv.gz", 10, 19) == "out/blocks.10-19.csv.gz"
+    assert slice_filepath("blocks", 10, 19) == "blocks.10-19"
+
+
+def fetch_expected(fetch_tasks, web3, directory):
+    directory.mkdir()
+    EventFetcher(web3).fetch_all_events(fetch_tasks, str(directory))
+    return read_events_files(directory, fetch_tasks)
+
+
+def test_merge_shards(fake_node, token_contract, tmp_path):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    web3 = token_contract.web3
+    expected = fetch_expected(fetch_tasks, web3, tmp_path / "expected")
+
+    fetcher = EventFetcher(web3, workers=4, unit_blocks=2_000)
+    shard_dirs = []
+    for index in range(3):
+        shard_dir = tmp_path / f"shard-{index}"
+        shard_dir.mkdir()
+        errors = fetch_slices(
+            fetcher, shard_tasks(fetch_tasks, Shard(index, 3), 10_000), str(shard_dir)
+        )
+        assert errors == {}
+        shard_dirs.append(str(shard_dir))
+
+    output_dir = tmp_path / "merged"
+    output_dir.mkdir()
+    merged_files = merge_slices(shard_dirs, str(output_dir))
+    assert len(merged_files) == 3
+    assert read_events_files(output_dir, fetch_tasks) == expected
+
+    # without the last shard, slices are missing
+    with pytest.raises(ValueError, match="expected a slice starting at block"):
+        merge_slices(shard_dirs[:2], str(output_dir))
+
+
+def test_merge_csv_slices(tmp_path):
+    for start_block, end_block in [(0, 9), (10, 19)]:
+        filepath = slice_filepath(
+            str(tmp_path / "blocks.csv.gz"), start_block, end_block
+        )
+        with gzip.open(filepath, "wt") as f:
+            writer = csv.writer(f)
+            writer.writerow(["number"])
+            writer.writerows([block] for block in range(start_block, end_block + 1))
+        if start_block == 0:
+            mark_complete(filepath)
+    output_dir = tmp_path / "merged"
+    output_dir.mkdir()
+    # the second slice was not marked as complete
+    with pytest.raises(ValueError, match="not fetched completely"):
+        merge_slices([str(tmp_path)], str(output_dir))
+    mark_complete(slice_filepath(str(tmp_path / "blocks.csv.gz"), 10, 19))
+    [merged_file] = merge_slices([str(tmp_path)], str(output_dir))
+    with gzip.open(merged_file, "rt") as f:
+        rows = list(csv.DictReader(f))
+    assert [int(row["number"]) for row in rows] == list(range(20))
+
+
+def run_worker(uri, manifest_file, fetch_tasks, output_dir):
+    fetcher = EventFetcher(Web3(HTTPProvider(uri)), workers=2, unit_blocks=2_000)
+    with Manifest(manifest_file) as manifest:
+        run_manifest_worker(fetcher, manifest, fetch_tasks, output_dir, claim_size=1)
+
+
+def test_manifest_workers(fake_node, token_contract, tmp_path):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    expected = fetch_expected(fetch_tasks, token_contract.web3, tmp_path / "expected")
+
+    manifest_file = str(tmp_path / "manifest.sqlite3")
+    with Manifest(manifest_file) as manifest:
+        manifest.add_tasks(fetch_tasks, 10_000)
+        # adding the tasks again does not reset the slices
+        manifest.add_tasks(fetch_tasks, 10_000)
+        assert manifest.counts() == {"pending": 11}
+
+    slices_dir = tmp_path / "slices"
+    slices_dir.mkdir()
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(fake_node.uri, manifest_file, fetch_tasks, str(slices_dir)),
+        )
+        for _ in range(3)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    with Manifest(manifest_file) as manifest:
+        assert manifest.counts() == {"done": 11}
+    output_dir = tmp_path / "merged"
+    output_dir.mkdir()
+    merge_slices([str(slices_dir)], str(output_dir))
+    assert read_events_files(output_dir, fetch_tasks) == expected
+
+
+def test_manifest_releases_dead_workers(fake_node, token_contract, tmp_path):
+    fetch_tasks = make_bulk_tasks(fake_node, token_contract)
+    manifest_file = str(tmp_path / "manifest.sqlite3")
+    process = multiprocessing.get_context("fork").Process(target=print)
+    process.start()
+    process.join()
+    dead_worker = f"{socket.gethostname()}:{process.pid}:"
+    with Manifest(manifest_file, worker=dead_worker) as dead_manifest:
+        dead_manifest.add_tasks(fetch_tasks[:1], 10_000)
+        assert len(dead_manifest.claim(5)) == 5
+
+    with Manifest(manifest_file) as manifest:
+        expected = [(0, block, block + 9_999) for block in range(0, 50_000, 10_000)]
+        assert manifest.claim(5) == expected
+        manifest.complete("busy.0-9999", ValueError("failed"))
+        assert manifest.counts() == {"running": 4, "failed": 1}
+        assert manifest.claim(5) == []
+        assert manifest.claim(5, retry_failed=True) == [(0, 0, 9_999)]
+
+
+@pytest.mark.skipif(not path.exists("/proc/self/stat"), reason="requires /proc")
+def test_worker_with_reused_pid():
+    assert _is_local_process_alive(worker_id(os.getpid()))
+    # another process started with the PID of the worker
+    assert not _is_local_process_alive(f"{socket.gethostname()}:{os.getpid()}:1")
+    assert _is_local_process_alive(f"other-host:{os.getpid()}:1")
@@ -0,0 +1,161 @@
+import gzip
+import json
+
+import pytest
+from web3 import HTTPProvider, Web3
+
+from eth_tools.json_encoder import EthJSONEncoder
+from eth_tools.transaction_details_fetcher import (
+    TransactionDetailsFetcher,
+    load_fetched_hashes,
+)
+from eth_tools.transaction_tracer import TransactionTracer
+
+
+def make_hash(block_number: int, index: int) -> str:
+    return "0x" + format(block_number * 1_000 + index, "064x")
+
+
+TX_HASHES = [make_hash(block, i) for block in range(1, 40) for i in range(block % 5)]
+
+
+@pytest.fixture
+def web3(fake_node):
+    return Web3(HTTPProvider(fake_node.uri))
+
+
+def fetch_sequentially(web3: Web3, tx_hashes):
+    tracer = TransactionTracer(web3)
+    transactions = []
+    for tx_hash in tx_hashes:
+        tx = dict(web3.eth.getTransaction(tx_hash))
+        tx["receipt"] = web3.eth.getTransactionReceipt(tx_hash)
+        tx["traces"] = tracer.trace_transaction(tx_hash)
+        transactions.append(tx)
+    return transactions
+
+
+def dump(transactions):
+    return [json.dumps(tx, cls=EthJSONEncoder) for tx in transactions]
+
+
+def test_fetch_transactions(fake_node, web3):
+    expected = dump(fetch_sequentially(web3, TX_HASHES))
+    fake_node.requests_count = 0
+
+    fetcher = TransactionDetailsFetcher(
+        web3,
+        include_receipt=True,
+        include_traces=True,
+        batch_size=10,
+        min_block_transactions=0,
+    )
+    assert dump(fetcher.fetch_transactions(TX_HASHES)) == expected
+    # one batch request per 10 transactions and one request per trace
+    assert fake_node.requests_count == 8 + len(TX_HASHES)
+
+
+def test_fetch_transactions_by_block(fake_node, web3):
+    expected = dump(fetch_sequentially(web3, TX_HASHES))
+    fake_node.calls_count = 0
+
+    fetcher = TransactionDetailsFetcher(
+        web3,
+        include_receipt=True,
+        include_traces=True,
+        batch_size=100,
+        min_block_transactions=3,
+    )
+    assert dump(fetcher.fetch_transactions(TX_HASHES)) == expected
+    dense_blocks = [block for block in range(1, 40) if block % 5 >= 3]
+    sparse_count = len(TX_HASHES) - sum(block % 5 for block in dense_blocks)
+    # transactions, transactions counts of the dense blocks,
+    # then receipts and traces per block or per transaction
+    expected_calls = len(TX_HASHES) + 3 * len(dense_blocks) + 2 * sparse_count
+    assert fake_node.calls_count == expected_calls
+
+
+def count_calls(fake_node, method):
+    handler = fake_node.methods[method]
+
+    def counted(*params):
+        counted.calls_count += 1
+        return handler(*params)
+
+    counted.calls_count = 0
+    fake_node.methods[method] = counted
+    return counted
+
+
+def test_fetch_transactions_by_block_share(fake_node, web3):
+    fake_node.transactions_counts[300] = 300
+    tx_hashes = [make_hash(300, i) for i in range(5)] + [
+        make_hash(4, i) for i in range(4)
+    ]
+    expected = dump(fetch_sequentially(web3, tx_hashes))
+    block_receipts = count_calls(fake_node, "eth_getBlockReceipts")
+    block_traces = count_calls(fake_node, "debug_traceBlockByNumber")
+
+    fetcher = TransactionDetailsFetcher(
+        web3,
+        include_receipt=True,
+        include_traces=True,
+        batch_size=2,
+        min_block_transactions=3,
+    )
+    assert dump(fetcher.fetch_transactions(tx_hashes)) == expected
+    # only block 4 is fetched whole, once even though it spans two batches
+    assert block_receipts.calls_count == 1
+    assert block_traces.calls_count == 1
+
+
+def test_fetch_transactions_by_block_unsupported(fake_node, web3):
+    expected = dump(fetch_sequentially(web3, TX_HASHES))
+    del fake_node.methods["eth_getBlockReceipts"]
+    del fake_node.methods["debug_traceBlockByNumber"]
+
+    fetcher = TransactionDetailsFetcher(
+        web3, include_receipt=True, include_traces=True, min_block_transactions=3
+    )
+    assert dump(fetcher.fetch_transactions(TX_HASHES)) == expected
+
+
+def test_fetch_transactions_unordered(web3):
+    fetcher = TransactionDetailsFetcher(web3, batch_size=3, ordered=False)
+    transactions = list(fetcher.fetch_transactions(TX_HASHES))
+    assert sorted(tx["hash"].hex() for tx in transactions) == sorted(TX_HASHES)
+
+
+def test_fetch_transactions_duplicates_and_missing(fake_node, web3):
+    missing_hash = make_hash(5, 0)
+    tx_hashes = TX_HASHES[:5] + [missing_hash] + TX_HASHES[:5]
+    fetcher = TransactionDetailsFetcher(web3, include_receipt=True, batch_size=4)
+    transactions = list(fetcher.fetch_transactions(tx_hashes))
+    assert [tx["hash"].hex() for tx in transactions] == TX_HASHES[:5]
+    # the receipt of the missing transaction is not requested
+    assert fake_node.calls_count == 6 + 5
+
+
+def test_load_fetched_hashes(tmp_path):
+    output = tmp_path / "transactions.jsonl"
+    output.write_text('{"hash": "0x01"}\n{"hash": "0x02"}\n{"hash": "0x0')
+    assert load_fetched_hashes(str(output)) == {"0x01", "0x02"}
+    # the partial line is removed so that new transactions can be appended
+    assert output.read_text() == '{"hash": "0x01"}\n{"hash": "0x02"}\n'
+    assert load_fetched_hashes(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_load_fetched_hashes_truncated_gzip(tmp_path):
+    output = tmp_path / "transactions.jsonl.gz"
+    lines = [json.dumps({"hash": hex(i)}) + "\n" for i in range(1_000)]
+    with gzip.open(output, "wt") as f:
+        f.writelines(lines)
+    data = output.read_bytes()
+    output.write_bytes(data[: len(data) // 2])
+
+    hashes = load_fetched_hashes(str(output))
+    assert 0 < len(hashes) < 1_000
+    with gzip.open(output, "at") as f:
+        f.write(json.dumps({"hash": "0xnew"}) + "\n")
+    with gzip.open(output, "rt") as f:
+        assert f.readlines() == lines[: len(hashes)] + ['{"hash": "0xnew"}\n']
@@ -65,3 +65,45 @@ def test_write_balances(dummy_addresses, dummy_balances, tmp_path):
         balances = [json.loads(line) for line in f]
     assert balances == [{"blockNumber": 2, "balance": 10}, {"blockNumber": 3, "balance": 11}, {
         "blockNumber": 4, "balance": 11}, {"blockNumber": 5, "balance": 18}]
+
+
+def test_execute_events_same_block(dummy_addresses):
+    def transfer(block, sender, receiver, value):
+        return {"event": "Transfer", "blockNumber": block,
+                "args": {"from": sender, "to": receiver, "value": value}}
+
+    events = [transfer(5, "0x0", "0x123", 2**255), transfer(3, "0x0", "0x123", 1),
+              transfer(5, "0x123", "0x456", 2**255), transfer(7, "0x456", "0x789", 4)]
+    transfer_event_parser = TransferEventParser(dummy_addresses)
+    transfer_event_parser.execute_events(iter(events))
+    assert transfer_event_parser.balances["0x123"] == {3: 1, 5: 1}
+    assert "0x456" not in transfer_event_parser.balances
+
+
+def test_iterate_balance_changes(dummy_addresses, dummy_balances):
+    transfer_event_parser = TransferEventParser(dummy_addresses, start=4, end=10)
+    transfer_event_parser.balances = dummy_balances
+    assert list(transfer_event_parser.iterate_balance_changes("0x123")) == [(4, 11), (5, 18)]
+
+
+def test_iterate_sampled_balances(dummy_addresses):
+    transfer_event_parser = TransferEventParser(dummy_addresses, start=1)
+    transfer_event_parser.balances = {"0x123": {15: 1, 2_000_000: 2, 10_000_000: 3}}
+    balances = list(transfer_event_parser.iterate_sampled_balances("0x123", 1_000_000))
+    assert balances == [(1_000_000, 1), (2_000_000, 2)] + [
+        (block, 2) for block in range(3_000_000, 10_000_000, 1_000_000)] + [(10_000_000, 3)]
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_write_balances_changes_only(dummy_addresses, dummy_balances, tmp_path, output_format):
+    transfer_event_parser = TransferEventParser(dummy_addresses)
+    transfer_event_parser.balances = dummy_balances
+    transfer_event_parser.write_balances("tok", filepath=str(tmp_path) + "/",
+                                         changes_only=True, output_format=output_format)
+    if output_format == "csv":
+        with open(tmp_path / "tok-balances:addr.csv") as f:
+            assert f.read().splitlines() == ["blockNumber,balance", "2,10", "3,11", "5,18"]
+    else:
+        pq = pytest.importorskip("pyarrow.parquet")
+        table = pq.read_table(tmp_path / "tok-balances:addr.parquet")
+        assert table.to_pydict() == {"blockNumber": [2, 3, 5], "balance": ["10", "11", "18"]}